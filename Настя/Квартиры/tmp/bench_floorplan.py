@@ -0,0 +1,594 @@
+#!/usr/bin/env python3
+"""
+bench_floorplan.py
+
+Benchmarks for parse_floorplan.py and extract_upper_scheme.py.
+
+Usage:
+    # synthetic plan with known ground truth, as PNG and vector PDF
+    python bench_floorplan.py synth --out /tmp/synth --size 3000x2000 --walls 6 --openings 8 --doors 4 --labels 12
+
+    # time every stage (and peak memory) on synthetic plans of several sizes
+    python bench_floorplan.py run --sizes 1000x700,2000x1400,4000x2800 [--repeat 3] [--memory] [--json bench.json]
+
+    # regression gate on the checked-in samples (7.1 2Д.png, page-6.pdf with raster and vector geometry);
+    # exit 1 on drift, a vector result other than the hand-checked EXPECTED one, or slowdown
+    python bench_floorplan.py gate [--baseline bench_baseline.json] [--slowdown 1.5] [--update-baseline]
+
+Notes:
+    - Stages are timed by wrapping the scripts' stage functions, so the pipelines run unmodified.
+    - OCR is skipped (and reported as such) when the tesseract binary is not installed or with --no-ocr.
+    - Memory: --memory records the tracemalloc peak per stage (NumPy/OpenCV output arrays, not
+      OpenCV-internal scratch buffers) and the process peak RSS at the end.
+    - Timings in the baseline are machine specific; regenerate with --update-baseline on the box that gates.
+"""
+import argparse
+import json
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE))
+warnings.filterwarnings("ignore", message=".*fitz.*deprecated")
+
+import parse_floorplan as pf  # noqa: E402
+import wall_graph  # noqa: E402
+import rooms  # noqa: E402
+import extract_upper_scheme as eus  # noqa: E402
+
+PARSE_STAGES = ["ocr_numbers", "image_preprocess_for_contours", "find_main_contours",
+                "detect_openings_from_small_contours", "save_json", "svg_from_json"]
+EXTRACT_STAGES = ["render_page", "find_top_region_and_crop", "preprocess_crop", "extract_contours_from_crop",
+                  "detect_door_arcs", "make_preview_images", "extract_scheme_vector"]
+SAMPLE_PNG = HERE / "7.1 2Д.png"
+SAMPLE_PDF = HERE / "page-6.pdf"
+DEFAULT_BASELINE = HERE / "bench_baseline.json"
+
+# page-6.pdf with --geometry vector, checked by hand against the drawing: 72 segments, all on the
+# thick wall bodies and hatched wall outlines; openings at the balcony door, the window below
+# 22.58, the entrance of 6.45, the entrance of the 3.16 corridor and the two passages of 22.58
+# (centres in page pixels); no door arcs (the doors are drawn with straight leaves). The gate
+# checks the vector run against these, not against a recorded baseline.
+EXPECTED = {
+    "extract_upper_scheme_vector": {
+        "geometry_source": "vector",
+        "walls": 72,
+        "door_arcs": 0,
+        "opening_centers": [[692.1, 419.9], [692.1, 929.4], [540.2, 747.7], [630.6, 674.6], [611.4, 704.4],
+                            [607.5, 879.5]],
+    },
+}
+POINT_TOL = 3.0  # px, opening centres in EXPECTED
+
+
+# ---------------------------------------------------------------- synthetic plans
+
+def synth_plan(width=2000, height=1400, walls=6, openings=8, doors=4, labels=10, seed=0):
+    """Generate a floorplan as drawing primitives plus its ground truth.
+
+    Coordinates are pixels. Returns (primitives, truth); render with render_png / render_pdf.
+    """
+    rng = random.Random(seed)
+    s = min(width, height)
+    t_out = max(6, s // 120)
+    t_in = max(3, t_out // 2)
+    m = s // 10
+
+    # outline: rectangle with one or two rectangular corner notches
+    mask = np.zeros((height, width), np.uint8)
+    mask[m:height - m, m:width - m] = 1
+    for corner in rng.sample([(0, 0), (1, 0), (0, 1), (1, 1)], rng.randint(1, 2)):
+        nw = int((width - 2 * m) * rng.uniform(0.15, 0.35))
+        nh = int((height - 2 * m) * rng.uniform(0.15, 0.35))
+        x0 = m if corner[0] == 0 else width - m - nw
+        y0 = m if corner[1] == 0 else height - m - nh
+        mask[y0:y0 + nh, x0:x0 + nw] = 0
+    cnts, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    outline = [[int(x), int(y)] for x, y in cnts[0].reshape(-1, 2)]
+
+    prims = [("fill", outline, (200, 185, 215)), ("polyline", outline, True, t_out, (0, 0, 0))]
+    truth = {"size": [width, height], "outline": outline, "wall_px": t_out,
+             "interior_walls": [], "openings": [], "doors": [], "labels": []}
+
+    # interior walls: full-height / full-width runs inside the outline
+    ys, xs = np.nonzero(mask)
+    for _ in range(walls):
+        if rng.random() < 0.5:
+            x = rng.randint(int(xs.min()) + 3 * t_out, int(xs.max()) - 3 * t_out)
+            col = np.nonzero(mask[:, x])[0]
+            seg = [[x, int(col.min())], [x, int(col.max())]]
+        else:
+            y = rng.randint(int(ys.min()) + 3 * t_out, int(ys.max()) - 3 * t_out)
+            row = np.nonzero(mask[y])[0]
+            seg = [[int(row.min()), y], [int(row.max()), y]]
+        prims.append(("line", seg[0], seg[1], t_in, (0, 0, 0)))
+        truth["interior_walls"].append(seg)
+
+    # windows on outer edges: wall gap + thin glyph
+    edges = [(i, outline[i], outline[(i + 1) % len(outline)]) for i in range(len(outline))]
+    for _ in range(openings):
+        i, a, b = rng.choice([e for e in edges if abs(e[2][0] - e[1][0]) + abs(e[2][1] - e[1][1]) > s // 4])
+        ww = int(s * rng.uniform(0.05, 0.1))
+        horizontal = a[1] == b[1]
+        lo, hi = sorted((a[0], b[0]) if horizontal else (a[1], b[1]))
+        c = rng.randint(lo + ww, hi - ww)
+        half = t_out // 2 + 3
+        if horizontal:
+            box = [c - ww // 2, a[1] - half, c + ww // 2, a[1] + half]
+            mid = ([box[0], a[1]], [box[2], a[1]])
+            center = [c, a[1]]
+        else:
+            box = [a[0] - half, c - ww // 2, a[0] + half, c + ww // 2]
+            mid = ([a[0], box[1]], [a[0], box[3]])
+            center = [a[0], c]
+        prims.append(("rect", box, (255, 255, 255), (0, 0, 0), 1))
+        prims.append(("line", mid[0], mid[1], 1, (0, 0, 0)))
+        truth["openings"].append({"edge": i, "center": center, "width_px": ww})
+
+    # doors on interior walls: gap, leaf and quarter-circle swing
+    for _ in range(min(doors, len(truth["interior_walls"]))):
+        (x0, y0), (x1, y1) = rng.choice(truth["interior_walls"])
+        r = int(s * rng.uniform(0.04, 0.07))
+        if x0 == x1:
+            py = rng.randint(min(y0, y1) + 2 * r, max(y0, y1) - 2 * r)
+            hinge = [x0, py]
+            prims.append(("line", [x0, py], [x0, py + r], t_in + 2, (255, 255, 255)))
+            prims.append(("line", hinge, [x0 + r, py], 2, (0, 0, 0)))
+            prims.append(("arc", hinge, r, 0, 90, 2, (0, 0, 0)))
+        else:
+            px = rng.randint(min(x0, x1) + 2 * r, max(x0, x1) - 2 * r)
+            hinge = [px, y0]
+            prims.append(("line", [px, y0], [px + r, y0], t_in + 2, (255, 255, 255)))
+            prims.append(("line", hinge, [px, y0 - r], 2, (0, 0, 0)))
+            prims.append(("arc", hinge, r, 270, 360, 2, (0, 0, 0)))
+        truth["doors"].append({"center": hinge, "radius_px": r})
+
+    # dimension labels inside the outline
+    font_h = max(10, s // 70)
+    for _ in range(labels):
+        text = str(rng.choice(range(500, 7000, 5)))
+        for _try in range(50):
+            x = rng.randint(m, width - m - 6 * font_h)
+            y = rng.randint(m + font_h, height - m)
+            if mask[y, x] and mask[y - font_h, x + 4 * font_h]:
+                break
+        prims.append(("text", [x, y], text, font_h, (60, 60, 60)))
+        truth["labels"].append({"text": text, "baseline_px": [x, y], "height_px": font_h})
+    return prims, truth
+
+
+def render_png(prims, size, path):
+    w, h = size
+    img = np.full((h, w, 3), 255, np.uint8)
+    for p in prims:
+        kind = p[0]
+        if kind == "fill":
+            cv2.fillPoly(img, [np.array(p[1], np.int32)], p[2][::-1])
+        elif kind == "polyline":
+            cv2.polylines(img, [np.array(p[1], np.int32)], p[2], p[4][::-1], p[3])
+        elif kind == "line":
+            cv2.line(img, tuple(p[1]), tuple(p[2]), p[4][::-1], p[3])
+        elif kind == "rect":
+            x0, y0, x1, y1 = p[1]
+            if p[2] is not None:
+                cv2.rectangle(img, (x0, y0), (x1, y1), p[2][::-1], -1)
+            cv2.rectangle(img, (x0, y0), (x1, y1), p[3][::-1], p[4])
+        elif kind == "arc":
+            _, c, r, a0, a1, t, col = p
+            cv2.ellipse(img, tuple(c), (r, r), 0, a0, a1, col[::-1], t)
+        elif kind == "text":
+            _, org, text, fh, col = p
+            scale = cv2.getFontScaleFromHeight(cv2.FONT_HERSHEY_SIMPLEX, fh, 1)
+            cv2.putText(img, text, tuple(org), cv2.FONT_HERSHEY_SIMPLEX, scale, col[::-1], 1, cv2.LINE_AA)
+    cv2.imwrite(str(path), img)
+    return path
+
+
+def render_pdf(prims, size, path, zoom=2.0):
+    """Vector PDF of the same plan; rendering it at `zoom` reproduces the pixel coordinates."""
+    import fitz
+    k = 1.0 / zoom
+    w, h = size
+    doc = fitz.open()
+    page = doc.new_page(width=w * k, height=h * k)
+    rgb = lambda c: tuple(v / 255 for v in c)
+    for p in prims:
+        kind = p[0]
+        shape = page.new_shape()
+        if kind in ("fill", "polyline"):
+            pts = [fitz.Point(x * k, y * k) for x, y in p[1]]
+            shape.draw_polyline(pts + [pts[0]])
+            if kind == "fill":
+                shape.finish(fill=rgb(p[2]), color=None, closePath=True)
+            else:
+                shape.finish(color=rgb(p[4]), width=p[3] * k, closePath=p[2])
+        elif kind == "line":
+            shape.draw_line(fitz.Point(p[1][0] * k, p[1][1] * k), fitz.Point(p[2][0] * k, p[2][1] * k))
+            shape.finish(color=rgb(p[4]), width=p[3] * k)
+        elif kind == "rect":
+            x0, y0, x1, y1 = p[1]
+            shape.draw_rect(fitz.Rect(x0 * k, y0 * k, x1 * k, y1 * k))
+            shape.finish(color=rgb(p[3]), fill=rgb(p[2]) if p[2] is not None else None, width=p[4] * k)
+        elif kind == "arc":
+            _, c, r, a0, a1, t, col = p
+            start = np.radians(a0)
+            start_pt = fitz.Point((c[0] + r * np.cos(start)) * k, (c[1] + r * np.sin(start)) * k)
+            # y points down on both canvases, so a negative beta sweeps the same way as cv2.ellipse
+            shape.draw_sector(fitz.Point(c[0] * k, c[1] * k), start_pt, -(a1 - a0), fullSector=False)
+            shape.finish(color=rgb(col), width=t * k)
+        elif kind == "text":
+            _, org, text, fh, col = p
+            page.insert_text(fitz.Point(org[0] * k, org[1] * k), text, fontsize=fh * k / 0.72, color=rgb(col))
+            continue
+        shape.commit()
+    doc.save(str(path))
+    return path
+
+
+def write_synth(out_dir, width, height, seed=0, pdf=True, **counts):
+    """Write synth_<w>x<h>_<seed>.png/.pdf/.truth.json into out_dir; return their paths."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    prims, truth = synth_plan(width, height, seed=seed, **counts)
+    stem = out_dir / f"synth_{width}x{height}_{seed}"
+    paths = {"png": render_png(prims, (width, height), stem.with_suffix(".png"))}
+    if pdf:
+        paths["pdf"] = render_pdf(prims, (width, height), stem.with_suffix(".pdf"))
+    paths["truth"] = stem.with_suffix(".truth.json")
+    paths["truth"].write_text(json.dumps(truth, indent=2), encoding="utf-8")
+    return paths
+
+
+# ---------------------------------------------------------------- stage timing
+
+class StageTimer:
+    """Accumulates wall time and (optionally) tracemalloc peak per wrapped function."""
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.stages = {}
+
+    def wrap(self, name, fn):
+        def timed(*args, **kwargs):
+            if self.memory:
+                tracemalloc.reset_peak()
+                base = tracemalloc.get_traced_memory()[0]
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                rec = self.stages.setdefault(name, {"calls": 0, "seconds": 0.0})
+                rec["calls"] += 1
+                rec["seconds"] += time.perf_counter() - t0
+                if self.memory:
+                    peak = (tracemalloc.get_traced_memory()[1] - base) / 2**20
+                    rec["peak_mb"] = round(max(rec.get("peak_mb", 0.0), peak), 2)
+        return timed
+
+
+def _instrumented(module, names, timer):
+    originals = {n: getattr(module, n) for n in names if hasattr(module, n)}
+    for n, fn in originals.items():
+        setattr(module, n, timer.wrap(n, fn))
+    return originals
+
+
+def _restore(module, originals):
+    for n, fn in originals.items():
+        setattr(module, n, fn)
+
+
+def have_tesseract():
+    return shutil.which("tesseract") is not None
+
+
+def run_parse(img_path, out_dir, ocr=True, memory=False, extras=()):
+    """parse_plan() with per-stage timings; returns (scene, timing dict)."""
+    timer = StageTimer(memory)
+    originals = _instrumented(pf, PARSE_STAGES, timer)
+    graph_originals = _instrumented(wall_graph, ["build_wall_graph"], timer)
+    room_originals = _instrumented(rooms, ["segment_rooms"], timer)
+    if not ocr:
+        pf.ocr_numbers = timer.wrap("ocr_numbers (skipped)", lambda img: [])
+    try:
+        t0 = time.perf_counter()
+        scene, _, _ = pf.parse_plan(img_path, out_dir, extras=extras)
+        total = time.perf_counter() - t0
+    finally:
+        _restore(pf, originals)
+        _restore(wall_graph, graph_originals)
+        _restore(rooms, room_originals)
+    return scene, {"total_s": round(total, 4), "stages": _rounded(timer.stages)}
+
+
+def run_extract(pdf_path, out_dir, memory=False, geometry="raster"):
+    """process_page() on page 0 with per-stage timings; returns (extraction json, timing dict)."""
+    import fitz
+    timer = StageTimer(memory)
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    originals = _instrumented(eus, EXTRACT_STAGES, timer)
+    try:
+        t0 = time.perf_counter()
+        with fitz.open(str(pdf_path)) as doc:
+            json_p, _, _ = eus.process_page(doc.load_page(0), Path(pdf_path), 0, Path(out_dir), geometry=geometry)
+        total = time.perf_counter() - t0
+    finally:
+        _restore(eus, originals)
+    return json.loads(Path(json_p).read_text(encoding="utf-8")), {"total_s": round(total, 4), "stages": _rounded(timer.stages)}
+
+
+def _rounded(stages):
+    return {k: dict(v, seconds=round(v["seconds"], 4)) for k, v in stages.items()}
+
+
+# ---------------------------------------------------------------- accuracy
+
+def polygon_iou(a, b, size):
+    w, h = size
+    ma = np.zeros((h, w), np.uint8)
+    mb = np.zeros((h, w), np.uint8)
+    if a:
+        cv2.fillPoly(ma, [np.array(a, np.int32)], 1)
+    if b:
+        cv2.fillPoly(mb, [np.array(b, np.int32)], 1)
+    union = np.count_nonzero(ma | mb)
+    return float(np.count_nonzero(ma & mb) / union) if union else 0.0
+
+
+def recall(truth_pts, found_pts, tol):
+    if not truth_pts:
+        return None
+    if not found_pts:
+        return 0.0
+    t = np.asarray(truth_pts, np.float64)
+    f = np.asarray(found_pts, np.float64)
+    d = np.sqrt(((t[:, None, :] - f[None, :, :]) ** 2).sum(-1))
+    return float((d.min(axis=1) <= tol).mean())
+
+
+def score_parse(scene, truth):
+    walls = scene.get("walls_px") or [{}]
+    poly = walls[0].get("polyline_px")
+    tol = 2 * truth["wall_px"]
+    return {
+        "outline_iou": round(polygon_iou(truth["outline"], poly, truth["size"]), 4),
+        "openings_recall": recall([o["center"] for o in truth["openings"]],
+                                  [o["center_px"] for o in scene.get("openings", [])], tol),
+        "openings_found": len(scene.get("openings", [])),
+    }
+
+
+def score_extract(result, truth):
+    tol = 2 * truth["wall_px"]
+    return {
+        "outline_iou": round(polygon_iou(truth["outline"], result["apartment_outline_page"], truth["size"]), 4),
+        "door_recall": recall([d["center"] for d in truth["doors"]],
+                              [d["center_page"] for d in result["door_arcs_page"]], tol),
+        "door_arcs_found": len(result["door_arcs_page"]),
+    }
+
+
+# ---------------------------------------------------------------- commands
+
+def _median_run(fn, repeat):
+    runs = [fn() for _ in range(repeat)]
+    best = sorted(runs, key=lambda r: r[1]["total_s"])[len(runs) // 2]
+    return best[0], dict(best[1], runs_s=[r[1]["total_s"] for r in runs])
+
+
+def cmd_synth(args):
+    w, h = _size(args.size)
+    paths = write_synth(args.out, w, h, seed=args.seed, pdf=not args.no_pdf, walls=args.walls,
+                        openings=args.openings, doors=args.doors, labels=args.labels)
+    for k, p in paths.items():
+        print(f"{k:5s} {p}")
+    return 0
+
+
+def cmd_run(args):
+    ocr = have_tesseract() and not args.no_ocr
+    if args.memory:
+        tracemalloc.start()
+    report = {"ocr": ocr, "cases": []}
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes.split(","):
+            w, h = _size(size)
+            paths = write_synth(Path(tmp) / "in", w, h, seed=args.seed, walls=args.walls, openings=args.openings,
+                                doors=args.doors, labels=args.labels)
+            truth = json.loads(paths["truth"].read_text(encoding="utf-8"))
+            scene, pt = _median_run(lambda: run_parse(paths["png"], Path(tmp) / "parse", ocr, args.memory), args.repeat)
+            result, et = _median_run(lambda: run_extract(paths["pdf"], Path(tmp) / "extract", args.memory), args.repeat)
+            case = {"size": [w, h],
+                    "parse_floorplan": dict(pt, accuracy=score_parse(scene, truth)),
+                    "extract_upper_scheme": dict(et, accuracy=score_extract(result, truth))}
+            report["cases"].append(case)
+            _print_case(f"{w}x{h}", case)
+    report["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    print(f"process peak RSS: {report['peak_rss_mb']} MB" + ("" if ocr else "  (OCR skipped)"))
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return 0
+
+
+def _extract_accuracy(result):
+    outline = result["apartment_outline_crop"] or []
+    return {
+        "geometry_source": result["geometry_source"],
+        "crop_bbox_page": result["crop_bbox_page"],
+        "outline_vertices": len(outline),
+        "outline_area_px": float(cv2.contourArea(np.array(outline, np.float32))) if outline else 0.0,
+        "openings": len(result["openings_page"]),
+        "door_arcs": len(result["door_arcs_page"]),
+        "walls": len(result.get("walls_page") or []),
+    }
+
+
+def sample_metrics(ocr, repeat=1):
+    """Accuracy fingerprints and timings of the checked-in samples.
+
+    page-6.pdf runs twice: raster geometry (the CLI default) and --geometry vector; the plan
+    image too, as parsed by default and with every optional scene part (parse_floorplan.EXTRAS).
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        scene, pt = _median_run(lambda: run_parse(SAMPLE_PNG, Path(tmp) / "parse", ocr), repeat)
+        full, ft = _median_run(lambda: run_parse(SAMPLE_PNG, Path(tmp) / "extras", ocr, extras=pf.EXTRAS), repeat)
+        result, et = _median_run(lambda: run_extract(SAMPLE_PDF, Path(tmp) / "extract"), repeat)
+        vector, vt = _median_run(lambda: run_extract(SAMPLE_PDF, Path(tmp) / "vector", geometry="vector"), repeat)
+    poly = (scene.get("walls_px") or [{}])[0].get("polyline_px") or []
+    return {
+        "parse_floorplan": {
+            "total_s": pt["total_s"],
+            "accuracy": {
+                "outline_vertices": len(poly),
+                "outline_area_px": float(cv2.contourArea(np.array(poly, np.int32))) if poly else 0.0,
+                "openings": len(scene.get("openings", [])),
+            },
+        },
+        "parse_floorplan_extras": {
+            "total_s": ft["total_s"],
+            "accuracy": {
+                "wall_graph_edges": len((full.get("wall_graph") or {}).get("edges", [])),
+                "rooms": len(full.get("rooms") or []),
+            },
+        },
+        "extract_upper_scheme": {"total_s": et["total_s"], "accuracy": _extract_accuracy(result)},
+        "extract_upper_scheme_vector": {
+            "total_s": vt["total_s"],
+            "accuracy": dict(_extract_accuracy(vector),
+                             opening_centers=[op["center_page"] for op in vector["openings_page"]]),
+        },
+    }
+
+
+GATED = ("parse_floorplan", "parse_floorplan_extras", "extract_upper_scheme", "extract_upper_scheme_vector")
+
+
+def _same_points(want, got, tol=POINT_TOL):
+    """Whether two point lists match one to one (any order) within tol."""
+    left = [list(p) for p in got or []]
+    if len(left) != len(want):
+        return False
+    for w in want:
+        near = [i for i, g in enumerate(left) if abs(g[0] - w[0]) <= tol and abs(g[1] - w[1]) <= tol]
+        if not near:
+            return False
+        left.pop(near[0])
+    return True
+
+
+def _drift(name, base, cur, rel_tol):
+    """Accuracy differences beyond tolerance: numbers relative, point lists within POINT_TOL, the rest exact."""
+    problems = []
+    for key, want in base.items():
+        got = cur.get(key)
+        if key.endswith("_centers"):
+            if not _same_points(want, got):
+                problems.append(f"{name}.{key}: {got} vs {want}")
+        elif isinstance(want, float):
+            if abs(got - want) > rel_tol * max(abs(want), 1.0):
+                problems.append(f"{name}.{key}: {got} vs baseline {want}")
+        elif got != want:
+            problems.append(f"{name}.{key}: {got} vs baseline {want}")
+    return problems
+
+
+def cmd_gate(args):
+    ocr = have_tesseract() and not args.no_ocr
+    current = sample_metrics(ocr, repeat=args.repeat)
+    current["ocr"] = ocr
+    baseline_path = Path(args.baseline)
+    if args.update_baseline or not baseline_path.exists():
+        for script in EXPECTED:
+            # hand-checked: never recorded from a run
+            current[script].pop("accuracy")
+        baseline_path.write_text(json.dumps(current, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        print("Baseline written:", baseline_path)
+        return 0
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    problems = []
+    if baseline.get("ocr") != ocr:
+        print(f"note: baseline OCR={baseline.get('ocr')}, current OCR={ocr}; parse accuracy may differ")
+    for script in GATED:
+        if script not in baseline:
+            problems.append(f"{script}: not in {baseline_path} (record it with --update-baseline)")
+            continue
+        b, c = baseline[script], current[script]
+        problems += _drift(script, EXPECTED.get(script) or b["accuracy"], c["accuracy"], args.accuracy_tol)
+        limit = b["total_s"] * args.slowdown
+        status = "ok" if c["total_s"] <= limit else "SLOW"
+        print(f"{script:27s} {c['total_s']:.3f}s (baseline {b['total_s']:.3f}s, limit {limit:.3f}s) {status}")
+        if status != "ok":
+            problems.append(f"{script}: {c['total_s']:.3f}s exceeds {args.slowdown}x baseline")
+    for p in problems:
+        print("FAIL", p)
+    print("gate:", "FAILED" if problems else "passed")
+    return 1 if problems else 0
+
+
+def _size(text):
+    w, h = text.lower().split("x")
+    return int(w), int(h)
+
+
+def _print_case(label, case):
+    print(f"== {label}")
+    for script in ("parse_floorplan", "extract_upper_scheme"):
+        c = case[script]
+        print(f"  {script}: {c['total_s']:.3f}s  accuracy={c['accuracy']}")
+        for stage, rec in sorted(c["stages"].items(), key=lambda kv: -kv[1]["seconds"]):
+            mem = f"  peak {rec['peak_mb']} MB" if "peak_mb" in rec else ""
+            print(f"    {stage:40s} {rec['seconds']:8.4f}s x{rec['calls']}{mem}")
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.split("\n\n")[1].strip())
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    def plan_args(sp):
+        sp.add_argument("--walls", type=int, default=6, help="interior wall count")
+        sp.add_argument("--openings", type=int, default=8, help="windows on the outer walls")
+        sp.add_argument("--doors", type=int, default=4, help="door swings on interior walls")
+        sp.add_argument("--labels", type=int, default=12, help="dimension labels")
+        sp.add_argument("--seed", type=int, default=0)
+
+    sp = sub.add_parser("synth", help="write one synthetic plan (PNG, PDF, ground truth)")
+    sp.add_argument("--out", required=True)
+    sp.add_argument("--size", default="2000x1400", help="WxH in pixels")
+    sp.add_argument("--no-pdf", action="store_true")
+    plan_args(sp)
+    sp.set_defaults(fn=cmd_synth)
+
+    sp = sub.add_parser("run", help="time both pipelines on synthetic plans")
+    sp.add_argument("--sizes", default="1000x700,2000x1400,4000x2800")
+    sp.add_argument("--repeat", type=int, default=3, help="runs per case; the median is reported")
+    sp.add_argument("--memory", action="store_true", help="record tracemalloc peak per stage (slower)")
+    sp.add_argument("--no-ocr", action="store_true")
+    sp.add_argument("--json", default=None, help="also write the report here")
+    plan_args(sp)
+    sp.set_defaults(fn=cmd_run)
+
+    sp = sub.add_parser("gate", help="accuracy/perf regression gate on the checked-in samples")
+    sp.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    sp.add_argument("--slowdown", type=float, default=1.5, help="fail if slower than this factor x baseline")
+    sp.add_argument("--accuracy-tol", type=float, default=0.01, help="relative tolerance for areas")
+    sp.add_argument("--repeat", type=int, default=5)
+    sp.add_argument("--no-ocr", action="store_true")
+    sp.add_argument("--update-baseline", action="store_true")
+    sp.set_defaults(fn=cmd_gate)
+
+    args = p.parse_args(argv)
+    return args.fn(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
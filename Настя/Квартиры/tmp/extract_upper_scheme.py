@@ -4,21 +4,73 @@ extract_upper_scheme.py
 
 Extract the upper (white-background) floorplan from a PDF page and produce:
  - a cropped PNG of the upper scheme
- - a preview PNG showing crop + polygon + detected openings/door arcs over the page
+ - a preview image showing crop + polygon + detected openings/door arcs over the page
+   (PNG at render size by default; --preview-format webp/jpeg and --preview-width for small previews)
  - a JSON describing polygon (crop coords and page coords), openings, door arcs
 
 Usage:
     python extract_upper_scheme.py /path/to/page-6.pdf /path/to/outdir
+    python extract_upper_scheme.py /path/to/brochure.pdf /path/to/outdir --pages all [--workers 8]
+    python extract_upper_scheme.py /path/to/brochure.pdf /path/to/outdir --pages 3-10,15
+
+    Multi-page runs render and analyse pages in parallel worker processes (each worker opens
+    the PDF once) and write <stem>_p<NNN>_* outputs as pages finish, plus <stem>_pages_manifest.json.
+    The number of workers and their OpenCV threads come from thread_plan.py (one single-threaded
+    worker per core for long runs, more threads per worker for a few pages); the plan is printed
+    and stored in the manifest.
+
+    --profile adds per-stage wall/CPU time and peak RSS to the JSON "meta" (multi-page: a per-stage
+    histogram in the manifest); --cprofile also writes <stem>_[p<NNN>_]profile.prof.
+
+    --geometry auto reads outline, walls, openings and door arcs straight from the page's
+    vector drawing when it has one (exact coordinates, no thresholding; adds
+    walls_crop/walls_page) and falls back to the raster pipeline for scanned pages; --geometry
+    vector has no fallback. Both are opt-in: the raster pipeline stays the default until the
+    vector heuristics are validated on more real plans. --no-previews skips rendering for
+    vector pages.
+
+    --clip-dpi 300 finds the scheme on a cheap low-zoom render and re-renders only its box at
+    300 DPI (PyMuPDF clip) for the raster pipeline: finer geometry, and the full page is never
+    rendered at high resolution (previews use a page render at --preview-width). *_page
+    coordinates keep the zoom-2 page frame; "clip" in the JSON maps them to the crop pixels.
+    --clip-dpi 144 (zoom 2) gives exactly the default result. Above it the thresholds scale
+    with the resolution, but finer detail still binarises differently; on page-6.pdf at
+    200 / 300 / 400 DPI: the same crop box, outline area +1.2% / -2.3% / -2.7%, and 3 of 4
+    openings (the "1.88" area label, which the zoom-2 pass takes for an opening, is not one).
+
+    --format npz / jsonl write compact outputs (plan_format.py) with page coordinates only (crop
+    coordinates are page coordinates minus crop_bbox_page[:2]); multi-page jsonl runs stream one
+    line per page into <stem>_pages.jsonl as pages finish.
+
+    --max-memory-mb 200 is a low-memory raster mode for large sheets and many workers per box:
+    the page render is the only full-size RGB copy, the non-white mask is thresholded in row
+    bands sized to the budget and the preview is downscaled to fit; geometry is unchanged.
+
+    --watch treats the first argument as a folder of PDFs (--glob, default *.pdf) and keeps
+    processing it as PDFs are added or changed: <out_dir>/watch_manifest.json tracks every PDF
+    (mtime, size, SHA-256, parameter hash, outputs), so only new / changed ones are processed
+    (one pool task per PDF, its --pages in turn, outputs in <out_dir>/<relative path without
+    .pdf>/), the outputs of deleted PDFs are removed and a restart resumes from the manifest
+    (watch_inputs.py). --once makes one such pass and exits.
+
+        python extract_upper_scheme.py /shared/brochures/ /path/to/outdir --watch [--pages all]
 
 Dependencies:
     pip install pymupdf pillow opencv-python numpy
 
 Notes:
     - The script chooses the top-most large non-white region on the page as the "upper scheme".
-    - Coordinates in JSON are pixels (page-level and crop-level). Verify results visually.
+    - Coordinates in JSON are pixels (page-level and crop-level) at the render zoom, also for
+      vector geometry (fractional there). "geometry_source" says which pipeline produced them.
+      Verify results visually.
 
 """
+import argparse
+import contextlib
+import functools
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 import json
 import math
@@ -37,20 +89,49 @@ try:
 except Exception as e:
     raise SystemExit("OpenCV is required: pip install opencv-python")
 
+from stage_cache import StageCache, cached, file_digest, pack_contours
+from stage_profile import StageProfiler, cprofile_to, format_summary, profiled, summarize
+from vector_scheme import VECTOR_DEFAULTS, extract_scheme_vector
+from plan_format import FORMATS, dumps_line, write_plan
+from plan_image import PlanImage, pixmap_array
+from thread_plan import apply_thread_plan, format_plan, plan_threads, usable_cores
+from watch_inputs import WATCH_DEFAULTS, watch
 
-def find_top_region_and_crop(img_pil, white_thresh=245, min_area=200, pad=20, debug=False):
-    """Return crop box (x0,y0,x1,y1) in page pixels for the top-most non-white region."""
-    img_rgb = img_pil.convert("RGB")
-    np_img = np.array(img_rgb)
-    # luminosity
-    brightness = (0.299 * np_img[:, :, 0] + 0.587 * np_img[:, :, 1] + 0.114 * np_img[:, :, 2])
-    nonwhite_mask = (brightness < white_thresh).astype(np.uint8) * 255
 
+# luminance is computed this many rows at a time, so its float64 temporaries stay small
+NONWHITE_BAND_ROWS = 256
+
+
+def nonwhite_mask(np_img, white_thresh=245, band_rows=NONWHITE_BAND_ROWS):
+    """uint8 mask (255 = non-white) of an RGB array, thresholding luminosity band_rows rows at a time."""
+    mask = np.empty(np_img.shape[:2], dtype=np.uint8)
+    for y in range(0, mask.shape[0], band_rows):
+        band = np_img[y:y + band_rows]
+        brightness = (0.299 * band[:, :, 0] + 0.587 * band[:, :, 1] + 0.114 * band[:, :, 2])
+        np.multiply(brightness < white_thresh, 255, out=mask[y:y + band_rows], casting="unsafe")
+    return mask
+
+
+def nonwhite_components(np_img, white_thresh=245, band_rows=NONWHITE_BAND_ROWS):
+    """Connected components (num_labels, stats, centroids) of the cleaned non-white mask of an RGB array."""
+    mask = nonwhite_mask(np_img, white_thresh, band_rows)
     kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5))
-    mask_clean = cv2.morphologyEx(nonwhite_mask, cv2.MORPH_CLOSE, kernel, iterations=2)
-    mask_clean = cv2.morphologyEx(mask_clean, cv2.MORPH_OPEN, kernel, iterations=1)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=2)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=1)
 
-    num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(mask_clean, connectivity=8)
+    # the int32 label image is the largest temporary; only the statistics are kept
+    num_labels, _, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    return num_labels, stats, centroids
+
+
+def find_top_region_and_crop(img, white_thresh=245, min_area=200, pad=20, debug=False, band_rows=NONWHITE_BAND_ROWS):
+    """Return crop box (x0,y0,x1,y1) in page pixels for the top-most non-white region.
+
+    img: PlanImage, RGB uint8 array (both used as is, no copy) or PIL image.
+    """
+    np_img = PlanImage.wrap(img).rgb()
+    height, width = np_img.shape[:2]
+    num_labels, stats, centroids = nonwhite_components(np_img, white_thresh, band_rows)
     candidates = []
     for i in range(1, num_labels):
         x, y, ww, hh, area = stats[i]
@@ -68,29 +149,112 @@ def find_top_region_and_crop(img_pil, white_thresh=245, min_area=200, pad=20, de
     x, y, ww, hh = top["bbox"]
     x0 = max(0, x - pad)
     y0 = max(0, y - pad)
-    x1 = min(img_rgb.size[0], x + ww + pad)
-    y1 = min(img_rgb.size[1], y + hh + pad)
+    x1 = min(width, x + ww + pad)
+    y1 = min(height, y + hh + pad)
     if debug:
         print(f"Top candidate bbox: {top['bbox']}, crop=({x0},{y0},{x1},{y1})")
     return (x0, y0, x1, y1)
 
 
-def extract_contours_from_crop(crop_pil, min_component_area=100, approx_epsilon_factor=0.01):
-    """Return main polygon (approx) and list of other contours (with bbox + area + center) in crop-local coords."""
-    np_crop = np.array(crop_pil.convert("RGB"))
-    gray = cv2.cvtColor(np_crop, cv2.COLOR_RGB2GRAY)
-    blur = cv2.GaussianBlur(gray, (5, 5), 0)
-    th = cv2.adaptiveThreshold(blur, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 21, 9)
-    kernel2 = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
-    morph = cv2.morphologyEx(th, cv2.MORPH_CLOSE, kernel2, iterations=2)
+def find_top_region_pyramid(img, scale=0.25, white_thresh=245, min_area=200, pad=20):
+    """find_top_region_and_crop located on a downscaled page and refined at full resolution.
+
+    The coarse box is searched on a 1/round(1/scale) reduction; the exact extent is then
+    the union of full-resolution components overlapping it, computed only inside a window
+    a few coarse pixels larger than the coarse box.
+    img: PlanImage, RGB array or PIL image; the reduction goes through its PIL view.
+    """
+    image = PlanImage.wrap(img)
+    f = max(1, int(round(1 / scale)))
+    small = image.pil().reduce(f)
+    cx0, cy0, cx1, cy1 = find_top_region_and_crop(small, white_thresh=white_thresh,
+                                                  min_area=max(1, min_area // (f * f)), pad=0)
+    W, H = image.size
+    wx0, wy0, wx1, wy1 = refine_window((cx0 * f, cy0 * f, cx1 * f, cy1 * f), 4 * f, (W, H))
+    box = refine_top_region(image.crop((wx0, wy0, wx1, wy1)).rgb(), (wx0, wy0), (cx0 * f, cy0 * f, cx1 * f, cy1 * f),
+                            (W, H), white_thresh=white_thresh, min_area=min_area, pad=pad)
+    if box is None:
+        return find_top_region_and_crop(image, white_thresh=white_thresh, min_area=min_area, pad=pad)
+    return box
+
+
+def refine_window(coarse_box, margin, size):
+    """The coarse box (full-resolution pixels) grown by margin on every side, clipped to size (W, H)."""
+    x0, y0, x1, y1 = coarse_box
+    W, H = size
+    return (max(0, int(math.floor(x0 - margin))), max(0, int(math.floor(y0 - margin))),
+            min(W, int(math.ceil(x1 + margin))), min(H, int(math.ceil(y1 + margin))))
+
+
+def refine_top_region(window, origin, coarse_box, size, white_thresh=245, min_area=200, pad=20):
+    """Exact crop box of a coarse top-region box from a full-resolution RGB window around it.
+
+    The box is the union of the window's components overlapping coarse_box, plus pad, clipped
+    to the page size (W, H); origin is the window's top-left page pixel. None if nothing overlaps.
+    """
+    wx0, wy0 = origin
+    W, H = size
+    num_labels, stats, _ = nonwhite_components(window, white_thresh)
+    # components (window coords) overlapping the coarse box
+    bx0, by0, bx1, by1 = coarse_box[0] - wx0, coarse_box[1] - wy0, coarse_box[2] - wx0, coarse_box[3] - wy0
+    x, y, ww, hh, area = (stats[1:, i] for i in range(5))
+    hit = (area >= min_area) & (x < bx1) & (x + ww > bx0) & (y < by1) & (y + hh > by0)
+    if not hit.any():
+        return None
+    x0 = max(0, int(x[hit].min()) + wx0 - pad)
+    y0 = max(0, int(y[hit].min()) + wy0 - pad)
+    x1 = min(W, int((x + ww)[hit].max()) + wx0 + pad)
+    y1 = min(H, int((y + hh)[hit].max()) + wy0 + pad)
+    return (x0, y0, x1, y1)
+
 
-    nb, labs, stats, cents = cv2.connectedComponentsWithStats(morph, connectivity=8)
-    clean = np.zeros_like(morph)
-    for i in range(1, nb):
-        if stats[i, cv2.CC_STAT_AREA] >= min_component_area:
-            clean[labs == i] = 255
+PREPROCESS_CROP_DEFAULTS = {"blur_ksize": 5, "block_size": 21, "thresh_c": 9, "close_iterations": 2,
+                            "min_component_area": 100}
 
-    contours, _ = cv2.findContours(clean, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+def binarize_crop(blur, block_size=21, thresh_c=9, close_iterations=2, open_px=0):
+    """Adaptive threshold + close of the blurred gray crop; open_px > 1 then drops strokes thinner than that."""
+    th = cv2.adaptiveThreshold(blur, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, block_size, thresh_c)
+    kernel2 = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+    binary = cv2.morphologyEx(th, cv2.MORPH_CLOSE, kernel2, iterations=close_iterations)
+    if open_px > 1:
+        binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, np.ones((open_px, open_px), np.uint8))
+    return binary
+
+
+def crop_components(binary, min_component_area=100):
+    """preprocess_crop() result dict for an already binarised crop."""
+    nb, labs, stats, cents = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    # keep/drop decision per label, applied to the whole label image in a single lookup
+    lut = np.where(stats[:, cv2.CC_STAT_AREA] >= min_component_area, 255, 0).astype(np.uint8)
+    lut[0] = 0
+    clean = lut[labs]
+    return {"binary": binary, "labels": labs, "stats": stats, "clean": clean}
+
+
+def preprocess_crop(crop, min_component_area=100, blur_ksize=5, block_size=21, thresh_c=9, close_iterations=2,
+                    open_px=0):
+    """Binarise the scheme crop (PlanImage, RGB array or PIL image) once for all downstream stages.
+
+    Returns a dict with:
+      binary - thresholded + closed mask (source of the raw contours for door arcs)
+      labels, stats - connected components of binary
+      clean - binary without components smaller than min_component_area
+    """
+    gray = PlanImage.wrap(crop).gray()
+    blur = cv2.GaussianBlur(gray, (blur_ksize, blur_ksize), 0)
+    return crop_components(binarize_crop(blur, block_size, thresh_c, close_iterations, open_px), min_component_area)
+
+
+def extract_contours_from_crop(crop, min_component_area=100, approx_epsilon_factor=0.01, pre=None, scale=1.0):
+    """Return main polygon (approx) and list of other contours (with bbox + area + center) in crop-local coords.
+
+    pre: output of preprocess_crop() to reuse; computed here if omitted.
+    scale: crop pixels per zoom-2 page pixel; the size thresholds are tuned for scale 1.
+    """
+    if pre is None:
+        pre = preprocess_crop(crop, min_component_area=min_component_area)
+    contours, _ = cv2.findContours(pre["clean"], cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     if not contours:
         return None, []
 
@@ -104,13 +268,14 @@ def extract_contours_from_crop(crop_pil, min_component_area=100, approx_epsilon_
     mx, my, mw, mh = cv2.boundingRect(main_cnt)
     for cnt in contours_sorted[1:]:
         area = int(cv2.contourArea(cnt))
-        if area < 50:
+        if area < 50 * scale * scale:
             continue
         bx, by, bw, bh = cv2.boundingRect(cnt)
         cx = bx + bw / 2
         cy = by + bh / 2
-        touch_edge = (bx <= mx + 5) or (by <= my + 5) or (bx + bw >= mx + mw - 5) or (by + bh >= my + mh - 5)
-        if touch_edge or area < 2000:
+        tol = 5 * scale
+        touch_edge = (bx <= mx + tol) or (by <= my + tol) or (bx + bw >= mx + mw - tol) or (by + bh >= my + mh - tol)
+        if touch_edge or area < 2000 * scale * scale:
             others.append({
                 "bbox": [int(bx), int(by), int(bw), int(bh)],
                 "area": int(area),
@@ -119,111 +284,374 @@ def extract_contours_from_crop(crop_pil, min_component_area=100, approx_epsilon_
     return main_poly, others
 
 
-def detect_door_arcs(crop_pil, contours, area_min=300, area_max=8000, std_ratio_thresh=0.35, coverage_min_deg=20, coverage_max_deg=260):
-    """Analyze contours and return those that look like arcs (door swings)."""
-    np_crop = np.array(crop_pil.convert("RGB"))
-    gray = cv2.cvtColor(np_crop, cv2.COLOR_RGB2GRAY)
+def detect_door_arcs(contours, area_min=300, area_max=8000, std_ratio_thresh=0.35, coverage_min_deg=20, coverage_max_deg=260):
+    """Analyze contours and return those that look like arcs (door swings).
+
+    All contours are handled as one concatenated point array with per-contour offsets
+    (pack_contours): areas, radial mean/std and angular coverage are segment reductions
+    (reduceat), so thousands of hatching/furniture contours cost a few array passes.
+    Only contours inside the area range get a minEnclosingCircle call.
+    """
+    if len(contours) == 0:
+        return []
+    points, offsets = pack_contours(contours)
+    starts, lengths = offsets[:-1], np.diff(offsets)
+
+    # shoelace area per contour; integer products are exact, as in cv2.contourArea
+    x = points[:, 0].astype(np.int64)
+    y = points[:, 1].astype(np.int64)
+    nxt = np.arange(len(points)) + 1
+    nxt[offsets[1:] - 1] = starts
+    area = np.abs(np.add.reduceat(x * y[nxt] - x[nxt] * y, starts)) // 2
+    cand = np.nonzero((area >= area_min) & (area <= area_max))[0]
+    if len(cand) == 0:
+        return []
+
+    # points of the candidates, re-packed with their own offsets
+    n = lengths[cand]
+    cstarts = np.zeros(len(cand), dtype=np.int64)
+    np.cumsum(n[:-1], out=cstarts[1:])
+    idx = np.arange(n.sum()) + np.repeat(starts[cand] - cstarts, n)
+    pts = points[idx]
+    centers = np.array([cv2.minEnclosingCircle(points[offsets[i]:offsets[i + 1]])[0] for i in cand])
+    dx = pts[:, 0] - np.repeat(centers[:, 0], n)
+    dy = pts[:, 1] - np.repeat(centers[:, 1], n)
+    dists = np.sqrt(dx ** 2 + dy ** 2)
+    mean_dist = np.add.reduceat(dists, cstarts) / n
+    dev = dists - np.repeat(mean_dist, n)
+    std_dist = np.sqrt(np.add.reduceat(dev * dev, cstarts) / n)
+
+    # coverage = span of the sorted angles, unwrapped: np.unwrap shifts the one gap > pi by -2pi
+    seg = np.repeat(np.arange(len(cand)), n)
+    angs = np.arctan2(dy, dx)
+    angs = angs[np.lexsort((angs, seg))]
+    gaps = np.diff(angs, prepend=angs[:1])
+    gaps[cstarts] = 0
+    max_gap = np.maximum.reduceat(gaps, cstarts)
+    wrapped = np.mod(max_gap + np.pi, 2 * np.pi) - np.pi
+    wrapped[(wrapped == -np.pi) & (max_gap > 0)] = np.pi
+    correction = np.where(max_gap < np.pi, 0.0, wrapped - max_gap)
+    coverage = (angs[cstarts + n - 1] + correction) - angs[cstarts]
+
+    ratio = np.divide(std_dist, mean_dist, out=np.full_like(std_dist, np.inf), where=mean_dist > 3)
     out_arcs = []
-    for cnt in contours:
-        area = int(cv2.contourArea(cnt))
-        if area < area_min or area > area_max:
-            continue
-        pts = cnt.reshape(-1, 2)
-        (cx_c, cy_c), r = cv2.minEnclosingCircle(pts)
-        dists = np.sqrt(((pts[:, 0] - cx_c) ** 2 + (pts[:, 1] - cy_c) ** 2))
-        mean_dist = float(dists.mean())
-        std_dist = float(dists.std())
-        if mean_dist <= 3 or std_dist / mean_dist >= std_ratio_thresh:
-            continue
-        angs = np.arctan2(pts[:, 1] - cy_c, pts[:, 0] - cx_c)
-        angs_un = np.unwrap(np.sort(angs))
-        coverage = float(angs_un[-1] - angs_un[0])
-        coverage_deg = math.degrees(coverage)
+    for k in np.nonzero(ratio < std_ratio_thresh)[0]:
+        coverage_deg = math.degrees(coverage[k])
         if coverage_deg > coverage_min_deg and coverage_deg < coverage_max_deg:
             out_arcs.append({
-                "center_px": [float(round(cx_c, 1)), float(round(cy_c, 1))],
-                "radius_px": float(round(mean_dist, 1)),
+                "center_px": [float(round(centers[k, 0], 1)), float(round(centers[k, 1], 1))],
+                "radius_px": float(round(mean_dist[k], 1)),
                 "coverage_deg": float(round(coverage_deg, 1)),
             })
     return out_arcs
 
 
-def make_preview_images(page_img, crop_box, main_poly_page, openings_page, door_arcs_page, out_dir: Path):
-    """Save crop image and a page preview with overlays."""
+# preview format -> (PIL format, file suffix)
+PREVIEW_FORMATS = {"png": ("PNG", ".png"), "webp": ("WEBP", ".webp"), "jpeg": ("JPEG", ".jpg")}
+# max_width: cap of the page preview width in px (None = render size); quality: webp/jpeg only
+PREVIEW_DEFAULTS = {"format": "png", "max_width": None, "quality": 80}
+
+
+def make_preview_images(page_img, crop_box, main_poly_page, openings_page, door_arcs_page, out_dir: Path, prefix="",
+                        walls_page=None, preview=None, page_scale=1.0, crop_img=None):
+    """Save crop image and a page preview with overlays.
+
+    preview: overrides for PREVIEW_DEFAULTS. A capped preview downscales the page first and
+    draws the overlays at that size; the crop stays a full-resolution PNG.
+    page_scale: page_img pixels per page pixel of the coordinates (a page rendered at another zoom).
+    crop_img: the crop to save (e.g. a clip render) instead of cutting crop_box out of page_img.
+    """
+    opts = dict(PREVIEW_DEFAULTS, **(preview or {}))
+    pil_format, suffix = PREVIEW_FORMATS[opts["format"]]
     x0, y0, x1, y1 = crop_box
-    crop = page_img.crop((x0, y0, x1, y1))
-    crop_p = out_dir / "upper_scheme_crop.png"
+    crop = crop_img if crop_img is not None else page_img.crop((x0, y0, x1, y1))
+    crop_p = out_dir / f"{prefix}upper_scheme_crop.png"
     crop.save(crop_p)
 
     # preview on full page
-    vis = page_img.convert("RGB")
+    s = min(1.0, opts["max_width"] / page_img.width) if opts["max_width"] else 1.0
+    if s < 1:
+        size = (max(1, round(page_img.width * s)), max(1, round(page_img.height * s)))
+        # box filter: area averaging, the cheapest PIL filter that doesn't alias thin lines
+        vis = page_img.convert("RGB").resize(size, Image.BOX)
+    else:
+        vis = page_img.convert("RGB")
+    s *= page_scale
+    px = lambda *v: [c * s for c in v]
+    width = lambda w: max(1, round(w * s))
     draw = ImageDraw.Draw(vis)
-    draw.rectangle([x0, y0, x1, y1], outline="lime", width=3)
+    draw.rectangle(px(x0, y0, x1, y1), outline="lime", width=width(3))
+    for wx0, wy0, wx1, wy1 in walls_page or []:
+        draw.line(px(wx0, wy0, wx1, wy1), fill="magenta", width=1)
     if main_poly_page:
-        pts = [tuple(p) for p in main_poly_page]
-        draw.line(pts + [pts[0]], fill="red", width=4)
+        pts = [tuple(px(*p)) for p in main_poly_page]
+        draw.line(pts + [pts[0]], fill="red", width=width(4))
     for op in openings_page:
         bx, by, bw, bh = op["bbox_page"]
-        draw.rectangle([bx, by, bx + bw, by + bh], outline="blue", width=2)
+        draw.rectangle(px(bx, by, bx + bw, by + bh), outline="blue", width=width(2))
     for da in door_arcs_page:
         cx, cy = da["center_page"]
         r = da["radius_px"]
-        draw.ellipse([cx - r, cy - r, cx + r, cy + r], outline="orange", width=2)
-    preview_p = out_dir / "page_upper_scheme_preview.png"
-    vis.save(preview_p)
+        draw.ellipse(px(cx - r, cy - r, cx + r, cy + r), outline="orange", width=width(2))
+    preview_p = out_dir / f"{prefix}page_upper_scheme_preview{suffix}"
+    save_opts = {"PNG": {}, "JPEG": {"quality": opts["quality"]},
+                 # method 2 of 0-6: about half the encode time of the default 4 for a few % more bytes
+                 "WEBP": {"quality": opts["quality"], "method": 2}}[pil_format]
+    vis.save(preview_p, pil_format, **save_opts)
     return crop_p, preview_p
 
 
-def main(argv):
-    if len(argv) < 3:
-        print("Usage: python extract_upper_scheme.py /path/to/page.pdf /output/dir")
-        return 2
-    pdf_path = Path(argv[1])
-    out_dir = Path(argv[2])
-    out_dir.mkdir(parents=True, exist_ok=True)
-
-    # Render first page (index 0)
-    doc = fitz.open(str(pdf_path))
-    page = doc.load_page(0)
-    zoom = 2.0
+def render_page(page, zoom=2.0):
+    """Rasterise a PDF page to an RGB uint8 array (a view of the pixmap's samples, not a copy)."""
     mat = fitz.Matrix(zoom, zoom)
-    pix = page.get_pixmap(matrix=mat, alpha=False)
-    page_img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-
-    # find crop for top-most scheme
-    crop_box = find_top_region_and_crop(page_img)
-    x0, y0, x1, y1 = crop_box
-    crop = page_img.crop(crop_box)
-
-    # extract contours and openings in crop-local coords
-    main_poly_crop, openings_crop = extract_contours_from_crop(crop)
-    # get full contours list for arc detection
-    # re-run contours on cleaned binary to get raw contours
-    np_crop = np.array(crop.convert("RGB"))
-    gray = cv2.cvtColor(np_crop, cv2.COLOR_RGB2GRAY)
-    blur = cv2.GaussianBlur(gray, (5, 5), 0)
-    th = cv2.adaptiveThreshold(blur, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 21, 9)
-    kernel2 = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
-    morph = cv2.morphologyEx(th, cv2.MORPH_CLOSE, kernel2, iterations=2)
-    contours, _ = cv2.findContours(morph, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-    door_arcs_crop = detect_door_arcs(crop, contours)
-
-    # convert crop-local coords to page coords
-    main_poly_page = [[int(px + x0), int(py + y0)] for px, py in (main_poly_crop or [])]
-    openings_page = []
-    for op in openings_crop:
-        bx, by, bw, bh = op["bbox"]
-        openings_page.append({"bbox_page": [int(bx + x0), int(by + y0), int(bw), int(bh)], "center_page": [int(op["center"][0] + x0), int(op["center"][1] + y0)], "area": int(op["area"])})
-    door_arcs_page = []
-    for da in door_arcs_crop:
-        cx, cy = da["center_px"]
-        door_arcs_page.append({"center_page": [float(round(cx + x0, 1)), float(round(cy + y0, 1))], "radius_px": float(da["radius_px"]), "coverage_deg": float(da["coverage_deg"])})
+    return pixmap_array(page.get_pixmap(matrix=mat, alpha=False))
+
+
+# clip mode: the scheme is located on a render at zoom * CLIP_LOCATE_SCALE (or zoom * pyramid)
+CLIP_LOCATE_SCALE = 0.25
+
+
+def render_clip(page, box, zoom):
+    """Rasterise only the page rectangle box (PDF points) of an unrotated page at zoom.
+
+    Returns (RGB uint8 array, (x, y)): the array's top-left pixel in full-page pixels at zoom.
+    """
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=fitz.Rect(box), alpha=False)
+    return pixmap_array(pix), (pix.x, pix.y)
+
+
+def locate_clip_box(page, zoom, locate_zoom, white_thresh=245, min_area=200, pad=20):
+    """Crop box (page pixels at zoom) of the top-most scheme without a full render at zoom.
+
+    The scheme is found on a cheap render at locate_zoom, then refined as in find_top_region_pyramid
+    on a render at zoom of only a window around it, so the box is the one of the default full render.
+    """
+    r = locate_zoom / zoom
+    small = render_page(page, locate_zoom)
+    sx0, sy0, sx1, sy1 = find_top_region_and_crop(small, white_thresh=white_thresh,
+                                                  min_area=max(1, int(round(min_area * r * r))), pad=0)
+    W, H = int(round(page.rect.width * zoom)), int(round(page.rect.height * zoom))
+    coarse = (sx0 / r, sy0 / r, sx1 / r, sy1 / r)
+    window = refine_window(coarse, 4 / r, (W, H))
+    arr, origin = render_clip(page, [v / zoom for v in window], zoom)
+    box = refine_top_region(arr, origin, coarse, (W, H), white_thresh=white_thresh, min_area=min_area, pad=pad)
+    if box is None:
+        return find_top_region_and_crop(render_page(page, zoom), white_thresh=white_thresh, min_area=min_area, pad=pad)
+    return box
+
+
+def _odd(v):
+    return max(1, int(round(v))) | 1
+
+
+# --max-memory-mb: bytes held per page pixel while the scheme is located (RGB render 3, mask 1,
+# morphology output 1, int32 labels 4), per band pixel of the luminance pass (float64 temporaries)
+# and per preview pixel (the PIL page and the copy the overlays are drawn on)
+PAGE_BYTES_PER_PX = 9
+BAND_BYTES_PER_PX = 32
+PREVIEW_BYTES_PER_PX = 8
+MIN_BAND_ROWS = 16
+# interpreter, NumPy / OpenCV / PyMuPDF and the open document, per worker process
+WORKER_BASE_MB = 120
+
+
+def memory_plan(width, height, budget_mb):
+    """Luminance band height and preview scale keeping a width x height page render within budget_mb.
+
+    Bands never exceed NONWHITE_BAND_ROWS (taller ones are no faster); a tight budget makes them
+    thinner. The render itself and the full-page mask / labels can't be split; if they alone exceed the
+    budget the smallest band is used and within_budget is False.
+    """
+    budget = budget_mb * 2**20
+    fixed = PAGE_BYTES_PER_PX * width * height
+    rows = int(max(0, budget - fixed) // (BAND_BYTES_PER_PX * width))
+    rows = max(MIN_BAND_ROWS, min(height, NONWHITE_BAND_ROWS, rows))
+    peak = fixed + BAND_BYTES_PER_PX * width * rows
+    # the preview is drawn while only the render (3 bytes/px) is still held
+    spare = max(0.0, budget - 3 * width * height)
+    preview_scale = min(1.0, math.sqrt(spare / (PREVIEW_BYTES_PER_PX * width * height)))
+    return {"budget_mb": budget_mb, "band_rows": rows, "preview_scale": round(preview_scale, 4),
+            "estimated_peak_mb": round(peak / 2**20, 1), "within_budget": peak <= budget}
+
+
+def preview_page_image(page_arr, scale):
+    """PIL page for make_preview_images, downscaled (area average) before the PIL copy if scale < 1."""
+    if scale < 1:
+        h, w = page_arr.shape[:2]
+        size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+        page_arr = cv2.resize(page_arr, size, interpolation=cv2.INTER_AREA)
+    return Image.fromarray(page_arr)
+
+
+def process_page(page, pdf_path: Path, page_index, out_dir: Path, multi_page=False, zoom=2.0, cache=None, pdf_digest=None,
+                 pyramid=None, profiler=None, geometry="raster", previews=True, out_format="json", preview=None,
+                 clip_dpi=None, max_memory_mb=None):
+    """Render one PDF page, extract the upper scheme and write its JSON + previews.
+
+    With multi_page=True output names get a "p<NNN>_" page tag so pages don't overwrite each other.
+    cache: optional stage_cache.StageCache for the render, crop-box and preprocessing stages,
+    keyed by the PDF content hash (pdf_digest, computed if omitted).
+    pyramid: locate the scheme on a page downscaled by this factor first (find_top_region_pyramid).
+    profiler: optional stage_profile.StageProfiler; per-stage timings go into the JSON as meta.profile.
+    geometry: "raster" thresholds the rendered page; "vector" reads outline, walls, openings and
+    arcs from the PDF drawing commands (vector_scheme.py) and fails on pages without them;
+    "auto" tries vector first and falls back to raster.
+    previews: write the crop/preview images; without them a vector page is never rendered.
+    preview: page preview format / width cap / quality, overrides for PREVIEW_DEFAULTS.
+    clip_dpi: raster geometry in two passes: locate the scheme on a render at zoom * pyramid
+    (default CLIP_LOCATE_SCALE) and refine the box on a zoom render of a window around it
+    (locate_clip_box; the box of the default mode), then render only the box at clip_dpi
+    (PyMuPDF clip) and analyse that with thresholds scaled to clip_dpi (the module docstring
+    has the measured difference to the default mode). *_page fields stay in page pixels at zoom
+    (fractional); *_crop fields are clip pixels, described by out_json["clip"]. Rotated pages use
+    the single full render.
+    max_memory_mb: low-memory raster mode (memory_plan): the render stays a NumPy array (no PIL
+    page), the non-white mask is computed in row bands sized to the budget, only the crop is
+    copied, and the preview page is downscaled to fit. Same geometry as the default mode;
+    --pyramid is not used for locating. The plan is stored as out_json["memory"].
+    out_format: "json", "npz" or "jsonl" (plan_format.py); the compact formats drop the *_crop
+    duplicates of the page coordinates. None writes nothing and returns the extraction dict
+    in place of json_path.
+    Returns (json_path, crop_png, preview_path); the image paths are None with previews=False.
+    """
+    if cache is not None and pdf_digest is None:
+        pdf_digest = file_digest(pdf_path)
+
+    vec = None
+    if geometry in ("vector", "auto") and not page.rotation:
+        with profiled(profiler, "vector"):
+            page_rect = tuple(page.rect)
+            vec, _ = cached(cache, "vector_scheme", (pdf_digest, int(page_index), zoom, VECTOR_DEFAULTS),
+                            lambda: extract_scheme_vector(page.get_cdrawings(), page_rect, zoom))
+    if vec is None and geometry == "vector":
+        raise RuntimeError(f"Page {page_index + 1} has no usable vector drawing (rotated or no floor fill); "
+                           "use --geometry raster or auto")
+
+    clip_zoom = clip_dpi / 72.0 if clip_dpi and vec is None and not page.rotation else None
+    low_memory = max_memory_mb is not None and vec is None and clip_zoom is None
+    page_image = page_img = None
+    page_scale = 1.0  # page_img pixels per page pixel
+    if clip_zoom is not None and previews:
+        # the page is only needed for the preview: render it at the preview width
+        max_width = (preview or {}).get("max_width")
+        preview_zoom = min(zoom, max_width / page.rect.width) if max_width else zoom
+        page_scale = preview_zoom / zoom
+    elif vec is None or previews:
+        preview_zoom = zoom
+    else:
+        preview_zoom = None
+    if preview_zoom is not None:
+        with profiled(profiler, "render"):
+            page_arr, render_key = cached(cache, "render", (pdf_digest, int(page_index), preview_zoom),
+                                          lambda: render_page(page, preview_zoom))
+            # the stages below work on views of this one buffer; PIL copies are made for the previews only
+            page_image = PlanImage(page_arr)
+
+    walls_crop = None
+    if vec is not None:
+        # exact geometry, already in page pixels; shift into crop-local coords like the raster path
+        crop_box = vec["crop_box"]
+        x0, y0, x1, y1 = crop_box
+        main_poly_crop = [[round(px - x0, 2), round(py - y0, 2)] for px, py in vec["outline"]]
+        openings_crop = [{"bbox": [round(op["bbox"][0] - x0, 2), round(op["bbox"][1] - y0, 2), op["bbox"][2], op["bbox"][3]],
+                          "area": op["area"],
+                          "center": [round(op["center"][0] - x0, 2), round(op["center"][1] - y0, 2)]}
+                         for op in vec["openings"]]
+        door_arcs_crop = [{"center_px": [round(da["center_px"][0] - x0, 1), round(da["center_px"][1] - y0, 1)],
+                           "radius_px": da["radius_px"], "coverage_deg": da["coverage_deg"]}
+                          for da in vec["door_arcs"]]
+        walls_crop = [[round(a - x0, 2), round(b - y0, 2), round(c - x0, 2), round(d - y0, 2)] for a, b, c, d in vec["walls"]]
+    elif clip_zoom is not None:
+        # crop pixels per page pixel; thresholds tuned for page pixels are scaled by it
+        s = clip_zoom / zoom
+        locate_zoom = zoom * (pyramid if pyramid and pyramid < 1 else CLIP_LOCATE_SCALE)
+        with profiled(profiler, "crop_box"):
+            crop_box, _ = cached(cache, "clip_box", (pdf_digest, int(page_index), zoom, locate_zoom),
+                                 lambda: locate_clip_box(page, zoom, locate_zoom))
+            x0, y0, x1, y1 = crop_box
+        with profiled(profiler, "render_clip"):
+            (crop_arr, clip_origin), crop_key = cached(cache, "render_clip", (pdf_digest, int(page_index), clip_zoom, crop_box),
+                                                       lambda: render_clip(page, [v / zoom for v in crop_box], clip_zoom))
+            crop = PlanImage(crop_arr)
+        # hairlines anti-alias away at zoom but render solid above it: open_px drops strokes thinner
+        # than a zoom pixel, so they don't join openings to the outline
+        prep = {"min_component_area": int(round(100 * s * s)), "blur_ksize": _odd(5 * s), "block_size": _odd(21 * s),
+                "close_iterations": max(1, int(round(2 * s))), "open_px": int(round(s))}
+        with profiled(profiler, "preprocess_crop"):
+            pre, _ = cached(cache, "preprocess_crop", (crop_key, prep), lambda: preprocess_crop(crop, **prep))
+        with profiled(profiler, "contours"):
+            main_poly_crop, openings_crop = extract_contours_from_crop(crop, pre=pre, scale=s)
+            contours, _ = cv2.findContours(pre["binary"], cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        with profiled(profiler, "door_arcs"):
+            door_arcs_crop = detect_door_arcs(contours, area_min=300 * s * s, area_max=8000 * s * s)
+    elif low_memory:
+        mem = memory_plan(page_image.width, page_image.height, max_memory_mb)
+        with profiled(profiler, "crop_box"):
+            # same result as the default full-resolution search, so the cache entry is shared
+            crop_box, crop_key = cached(cache, "crop_box", (render_key, None),
+                                        lambda: find_top_region_and_crop(page_arr, band_rows=mem["band_rows"]))
+            x0, y0, x1, y1 = crop_box
+            crop = page_image.crop(crop_box).copy()
+        if previews:
+            page_img = preview_page_image(page_arr, mem["preview_scale"])
+            page_scale = page_img.width / page_arr.shape[1]
+        # the crop (and preview page) hold copies: drop the render now
+        page_arr = page_image = None
+    else:
+        # find crop for top-most scheme
+        if pyramid and pyramid < 1:
+            locate = lambda: find_top_region_pyramid(page_image, scale=pyramid)
+        else:
+            locate = lambda: find_top_region_and_crop(page_image)
+        with profiled(profiler, "crop_box"):
+            crop_box, crop_key = cached(cache, "crop_box", (render_key, pyramid), locate)
+            x0, y0, x1, y1 = crop_box
+            crop = page_image.crop(crop_box)
+
+    if vec is None and clip_zoom is None:
+        # binarise once; contour extraction and arc detection share the result
+        with profiled(profiler, "preprocess_crop"):
+            pre, _ = cached(cache, "preprocess_crop", (crop_key, 100), lambda: preprocess_crop(crop))
+        # extract contours and openings in crop-local coords
+        with profiled(profiler, "contours"):
+            main_poly_crop, openings_crop = extract_contours_from_crop(crop, pre=pre)
+            # raw (unfiltered) contours for arc detection
+            contours, _ = cv2.findContours(pre["binary"], cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        with profiled(profiler, "door_arcs"):
+            door_arcs_crop = detect_door_arcs(contours)
+
+    # convert crop-local coords to page coords (ints stay ints for the raster path)
+    if clip_zoom is not None:
+        # clip pixel (cx, cy) is full-page pixel (ox + cx, oy + cy) at clip_zoom
+        ox, oy = clip_origin
+        main_poly_page = [[round((ox + px) / s, 2), round((oy + py) / s, 2)] for px, py in (main_poly_crop or [])]
+        openings_page = []
+        for op in openings_crop:
+            bx, by, bw, bh = op["bbox"]
+            openings_page.append({"bbox_page": [round((ox + bx) / s, 2), round((oy + by) / s, 2), round(bw / s, 2), round(bh / s, 2)],
+                                  "center_page": [round((ox + op["center"][0]) / s, 2), round((oy + op["center"][1]) / s, 2)],
+                                  "area": round(op["area"] / (s * s), 2)})
+        door_arcs_page = []
+        for da in door_arcs_crop:
+            cx, cy = da["center_px"]
+            door_arcs_page.append({"center_page": [round((ox + cx) / s, 1), round((oy + cy) / s, 1)],
+                                   "radius_px": round(da["radius_px"] / s, 1), "coverage_deg": float(da["coverage_deg"])})
+    else:
+        main_poly_page = [[round(px + x0, 2), round(py + y0, 2)] for px, py in (main_poly_crop or [])]
+        openings_page = []
+        for op in openings_crop:
+            bx, by, bw, bh = op["bbox"]
+            openings_page.append({"bbox_page": [round(bx + x0, 2), round(by + y0, 2), bw, bh], "center_page": [round(op["center"][0] + x0, 2), round(op["center"][1] + y0, 2)], "area": op["area"]})
+        door_arcs_page = []
+        for da in door_arcs_crop:
+            cx, cy = da["center_px"]
+            door_arcs_page.append({"center_page": [float(round(cx + x0, 1)), float(round(cy + y0, 1))], "radius_px": float(da["radius_px"]), "coverage_deg": float(da["coverage_deg"])})
 
     # save outputs
     out_json = {
         "source_pdf": str(pdf_path),
-        "page_index": 0,
+        "page_index": int(page_index),
         "crop_bbox_page": [int(x0), int(y0), int(x1 - x0), int(y1 - y0)],
         "apartment_outline_crop": main_poly_crop,
         "apartment_outline_page": main_poly_page,
@@ -231,19 +659,351 @@ def main(argv):
         "openings_page": openings_page,
         "door_arcs_crop": door_arcs_crop,
         "door_arcs_page": door_arcs_page,
+        "geometry_source": "vector" if vec is not None else "raster",
         "notes": "Auto-extracted; verify coordinates visually."
     }
-    out_json_path = out_dir / f"{pdf_path.stem}_upper_scheme_extraction.json"
-    with open(out_json_path, "w", encoding="utf-8") as f:
-        json.dump(out_json, f, ensure_ascii=False, indent=2)
+    if clip_zoom is not None:
+        # crop pixel = page pixel * scale - origin_px
+        out_json["clip"] = {"dpi": clip_dpi, "scale": round(s, 6), "origin_px": [int(ox), int(oy)]}
+    if low_memory:
+        out_json["memory"] = mem
+    walls_page = None
+    if walls_crop is not None:
+        walls_page = [[round(a + x0, 2), round(b + y0, 2), round(c + x0, 2), round(d + y0, 2)] for a, b, c, d in walls_crop]
+        out_json["walls_crop"] = walls_crop
+        out_json["walls_page"] = walls_page
+    prefix = f"p{page_index + 1:03d}_" if multi_page else ""
+    # previews first, so their timing can go into the JSON
+    crop_p = preview_p = None
+    if previews:
+        if page_img is None:
+            page_img = page_image.pil()
+        with profiled(profiler, "previews"):
+            crop_p, preview_p = make_preview_images(page_img, crop_box, main_poly_page, openings_page, door_arcs_page, out_dir,
+                                                    prefix=prefix, walls_page=walls_page, preview=preview,
+                                                    page_scale=page_scale,
+                                                    crop_img=None if vec is not None else crop.pil())
+
+    if profiler is not None:
+        out_json["meta"] = {"profile": profiler.as_dict()}
+    if out_format != "json":
+        out_json = {k: v for k, v in out_json.items() if not (k.endswith("_crop") and k[:-5] + "_page" in out_json)}
+    if out_format is None:
+        return out_json, crop_p, preview_p
+    out_json_path = write_plan(out_dir / f"{pdf_path.stem}_{prefix}upper_scheme_extraction", out_json, out_format)
+    return out_json_path, crop_p, preview_p
+
+
+def parse_page_spec(spec, page_count):
+    """Turn "all" or a 1-based spec like "1-5,8,12-" into sorted 0-based page indices."""
+    if spec is None or spec.strip().lower() == "all":
+        return list(range(page_count))
+    pages = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            a, b = part.split("-", 1)
+            first = int(a) if a.strip() else 1
+            last = int(b) if b.strip() else page_count
+        else:
+            first = last = int(part)
+        if first < 1 or last > page_count or first > last:
+            raise ValueError(f"Page range {part!r} is outside 1..{page_count}")
+        pages.update(range(first - 1, last))
+    return sorted(pages)
+
+
+# Per-worker state: each pool process opens the PDF once and reuses the handle for all its pages
+_worker_doc = None
+_worker_cache = None
+
+
+def open_cache(cache_dir, cache_max_mb):
+    return StageCache(cache_dir, max_bytes=int(cache_max_mb * 2**20)) if cache_dir else None
+
+
+def _page_worker_init(pdf_path, cache_dir=None, cache_max_mb=1024, thread_plan=None):
+    global _worker_doc, _worker_cache
+    apply_thread_plan(thread_plan or plan_threads(1, cores=1))
+    _worker_doc = fitz.open(str(pdf_path))
+    _worker_cache = open_cache(cache_dir, cache_max_mb)
+
+
+def _page_worker_run(pdf_path, page_index, out_dir, multi_page, pdf_digest=None, pyramid=None, profile=False,
+                     cprofile=False, geometry="raster", previews=True, out_format="json", preview=None, clip_dpi=None,
+                     max_memory_mb=None):
+    """Worker entry point: never raises, returns a manifest record for the page.
+
+    With out_format="jsonl" the extraction comes back as a packed line in rec["page_line"].
+    """
+    rec = {"page_index": int(page_index)}
+    profiler = StageProfiler() if profile else None
+    try:
+        page = _worker_doc.load_page(page_index)
+        with cprofile_to(profile_dump_path(Path(pdf_path), Path(out_dir), page_index, multi_page) if cprofile else None):
+            json_p, crop_p, preview_p = process_page(page, Path(pdf_path), page_index, Path(out_dir), multi_page=multi_page,
+                                                     cache=_worker_cache, pdf_digest=pdf_digest, pyramid=pyramid,
+                                                     profiler=profiler, geometry=geometry, previews=previews,
+                                                     out_format=None if out_format == "jsonl" else out_format,
+                                                     preview=preview, clip_dpi=clip_dpi,
+                                                     max_memory_mb=max_memory_mb)
+        if out_format == "jsonl":
+            rec["page_line"] = dumps_line(json_p)
+            json_p = None
+        rec.update({"status": "ok", "json": str(json_p) if json_p else None, "crop_png": str(crop_p) if crop_p else None,
+                    "preview_png": str(preview_p) if preview_p else None})
+    except Exception as e:
+        rec.update({"status": "error", "error": f"{type(e).__name__}: {e}"})
+    if profiler is not None:
+        rec["profile"] = profiler.as_dict()
+    return rec
+
+
+def profile_dump_path(pdf_path: Path, out_dir: Path, page_index, multi_page):
+    prefix = f"p{page_index + 1:03d}_" if multi_page else ""
+    return out_dir / f"{pdf_path.stem}_{prefix}profile.prof"
+
+
+def run_pages(pdf_path: Path, out_dir: Path, page_indices, workers=None, cache_dir=None, cache_max_mb=1024, pyramid=None,
+              profile=False, cprofile=False, geometry="raster", previews=True, out_format="json", preview=None,
+              clip_dpi=None, max_memory_mb=None):
+    """Process several pages in a process pool; results are written by the workers as pages finish.
+
+    max_memory_mb: low-memory mode per page (process_page); the default worker count then also
+    fits max_memory_mb + WORKER_BASE_MB per worker into the available memory.
+
+    profile: per-stage timings for every page plus a per-stage histogram in the manifest ("profile_summary").
+    out_format="jsonl": pages are appended to <stem>_pages.jsonl by this process as they finish.
+    """
+    plan = plan_threads(len(page_indices), workers,
+                        worker_memory_mb=max_memory_mb + WORKER_BASE_MB if max_memory_mb else None)
+    print(format_plan(plan))
+    pdf_digest = file_digest(pdf_path) if cache_dir else None
+    records = []
+    jsonl_path = out_dir / f"{pdf_path.stem}_pages.jsonl" if out_format == "jsonl" else None
+    lines = 0
+    # the pool shuts down before the .jsonl closes, also when a page record can't be written
+    with contextlib.ExitStack() as stack:
+        jsonl = stack.enter_context(open(jsonl_path, "w", encoding="utf-8")) if jsonl_path else None
+        pool = stack.enter_context(ProcessPoolExecutor(max_workers=plan["workers"], initializer=_page_worker_init,
+                                                       initargs=(str(pdf_path), cache_dir, cache_max_mb, plan)))
+        futs = [pool.submit(_page_worker_run, str(pdf_path), idx, str(out_dir), True, pdf_digest, pyramid,
+                            profile, cprofile, geometry, previews, out_format, preview, clip_dpi, max_memory_mb)
+                for idx in page_indices]
+        for fut in as_completed(futs):
+            rec = fut.result()
+            line = rec.pop("page_line", None)
+            if line is not None:
+                jsonl.write(line + "\n")
+                jsonl.flush()
+                rec.update({"jsonl": str(jsonl_path), "jsonl_line": lines})
+                lines += 1
+            records.append(rec)
+            print(f"[{len(records)}/{len(page_indices)}] page {rec['page_index'] + 1}: {rec['status']}")
+    records.sort(key=lambda r: r["page_index"])
+    manifest = {
+        "source_pdf": str(pdf_path),
+        "workers": plan["workers"],
+        "thread_plan": plan,
+        "pages": records,
+    }
+    if jsonl_path:
+        manifest["jsonl"] = str(jsonl_path)
+    if profile:
+        manifest["profile_summary"] = summarize(r.get("profile") for r in records)
+    manifest_path = out_dir / f"{pdf_path.stem}_pages_manifest.json"
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest, manifest_path
+
+
+def _watch_worker_init(cache_dir=None, cache_max_mb=1024, thread_plan=None):
+    global _worker_cache
+    apply_thread_plan(thread_plan or plan_threads(1, cores=1))
+    _worker_cache = open_cache(cache_dir, cache_max_mb)
+
+
+def _watch_extract_one(pdf_path, out_dir, pages=None, **page_opts):
+    """watch_inputs worker: one PDF's pages (a --pages spec; default the first page only) into out_dir.
+
+    Never raises. page_opts are _page_worker_run's; jsonl lines go to <stem>_pages.jsonl (with
+    pages) or <stem>_upper_scheme_extraction.jsonl. rec["outputs"] lists every file written.
+    """
+    global _worker_doc
+    t0 = time.perf_counter()
+    rec = {"pdf": str(pdf_path), "out_dir": str(out_dir), "outputs": []}
+    pdf_path, out_dir = Path(pdf_path), Path(out_dir)
+    multi_page = pages is not None
+    try:
+        with fitz.open(str(pdf_path)) as doc:
+            _worker_doc = doc
+            out_dir.mkdir(parents=True, exist_ok=True)
+            indices = parse_page_spec(pages, doc.page_count) if multi_page else [0]
+            pdf_digest = file_digest(pdf_path) if _worker_cache is not None else None
+            page_recs = [_page_worker_run(str(pdf_path), idx, str(out_dir), multi_page, pdf_digest, **page_opts)
+                         for idx in indices]
+        lines = [r.pop("page_line") for r in page_recs if "page_line" in r]
+        if lines:
+            name = f"{pdf_path.stem}_pages.jsonl" if multi_page else f"{pdf_path.stem}_upper_scheme_extraction.jsonl"
+            with open(out_dir / name, "w", encoding="utf-8") as f:
+                f.writelines(line + "\n" for line in lines)
+            rec["outputs"].append(str(out_dir / name))
+        for r in page_recs:
+            rec["outputs"] += [r[k] for k in ("json", "crop_png", "preview_png") if r.get(k)]
+        if page_opts.get("cprofile"):
+            rec["outputs"] += [str(profile_dump_path(pdf_path, out_dir, idx, multi_page)) for idx in indices]
+        failed = [r for r in page_recs if r["status"] != "ok"]
+        rec.update({"status": "error" if failed else "ok", "pages": len(indices)})
+        if failed:
+            rec["error"] = "; ".join(f"page {r['page_index'] + 1}: {r['error']}" for r in failed)
+    except Exception as e:
+        rec.update({"status": "error", "error": f"{type(e).__name__}: {e}"})
+    finally:
+        _worker_doc = None
+    rec["seconds"] = round(time.perf_counter() - t0, 3)
+    return rec
+
+
+def run_watch(input_dir: Path, out_dir: Path, pattern="*.pdf", pages=None, workers=None, cache_dir=None,
+              cache_max_mb=1024, pyramid=None, profile=False, cprofile=False, geometry="raster", previews=True,
+              out_format="json", preview=None, clip_dpi=None, max_memory_mb=None,
+              interval=WATCH_DEFAULTS["interval"], settle=WATCH_DEFAULTS["settle"], once=False):
+    """Watch mode: process new and changed PDFs under input_dir in a process pool as they appear.
+
+    Runs until interrupted, or one pass with once=True; returns the watch_inputs.WatchManifest.
+    """
+    # PDFs arrive over time: plan for a full pool
+    plan = plan_threads(workers or usable_cores(), workers,
+                        worker_memory_mb=max_memory_mb + WORKER_BASE_MB if max_memory_mb else None)
+    print(format_plan(plan))
+    page_opts = {"pyramid": pyramid, "profile": profile, "cprofile": cprofile, "geometry": geometry,
+                 "previews": previews, "out_format": out_format, "preview": preview, "clip_dpi": clip_dpi,
+                 "max_memory_mb": max_memory_mb}
+    worker = functools.partial(_watch_extract_one, pages=pages, **page_opts)
+    # everything that changes the outputs: PDFs processed under other settings are processed again
+    params = dict(page_opts, pages=pages, crop=PREPROCESS_CROP_DEFAULTS, vector=VECTOR_DEFAULTS)
+    return watch(input_dir, pattern, out_dir, worker, params, workers=plan["workers"], initializer=_watch_worker_init,
+                 initargs=(cache_dir, cache_max_mb, plan), interval=interval, settle=settle, once=once)
 
-    crop_p, preview_p = make_preview_images(page_img, crop_box, main_poly_page, openings_page, door_arcs_page, out_dir)
 
-    print("Wrote:")
-    print(" - JSON:", out_json_path)
-    print(" - Crop PNG:", crop_p)
-    print(" - Preview PNG:", preview_p)
-    return 0
+def main(argv):
+    ap = argparse.ArgumentParser(prog="extract_upper_scheme.py")
+    ap.add_argument("pdf", help="path to the PDF (--watch: folder of PDFs)")
+    ap.add_argument("out_dir", help="output directory")
+    ap.add_argument("--pages", default=None,
+                    help='1-based pages to process, e.g. "all", "3", "1-5,8", "12-". Default: first page only')
+    ap.add_argument("--workers", type=int, default=None, help="worker processes for multi-page runs (default: one per core, at most one per page)")
+    ap.add_argument("--cache-dir", default=None, help="reuse rendered pages, crop boxes and binarised crops stored here across runs")
+    ap.add_argument("--cache-max-mb", type=float, default=1024, help="size limit of --cache-dir; least recently used entries are evicted")
+    ap.add_argument("--pyramid", type=float, default=None,
+                    help="locate the scheme on the page downscaled by this factor (e.g. 0.25), refine at full resolution")
+    ap.add_argument("--profile", action="store_true",
+                    help="record wall/CPU time and peak RSS per stage in the JSON meta (multi-page: histogram in the manifest)")
+    ap.add_argument("--cprofile", action="store_true",
+                    help="also dump a cProfile per page to <stem>_[pNNN_]profile.prof (snakeviz / flameprof)")
+    ap.add_argument("--geometry", choices=("auto", "vector", "raster"), default="raster",
+                    help="threshold the rendered page (raster, default), read walls/openings from the PDF vector "
+                         "drawing (vector), or vector with raster fallback for scanned pages (auto)")
+    ap.add_argument("--no-previews", action="store_true",
+                    help="skip the crop/preview PNGs (vector pages are then not rendered at all)")
+    ap.add_argument("--format", choices=FORMATS, default="json",
+                    help="json (pretty), npz (packed arrays) or jsonl (compact line; multi-page: one <stem>_pages.jsonl)")
+    ap.add_argument("--preview-format", choices=PREVIEW_FORMATS, default=PREVIEW_DEFAULTS["format"],
+                    help="page preview image format (webp/jpeg are much smaller and faster to write than png)")
+    ap.add_argument("--preview-width", type=int, default=PREVIEW_DEFAULTS["max_width"],
+                    help="cap the page preview width in px; the page is downscaled before drawing (default: render size)")
+    ap.add_argument("--preview-quality", type=int, default=PREVIEW_DEFAULTS["quality"],
+                    help="webp/jpeg preview quality (1-100)")
+    ap.add_argument("--clip-dpi", type=float, default=None,
+                    help="raster geometry in two passes: locate the scheme on a low-zoom render, then render only "
+                         "its box at this DPI (e.g. 300) for more precise coordinates and less memory per page")
+    ap.add_argument("--max-memory-mb", type=float, default=None,
+                    help="low-memory raster mode: keep page analysis of each worker near this many MB (render kept "
+                         "as one array, banded luminance, downscaled preview); multi-page runs also start no more "
+                         "workers than fit into the available memory")
+    ap.add_argument("--watch", action="store_true",
+                    help="keep watching the folder given as pdf and process only new or changed PDFs (incremental "
+                         "<out_dir>/watch_manifest.json; outputs of deleted PDFs are removed; a restart resumes)")
+    ap.add_argument("--glob", default="*.pdf", help="--watch: file pattern inside the folder (e.g. '**/*.pdf')")
+    ap.add_argument("--once", action="store_true", help="--watch: one incremental pass, then exit")
+    ap.add_argument("--interval", type=float, default=WATCH_DEFAULTS["interval"], help="--watch: seconds between scans")
+    ap.add_argument("--settle", type=float, default=WATCH_DEFAULTS["settle"],
+                    help="--watch: PDFs modified less than this many seconds ago may still be copied; they wait")
+    args = ap.parse_args(argv[1:])
+    if args.once and not args.watch:
+        ap.error("--once needs --watch")
+    preview = {"format": args.preview_format, "max_width": args.preview_width, "quality": args.preview_quality}
+    pdf_path = Path(args.pdf)
+    out_dir = Path(args.out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    if args.watch:
+        if not pdf_path.is_dir():
+            ap.error("--watch needs a folder of PDFs")
+        try:
+            manifest = run_watch(pdf_path, out_dir, args.glob, pages=args.pages, workers=args.workers,
+                                 cache_dir=args.cache_dir, cache_max_mb=args.cache_max_mb, pyramid=args.pyramid,
+                                 profile=args.profile, cprofile=args.cprofile, geometry=args.geometry,
+                                 previews=not args.no_previews, out_format=args.format, preview=preview,
+                                 clip_dpi=args.clip_dpi, max_memory_mb=args.max_memory_mb,
+                                 interval=args.interval, settle=args.settle, once=args.once)
+        except ValueError as e:
+            print(e)
+            return 2
+        except KeyboardInterrupt:
+            print("Stopped; the watch manifest keeps every finished PDF.")
+            return 130
+        s = manifest.summary()
+        print(f"{s['inputs']} PDFs tracked ({s['failed']} failed).")
+        print(" - Manifest:", manifest.path)
+        return 1 if s["failed"] else 0
+
+    if args.pages is None:
+        # Render first page (index 0)
+        doc = fitz.open(str(pdf_path))
+        page = doc.load_page(0)
+        apply_thread_plan(plan_threads(1))
+        profiler = StageProfiler() if args.profile else None
+        with cprofile_to(profile_dump_path(pdf_path, out_dir, 0, False) if args.cprofile else None):
+            out_json_path, crop_p, preview_p = process_page(page, pdf_path, 0, out_dir,
+                                                            cache=open_cache(args.cache_dir, args.cache_max_mb),
+                                                            pyramid=args.pyramid, profiler=profiler,
+                                                            geometry=args.geometry, previews=not args.no_previews,
+                                                            out_format=args.format, preview=preview,
+                                                            clip_dpi=args.clip_dpi, max_memory_mb=args.max_memory_mb)
+        if profiler is not None:
+            print(format_summary(summarize([profiler.as_dict()])))
+
+        print("Wrote:")
+        print(" - JSON:", out_json_path)
+        if crop_p:
+            print(" - Crop PNG:", crop_p)
+            print(" - Preview:", preview_p)
+        return 0
+
+    with fitz.open(str(pdf_path)) as doc:
+        page_count = doc.page_count
+    try:
+        page_indices = parse_page_spec(args.pages, page_count)
+    except ValueError as e:
+        print(e)
+        return 2
+    manifest, manifest_path = run_pages(pdf_path, out_dir, page_indices, workers=args.workers,
+                                        cache_dir=args.cache_dir, cache_max_mb=args.cache_max_mb,
+                                        pyramid=args.pyramid, profile=args.profile, cprofile=args.cprofile,
+                                        geometry=args.geometry, previews=not args.no_previews,
+                                        out_format=args.format, preview=preview, clip_dpi=args.clip_dpi,
+                                        max_memory_mb=args.max_memory_mb)
+    if args.profile:
+        print(format_summary(manifest["profile_summary"]))
+    failed = [r for r in manifest["pages"] if r["status"] != "ok"]
+    print(f"Processed {len(page_indices) - len(failed)}/{len(page_indices)} pages with {manifest['workers']} workers.")
+    if "jsonl" in manifest:
+        print(" - Pages JSONL:", manifest["jsonl"])
+    print(" - Manifest:", manifest_path)
+    return 1 if failed else 0
 
 
 if __name__ == '__main__':
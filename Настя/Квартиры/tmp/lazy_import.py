@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+lazy_import.py
+
+Deferred module imports for the floorplan scripts, so `--help`, daemon clients and other
+paths that never touch OpenCV / NumPy / tesseract don't pay for importing them.
+
+    cv2 = lazy_import("cv2")            # nothing is loaded yet
+    cv2.imread(path)                    # first attribute access runs the real import
+
+Modules that are already imported are returned as is. With optional=True a module that
+is not installed gives None, like the usual try/except ImportError fallback; errors raised
+while the module itself executes only surface on first use.
+
+The first access is not thread-safe before Python 3.12: call load_now() from one thread
+before worker threads start using the modules.
+"""
+import importlib.util
+import sys
+
+
+def lazy_import(name, optional=False):
+    """Return module `name`, executed on first attribute access."""
+    if name in sys.modules:
+        return sys.modules[name]
+    try:
+        spec = importlib.util.find_spec(name)
+    except ImportError:  # parent package missing
+        spec = None
+    if spec is None:
+        if optional:
+            return None
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def load_now(*modules):
+    """Run the pending imports of lazy modules now (None entries are skipped)."""
+    for module in modules:
+        if module is not None:
+            getattr(module, "__name__")
@@ -4,37 +4,99 @@ parse_floorplan.py
 
 Usage:
     python parse_floorplan.py --image "/path/to/7.1 2Д.png" [--scale_mm 6250] [--out /tmp/plan_out]
+    python parse_floorplan.py --input-dir /path/to/plans [--glob "**/*.png"] [--workers 8] [--out /tmp/plan_out]
+    python parse_floorplan.py --input-dir /path/to/plans --pipeline [--stage-workers preprocess=4,ocr=2] [--queue-size 2]
+    python parse_floorplan.py --input-dir /path/to/plans --reuse [--index /path/to/plan_index.json] [--reuse-distance 24]
+    python parse_floorplan.py --serve unix:/tmp/floorplan.sock --out /tmp/plan_out [--workers 4] [--cache-dir /tmp/plan_cache]
+    python parse_floorplan.py --server unix:/tmp/floorplan.sock --image "/path/to/7.1 2Д.png" --out /tmp/plan_out/7.1
 
 Outputs:
     - <out>/parsed_plan.json
-    - <out>/parsed_plan.svg
+    - <out>/parsed_plan.svg (links the source image; --svg-raster embed makes it self-contained with a
+      downscaled JPEG background, --svg-raster none drops the background)
+    - batch mode: <out>/<relative image path without suffix>/parsed_plan.{json,svg}
+      plus <out>/batch_manifest.json (status, timing and error per image; failures don't stop the batch)
+    - --format npz writes parsed_plan.npz (packed coordinate arrays) instead of parsed_plan.json;
+      --format jsonl writes one compact line per plan, in batch mode streamed into <out>/batch_plans.jsonl
+      as images finish. Read either with plan_format.load_plan / iter_plans (polygons as NumPy arrays).
 
 Notes:
     - Requires: python3, pip install opencv-python numpy pillow pytesseract shapely
     - Also requires system tesseract (e.g., apt install tesseract-ocr / brew install tesseract)
+    - --pipeline runs the batch in one process as an asyncio pipeline (load -> preprocess -> contours -> ocr -> write,
+      bounded queues between stages, a thread pool per stage; see plan_pipeline.py) so I/O, OpenCV and OCR of
+      different images overlap; the manifest adds per-stage busy time
+    - --serve keeps a warm parser running (plan_server.py); --server sends --image to it instead of parsing in-process
+    - --profile adds per-stage wall/CPU time and peak RSS to meta.profile (batch: a per-stage histogram in the manifest);
+      --cprofile also writes parsed_plan.prof (snakeviz / flameprof)
+    - --wall-graph adds every wall (interior ones too) as wall_graph: nodes [[x, y], ...] and edges
+      {"nodes": [i, j], "length_px", "length_m", "thickness_px"}, see wall_graph.py; walls_px keeps
+      only the outer outline. Without it (and with --pyramid: only a band along the outer wall is binarised)
+      wall_graph is null
+    - --rooms lists every enclosed room (door gaps closed, see rooms.py) with polygon_px / polygon_m, area_px /
+      area_m2, centroid_px and bbox_px; with a known scale the door gap comes from a door width in mm. Without
+      --rooms (and with --pyramid) rooms is null
+    - --ocr regions is faster; with tesserocr installed (pip install tesserocr) the engine stays loaded in-process
+    - --watch keeps parsing --input-dir as images are added or changed: <out>/watch_manifest.json tracks every
+      input (mtime, size, SHA-256, parameter hash, outputs), so only new / changed images are parsed (in parallel),
+      the outputs of deleted images are removed and a restart resumes from the manifest (see watch_inputs.py);
+      --once makes one such pass and exits. --format jsonl writes one parsed_plan.jsonl per image there
+    - --reuse keeps a perceptual-hash index of parsed plans (<out>/plan_index.json or --index, see plan_index.py);
+      a near-duplicate image parsed before with the same settings gets that stored plan (meta.reused_from)
+      instead of a full parse, and fully parsed images are added
     - This is a robust heuristic parser — manual verification recommended.
 """
 import argparse
+import base64
+import contextlib
+import functools
 import json
 import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
 
-import cv2
-import numpy as np
-from PIL import Image, ImageDraw, ImageFont
-import pytesseract
+from lazy_import import lazy_import
+from plan_format import FORMATS, dumps_line, write_plan
+from plan_image import PlanImage
+from plan_index import INDEX_DEFAULTS, INDEX_NAME, PlanIndex, index_entry, plan_hash, scene_outline
+from stage_cache import StageCache, cached, pack_contours, unpack_contours
+from stage_profile import StageProfiler, cprofile_to, format_summary, profiled, summarize
+from thread_plan import apply_thread_plan, format_plan, plan_threads, usable_cores
+from watch_inputs import WATCH_DEFAULTS, watch
 
-# Optional: shapely for geometry convenience (if installed)
-try:
-    from shapely.geometry import Polygon, LineString, Point
-except Exception:
-    Polygon = None
-    LineString = None
-    Point = None
+# Heavy dependencies load on first use: --help, --server requests and fully cached
+# runs don't import tesseract bindings, and only what they touch of the rest.
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+Image = lazy_import("PIL.Image")
+ImageDraw = lazy_import("PIL.ImageDraw")
+ImageFont = lazy_import("PIL.ImageFont")
+pytesseract = lazy_import("pytesseract")
+region_ocr = lazy_import("region_ocr")
+wall_graph = lazy_import("wall_graph")
+rooms = lazy_import("rooms")
+
+# Optional: shapely for geometry convenience (if installed), resolved on first access
+_SHAPELY_NAMES = ("Polygon", "LineString", "Point")
+
+def __getattr__(name):
+    if name in _SHAPELY_NAMES:
+        try:
+            from shapely import geometry
+            value = getattr(geometry, name)
+        except Exception:
+            value = None
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+OCR_LANG = 'rus+eng'
 
 def ocr_numbers(img_pil):
     """Return list of detected numeric tokens with bounding boxes using pytesseract."""
-    data = pytesseract.image_to_data(img_pil, output_type=pytesseract.Output.DICT, lang='rus+eng')
+    data = pytesseract.image_to_data(img_pil, output_type=pytesseract.Output.DICT, lang=OCR_LANG)
     nums = []
     for i, txt in enumerate(data['text']):
         t = txt.strip().replace(',', '.')
@@ -50,19 +112,112 @@ def ocr_numbers(img_pil):
             continue
     return nums
 
-def image_preprocess_for_contours(cv_img):
-    """Convert to binary image tuned for architectural drawings."""
-    gray = cv2.cvtColor(cv_img, cv2.COLOR_BGR2GRAY)
-    # Remove small color noise but keep edges
-    bl = cv2.bilateralFilter(gray, 9, 75, 75)
+PREPROCESS_DEFAULTS = {"bilateral_d": 9, "sigma_color": 75, "sigma_space": 75, "block_size": 15, "thresh_c": 7}
+
+def smooth_for_contours(gray, bilateral_d=9, sigma_color=75, sigma_space=75):
+    """Remove small color noise but keep edges (first half of image_preprocess_for_contours)."""
+    return cv2.bilateralFilter(gray, bilateral_d, sigma_color, sigma_space)
+
+def binarize_for_contours(smoothed, block_size=15, thresh_c=7):
+    """Adaptive threshold + close of a smoothed gray image (second half of image_preprocess_for_contours)."""
     # Adaptive threshold to get lines
-    th = cv2.adaptiveThreshold(bl, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                cv2.THRESH_BINARY_INV, 15, 7)
+    th = cv2.adaptiveThreshold(smoothed, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                cv2.THRESH_BINARY_INV, block_size, thresh_c)
     # Morph close to join lines
     kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3,3))
     morph = cv2.morphologyEx(th, cv2.MORPH_CLOSE, kernel, iterations=1)
     return morph
 
+def image_preprocess_for_contours(cv_img, bilateral_d=9, sigma_color=75, sigma_space=75, block_size=15, thresh_c=7):
+    """Convert to binary image tuned for architectural drawings (cv_img: BGR, or already gray)."""
+    gray = cv_img if cv_img.ndim == 2 else cv2.cvtColor(cv_img, cv2.COLOR_BGR2GRAY)
+    return binarize_for_contours(smooth_for_contours(gray, bilateral_d, sigma_color, sigma_space), block_size, thresh_c)
+
+def preprocess_halo(bilateral_d=9, sigma_space=75, block_size=15, **_):
+    """Pixels of context each output pixel of image_preprocess_for_contours depends on."""
+    bilateral_r = bilateral_d // 2 if bilateral_d > 0 else int(round(sigma_space * 1.5))
+    # bilateral + adaptive-threshold window + 3x3 close (dilate then erode)
+    return bilateral_r + block_size // 2 + 2
+
+def image_preprocess_tiled(cv_img, tile_size=2048, threads=None, roi=None, **params):
+    """image_preprocess_for_contours over overlapping tiles, stitched into one mask.
+
+    Each tile is processed with a halo of preprocess_halo() pixels, so every kept pixel
+    sees exactly the neighbourhood it would see in the full image and the mask is
+    identical to the untiled one. Temporaries (gray, bilateral, threshold) are per tile;
+    tiles run in a thread pool since OpenCV releases the GIL.
+    roi: optional uint8 mask; tiles without any roi pixel are skipped and left at 0.
+    """
+    h, w = cv_img.shape[:2]
+    halo = preprocess_halo(**dict(PREPROCESS_DEFAULTS, **params))
+    out = np.zeros((h, w), dtype=np.uint8)
+
+    def run(y0, x0):
+        y1, x1 = min(h, y0 + tile_size), min(w, x0 + tile_size)
+        ya, xa = max(0, y0 - halo), max(0, x0 - halo)
+        yb, xb = min(h, y1 + halo), min(w, x1 + halo)
+        mask = image_preprocess_for_contours(cv_img[ya:yb, xa:xb], **params)
+        out[y0:y1, x0:x1] = mask[y0 - ya:y1 - ya, x0 - xa:x1 - xa]
+
+    origins = [(y, x) for y in range(0, h, tile_size) for x in range(0, w, tile_size)
+               if roi is None or roi[y:y + tile_size, x:x + tile_size].any()]
+    with ThreadPoolExecutor(max_workers=threads or os.cpu_count() or 1) as pool:
+        list(pool.map(lambda o: run(*o), origins))
+    return out
+
+PYRAMID_MIN_SIDE = 256
+
+def scaled_preprocess_params(params, scale):
+    """Preprocessing parameters for an image downscaled by `scale` (odd window sizes kept >= 3)."""
+    odd = lambda v: max(3, int(round(v * scale)) | 1)
+    p = dict(PREPROCESS_DEFAULTS, **params)
+    p.update(bilateral_d=odd(p["bilateral_d"]), sigma_space=p["sigma_space"] * scale,
+             block_size=odd(p["block_size"]))
+    return p
+
+def detect_outline_pyramid(cv_img, scale=0.25, min_area_ratio=0.002, epsilon_factor=0.01,
+                           opening_band=60, tile_size=256, threads=None, **params):
+    """Coarse-to-fine outer wall polygon and opening contours.
+
+    The outline is located on a `scale` downscaled copy; full-resolution preprocessing
+    then runs only in tiles along that outline. The full-res outline is traced inside a
+    band of ~2 coarse pixels around the coarse contour (the interior is filled so the
+    external contour stays the outer wall face), and opening candidates come from a band
+    of `opening_band` px. Results agree with the full-resolution path to within a few
+    pixels; contours reaching past the band are clipped.
+    This saves the bilateral filter / threshold work away from the walls, not memory: the two
+    band masks, the stitched mask, the composite and the filled interior are full-size uint8
+    arrays, so the peak is ~5 bytes per pixel on top of the input (above the single-pass path).
+    Returns (polygon or None, RETR_LIST contours within the opening band).
+    """
+    small = cv2.resize(cv_img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    bin_small = image_preprocess_for_contours(small, **scaled_preprocess_params(params, scale))
+    big = find_main_contours(bin_small, min_area_ratio=min_area_ratio)
+    if not big:
+        return None, []
+    coarse = np.round(big[0].astype(np.float64) / scale).astype(np.int32)
+
+    h, w = cv_img.shape[:2]
+    band = int(math.ceil(2.0 / scale)) + 2
+    outline_roi = np.zeros((h, w), dtype=np.uint8)
+    cv2.polylines(outline_roi, [coarse], True, 255, thickness=2 * band + 1)
+    opening_roi = np.zeros((h, w), dtype=np.uint8)
+    cv2.polylines(opening_roi, [coarse], True, 255, thickness=2 * max(band, opening_band) + 1)
+
+    fine = image_preprocess_tiled(cv_img, tile_size=tile_size, threads=threads, roi=opening_roi, **params)
+    fine &= opening_roi
+
+    composite = fine & outline_roi
+    interior = np.zeros((h, w), dtype=np.uint8)
+    cv2.fillPoly(interior, [coarse], 255)
+    cv2.polylines(interior, [coarse], True, 0, thickness=2 * band + 1)
+    composite |= interior
+    outer = find_main_contours(composite, min_area_ratio=min_area_ratio)
+    poly = approx_polygon_from_contour(outer[0], epsilon_factor=epsilon_factor) if outer else None
+
+    contours, _ = cv2.findContours(fine, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+    return poly, contours
+
 def find_main_contours(bin_img, min_area_ratio=0.01):
     """Find contours and return sorted by area (largest first)."""
     contours, _ = cv2.findContours(bin_img, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
@@ -78,6 +233,16 @@ def approx_polygon_from_contour(cnt, epsilon_factor=0.01):
     pts = [(int(p[0][0]), int(p[0][1])) for p in approx]
     return pts
 
+OUTLINE_DEFAULTS = {"min_area_ratio": 0.002, "epsilon_factor": 0.01}
+
+def main_outline(bin_img, min_area_ratio=0.002, epsilon_factor=0.01):
+    """Approximated polygon of the largest external contour (the outer walls), or None."""
+    big_contours = find_main_contours(bin_img, min_area_ratio=min_area_ratio)
+    if not big_contours:
+        return None
+    # take largest external contour and approximate polygon
+    return approx_polygon_from_contour(big_contours[0], epsilon_factor=epsilon_factor)
+
 def project_point_to_segment(px, py, ax, ay, bx, by):
     # project point p onto segment ab, return projection point and t in [0,1]
     vx, vy = bx-ax, by-ay
@@ -91,6 +256,50 @@ def project_point_to_segment(px, py, ax, ay, bx, by):
     projy = ay + vy * t_clamped
     return (projx, projy), t_clamped
 
+def contour_bboxes(contours):
+    """cv2.boundingRect for every contour at once -> int array (N, 4) of x, y, w, h."""
+    if len(contours) == 0:
+        return np.zeros((0, 4), dtype=np.int64)
+    points, offsets = pack_contours(contours)
+    starts = offsets[:-1]
+    x0 = np.minimum.reduceat(points[:, 0], starts)
+    y0 = np.minimum.reduceat(points[:, 1], starts)
+    x1 = np.maximum.reduceat(points[:, 0], starts)
+    y1 = np.maximum.reduceat(points[:, 1], starts)
+    return np.stack([x0, y0, x1 - x0 + 1, y1 - y0 + 1], axis=1).astype(np.int64)
+
+def nearest_edges(px, py, wall_poly, chunk_cells=1 << 20):
+    """Vectorised project_point_to_segment against every edge of a closed polygon.
+
+    px, py: candidate points (M,). Returns (dist, edge_idx, t) arrays of shape (M,);
+    ties go to the lowest edge index, like a sequential scan with strict '<'.
+    Work is chunked so the M x E temporaries stay below chunk_cells elements.
+    """
+    poly = np.asarray(wall_poly, dtype=np.float64)
+    ax, ay = poly[:, 0], poly[:, 1]
+    bx, by = np.roll(ax, -1), np.roll(ay, -1)
+    vx, vy = bx - ax, by - ay
+    denom = vx * vx + vy * vy
+    safe = np.where(denom == 0, 1.0, denom)
+    m = len(px)
+    dist = np.empty(m)
+    idx = np.empty(m, dtype=np.int64)
+    t_out = np.empty(m)
+    step = max(1, chunk_cells // max(1, len(poly)))
+    for s0 in range(0, m, step):
+        cx = px[s0:s0 + step, None]
+        cy = py[s0:s0 + step, None]
+        wx, wy = cx - ax, cy - ay
+        t = np.clip((vx * wx + vy * wy) / safe, 0.0, 1.0)
+        t = np.where(denom == 0, 0.0, t)
+        d = np.hypot(ax + vx * t - cx, ay + vy * t - cy)
+        best = np.argmin(d, axis=1)
+        rows = np.arange(len(best))
+        dist[s0:s0 + step] = d[rows, best]
+        idx[s0:s0 + step] = best
+        t_out[s0:s0 + step] = t[rows, best]
+    return dist, idx, t_out
+
 def detect_openings_from_small_contours(contours_all, wall_poly, px_to_mm=None, min_bbox_dim=10):
     """
     Heuristic: find thin short contours (door/window symbols) and map them to nearest wall edge.
@@ -101,39 +310,31 @@ def detect_openings_from_small_contours(contours_all, wall_poly, px_to_mm=None,
     openings = []
     if not wall_poly or len(wall_poly) < 2:
         return openings
-    # Precompute edges
-    edges = []
-    for i in range(len(wall_poly)):
-        a = wall_poly[i]
-        b = wall_poly[(i+1)%len(wall_poly)]
-        edges.append((i, a, b))
-    # For each contour, filter by small size (potential door/window glyph)
-    for cnt in contours_all:
-        x,y,w,h = cv2.boundingRect(cnt)
-        if w < min_bbox_dim and h < min_bbox_dim:
-            continue
-        # a typical opening glyph is rectangular and small (<200 px)
-        if w > 10 and h > 10 and w < 400 and h < 400:
-            cx = x + w/2
-            cy = y + h/2
-            # find nearest edge
-            best = None
-            for (idx, a, b) in edges:
-                (projx, projy), t = project_point_to_segment(cx, cy, a[0], a[1], b[0], b[1])
-                dist = math.hypot(projx - cx, projy - cy)
-                if best is None or dist < best[0]:
-                    best = (dist, idx, t, (a,b))
-            if best and best[0] < 40:  # within 40 px of edge
-                # convert width to meters if scale exists (use larger bbox dimension)
-                width_px = max(w, h)
-                width_m = (width_px * px_to_mm / 1000.0) if px_to_mm else None
-                openings.append({
-                    "bbox_px": [int(x), int(y), int(w), int(h)],
-                    "wall_idx": int(best[1]),
-                    "t_on_edge": float(best[2]),
-                    "width_m": round(width_m,3) if width_m else None,
-                    "center_px": [int(cx), int(cy)]
-                })
+    # Bounding boxes of all contours, then size filter for potential door/window glyphs
+    boxes = contour_bboxes(contours_all)
+    x, y, w, h = boxes.T
+    # a typical opening glyph is rectangular and small (<200 px); the first test is the
+    # original min_bbox_dim pre-filter
+    keep = ~((w < min_bbox_dim) & (h < min_bbox_dim)) & (w > 10) & (h > 10) & (w < 400) & (h < 400)
+    cand = np.nonzero(keep)[0]
+    if len(cand) == 0:
+        return openings
+    cx = x[cand] + w[cand] / 2
+    cy = y[cand] + h[cand] / 2
+    # find nearest edge for all candidates in one pass
+    dist, edge_idx, t_on_edge = nearest_edges(cx, cy, wall_poly)
+    for k in np.nonzero(dist < 40)[0]:  # within 40 px of edge
+        i = cand[k]
+        # convert width to meters if scale exists (use larger bbox dimension)
+        width_px = max(w[i], h[i])
+        width_m = (width_px * px_to_mm / 1000.0) if px_to_mm else None
+        openings.append({
+            "bbox_px": [int(x[i]), int(y[i]), int(w[i]), int(h[i])],
+            "wall_idx": int(edge_idx[k]),
+            "t_on_edge": float(t_on_edge[k]),
+            "width_m": round(width_m,3) if width_m else None,
+            "center_px": [int(cx[k]), int(cy[k])]
+        })
     return openings
 
 def poly_px_to_meters(poly_px, px_to_mm):
@@ -145,63 +346,111 @@ def save_json(out_path, data):
     with open(out_path, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
 
-def svg_from_json(json_data, out_svg_path, image_path=None):
-    """Render a simple SVG floorplan from JSON structure."""
+SVG_RASTER_MODES = ("link", "embed", "none")
+EXTRAS = ("wall_graph", "rooms")  # optional scene parts, off by default (they cost a whole-plan pass each)
+SVG_EMBED_MAX_SIDE = 1024   # px, longer side of the embedded background raster
+SVG_EMBED_QUALITY = 80      # JPEG quality of the embedded background raster
+
+def _svg_num(v):
+    return f"{v:.1f}".rstrip("0").rstrip(".") if isinstance(v, float) else str(v)
+
+def embedded_raster_href(cv_img, max_side=SVG_EMBED_MAX_SIDE, quality=SVG_EMBED_QUALITY):
+    """data: URI of a JPEG copy of cv_img, downscaled to max_side (the SVG stretches it to the canvas)."""
+    scale = min(1.0, max_side / max(cv_img.shape[:2]))
+    if scale < 1:
+        cv_img = cv2.resize(cv_img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    ok, buf = cv2.imencode(".jpg", cv_img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("Cannot encode the SVG background raster")
+    return "data:image/jpeg;base64," + base64.b64encode(buf.tobytes()).decode("ascii")
+
+def svg_from_json(json_data, out_svg_path, image_path=None, image_href=None):
+    """Render a simple SVG floorplan from JSON structure.
+
+    Streams to out_svg_path; walls, wall-graph edges, rooms and openings are one <path> each.
+    image_href (e.g. embedded_raster_href) takes precedence over linking image_path.
+    """
     # Compute canvas size from original image if present
     w = json_data.get("image_size_px", {}).get("width_px", 1000)
     h = json_data.get("image_size_px", {}).get("height_px", 1000)
     walls = json_data.get("walls_px") or []
     openings = json_data.get("openings") or []
+    graph = json_data.get("wall_graph") or {}
+    plan_rooms = json_data.get("rooms") or []
     scale_text = f"scale: {json_data.get('scale_info', {}).get('px_to_mm')} px->mm" if json_data.get('scale_info') else ""
-    # Build SVG
-    svg = []
-    svg.append(f'<svg xmlns="http://www.w3.org/2000/svg" width="{w}" height="{h}" viewBox="0 0 {w} {h}">')
-    if image_path:
-        svg.append(f'<image href="file://{image_path}" x="0" y="0" width="{w}" height="{h}" opacity="0.3"/>')
-    # draw walls polygon
-    for wall in walls:
-        pts = wall.get("polyline_px")
-        if not pts:
-            continue
-        pts_str = " ".join([f'{x},{y}' for (x,y) in pts])
-        svg.append(f'<polyline points="{pts_str}" fill="none" stroke="#000" stroke-width="6" stroke-linejoin="round"/>')
-    # draw openings as small red rectangles / gaps
-    for op in openings:
-        bx,by,bw,bh = op.get("bbox_px", [0,0,0,0])
-        svg.append(f'<rect x="{bx}" y="{by}" width="{bw}" height="{bh}" fill="none" stroke="red" stroke-width="2"/>')
-        if op.get("width_m"):
-            svg.append(f'<text x="{bx+2}" y="{by+bh+12}" font-size="12" fill="red">{op["width_m"]}m</text>')
-    # annotate scale
-    svg.append(f'<text x="10" y="{h-10}" font-size="14" fill="#333">{scale_text}</text>')
-    svg.append('</svg>')
-    Path(out_svg_path).write_text("\n".join(svg), encoding="utf-8")
+    n = _svg_num
+    with open(out_svg_path, "w", encoding="utf-8") as f:
+        f.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{w}" height="{h}" viewBox="0 0 {w} {h}">\n')
+        if image_href is None and image_path:
+            image_href = f"file://{image_path}"
+        if image_href:
+            f.write(f'<image href="{image_href}" x="0" y="0" width="{w}" height="{h}" opacity="0.3" preserveAspectRatio="none"/>\n')
+        # walls polygon(s)
+        d = "".join("M" + "L".join(f"{n(x)},{n(y)}" for x, y in wall["polyline_px"])
+                    for wall in walls if wall.get("polyline_px"))
+        if d:
+            f.write(f'<path d="{d}" fill="none" stroke="#000" stroke-width="6" stroke-linejoin="round"/>\n')
+        # interior + exterior wall graph as thin centrelines
+        nodes = graph.get("nodes") or []
+        d = "".join("M{},{}L{},{}".format(*map(n, nodes[a]), *map(n, nodes[b]))
+                    for a, b in (edge["nodes"] for edge in graph.get("edges") or []))
+        if d:
+            f.write(f'<path d="{d}" fill="none" stroke="#06c" stroke-width="2"/>\n')
+        # room outlines, filled faintly, with their areas at the centroids
+        d = "".join("M" + "L".join(f"{n(x)},{n(y)}" for x, y in room["polygon_px"]) + "Z" for room in plan_rooms)
+        if d:
+            f.write(f'<path d="{d}" fill="#2a2" fill-opacity="0.08" stroke="#2a2" stroke-width="1"/>\n')
+            f.write('<g font-size="12" fill="#2a2" text-anchor="middle">')
+            for room in plan_rooms:
+                cx, cy = room["centroid_px"]
+                area = f'{room["area_m2"]} m²' if room.get("area_m2") is not None else f'{room["area_px"]} px²'
+                f.write(f'<text x="{n(cx)}" y="{n(cy)}">{area}</text>')
+            f.write('</g>\n')
+        # openings as red rectangles, widths as labels below them
+        boxes = [op.get("bbox_px", [0, 0, 0, 0]) for op in openings]
+        d = "".join(f"M{n(bx)},{n(by)}h{n(bw)}v{n(bh)}h-{n(bw)}Z" for bx, by, bw, bh in boxes)
+        if d:
+            f.write(f'<path d="{d}" fill="none" stroke="red" stroke-width="2"/>\n')
+        labels = [op for op in openings if op.get("width_m")]
+        if labels:
+            f.write('<g font-size="12" fill="red">')
+            for op in labels:
+                bx, by, bw, bh = op["bbox_px"]
+                f.write(f'<text x="{n(bx + 2)}" y="{n(by + bh + 12)}">{op["width_m"]}m</text>')
+            f.write('</g>\n')
+        # annotate scale
+        f.write(f'<text x="10" y="{h-10}" font-size="14" fill="#333">{scale_text}</text>\n')
+        f.write('</svg>\n')
     return out_svg_path
 
-def main():
-    p = argparse.ArgumentParser()
-    p.add_argument("--image", required=True, help="path to floorplan image (PNG/JPG)")
-    p.add_argument("--scale_mm", type=float, default=None, help="reference dimension in mm (optional). If provided, used to compute px->mm")
-    p.add_argument("--out", default="./plan_out", help="output directory")
-    args = p.parse_args()
+def load_plan_image(img_path, cache=None):
+    """Read and decode img_path once: (plan_image.PlanImage, content digest when a cache is used, else None).
 
-    img_path = Path(args.image)
-    out_dir = Path(args.out)
-    out_dir.mkdir(parents=True, exist_ok=True)
+    Raises RuntimeError if the image cannot be read.
+    """
+    return PlanImage.from_file(img_path, digest=cache is not None)
 
-    # Load image
-    cv_img = cv2.imread(str(img_path))
-    if cv_img is None:
-        raise SystemExit("Cannot open image: " + str(img_path))
-    h_img, w_img = cv_img.shape[:2]
+def plan_numbers(image, digest=None, cache=None, ocr_mode="full", ocr_threads=1):
+    """OCR numeric tokens of a PlanImage for auto-scaling (see parse_plan for ocr_mode).
 
-    # OCR: try to find numeric tokens for auto-scaling
-    pil = Image.open(str(img_path)).convert("RGB")
-    nums = ocr_numbers(pil)
+    Full-page OCR drops the PIL copy it needs afterwards; the gray view of --ocr regions stays
+    for plan_mask.
+    """
+    if ocr_mode == "regions":
+        nums, _ = cached(cache, "ocr_regions", (digest, region_ocr.DIGIT_LANG, region_ocr.REGION_DEFAULTS),
+                         lambda: region_ocr.ocr_number_regions(image.gray(), threads=ocr_threads))
+    else:
+        nums, _ = cached(cache, "ocr", (digest, OCR_LANG), lambda: ocr_numbers(image.pil()))
+        image.release("pil")
+    return nums
+
+def plan_scale(nums, scale_mm=None):
+    """(px_to_mm, scale_value_mm) from the OCR tokens; px_to_mm is None when no scale is found."""
     px_to_mm = None
     scale_used = None
-    if args.scale_mm:
+    if scale_mm:
         # user-provided scale: use it relative to the largest horizontal numeric bbox width or ask to supply pixel segment later
-        scale_used = float(args.scale_mm)
+        scale_used = float(scale_mm)
         # find the numeric with largest bbox width (heuristic)
         if nums:
             largest = max(nums, key=lambda n: n['bbox'][2])
@@ -219,20 +468,69 @@ def main():
                 px_ref = largest['bbox'][2]
                 if px_ref > 0:
                     px_to_mm = scale_used / px_ref
+    return px_to_mm, scale_used
 
-    # Preprocess and contour detection
-    bin_img = image_preprocess_for_contours(cv_img)
-    big_contours = find_main_contours(bin_img, min_area_ratio=0.002)
-    walls_poly_px = None
-    if big_contours:
-        # take largest external contour and approximate polygon
-        main_cnt = big_contours[0]
-        poly = approx_polygon_from_contour(main_cnt, epsilon_factor=0.01)
-        walls_poly_px = poly
+def uses_pyramid(cv_img, pyramid):
+    """True if pyramid outline detection applies to this image (see parse_plan)."""
+    return bool(pyramid and pyramid < 1 and min(cv_img.shape[:2]) * pyramid >= PYRAMID_MIN_SIDE)
+
+def plan_mask(cv_img, digest=None, cache=None, preprocess_params=None, tile_size=0, tile_threads=None, profiler=None):
+    """Binary plan mask and its cache key (None without a cache); cv_img may be BGR or gray."""
+    prep = dict(PREPROCESS_DEFAULTS, **(preprocess_params or {}))
+    if tile_size and max(cv_img.shape[:2]) > tile_size:
+        preprocess = lambda: image_preprocess_tiled(cv_img, tile_size=tile_size, threads=tile_threads, **prep)
+    else:
+        preprocess = lambda: image_preprocess_for_contours(cv_img, **prep)
+    # tiled and whole-image masks are identical, so they share a cache key
+    with profiled(profiler, "preprocess"):
+        return cached(cache, "preprocess", (digest, prep), preprocess)
+
+def plan_rooms(bin_img, bin_key=None, px_to_mm=None, cache=None, profiler=None):
+    """rooms.segment_rooms of a plan mask, with the door gap and room size from the scale when it is known."""
+    params = rooms.room_params(px_to_mm, **rooms.ROOM_MM_DEFAULTS)
+    with profiled(profiler, "rooms"):
+        return cached(cache, "rooms", (bin_key, params), lambda: rooms.segment_rooms(bin_img, **params))[0]
+
+def plan_geometry(bin_img, bin_key=None, cache=None, profiler=None, extras=(), px_to_mm=None):
+    """(outer outline, packed contours, wall graph, rooms) of a plan mask; the last two are None unless in extras."""
+    with profiled(profiler, "outline"):
+        walls_poly_px = main_outline(bin_img, **OUTLINE_DEFAULTS)
     # Also get all contours to search openings
-    all_contours, _ = cv2.findContours(bin_img, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+    with profiled(profiler, "contours_list"):
+        packed, _ = cached(cache, "contours_list", (bin_key,),
+                           lambda: pack_contours(cv2.findContours(bin_img, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)[0]))
+    graph = None
+    if "wall_graph" in extras:
+        with profiled(profiler, "wall_graph"):
+            graph, _ = cached(cache, "wall_graph", (bin_key, wall_graph.WALL_GRAPH_DEFAULTS),
+                              lambda: wall_graph.build_wall_graph(bin_img, **wall_graph.WALL_GRAPH_DEFAULTS))
+    found = plan_rooms(bin_img, bin_key, px_to_mm, cache, profiler) if "rooms" in extras else None
+    return walls_poly_px, packed, graph, found
 
-    openings = detect_openings_from_small_contours(all_contours, walls_poly_px or [], px_to_mm=px_to_mm)
+def plan_geometry_pyramid(cv_img, pyramid, digest=None, cache=None, preprocess_params=None, tile_threads=None,
+                          profiler=None):
+    """plan_geometry via coarse-to-fine outline detection: only a band along the outer wall is binarised, so
+    there is no whole-plan mask for the wall graph or rooms."""
+    prep = dict(PREPROCESS_DEFAULTS, **(preprocess_params or {}))
+    def outline():
+        poly, contours = detect_outline_pyramid(cv_img, scale=pyramid, threads=tile_threads, **prep)
+        return poly, pack_contours(contours)
+    with profiled(profiler, "outline_pyramid"):
+        (walls_poly_px, packed), _ = cached(cache, "outline_pyramid", (digest, prep, pyramid), outline)
+    return [tuple(p) for p in walls_poly_px] if walls_poly_px else None, packed, None, None
+
+def build_scene(img_path, image_size, nums, scale, geometry, profiler=None):
+    """Scene dict of one plan from its OCR tokens, plan_scale() result and plan_geometry() result.
+
+    image_size: (height, width) in pixels.
+    """
+    img_path = Path(img_path)
+    h_img, w_img = image_size
+    px_to_mm, scale_used = scale
+    walls_poly_px, packed, graph, plan_rooms = geometry
+    with profiled(profiler, "openings"):
+        all_contours = unpack_contours(*packed)
+        openings = detect_openings_from_small_contours(all_contours, walls_poly_px or [], px_to_mm=px_to_mm)
 
     # Build JSON
     scene = {
@@ -254,22 +552,585 @@ def main():
         scene["walls_m"] = None
         if px_to_mm:
             scene["walls_m"] = [{"id": "outer", "polyline_m": poly_px_to_meters(walls_poly_px, px_to_mm)}]
+    if graph is not None:
+        # copies: the graph may be the cache's own object
+        graph = {"nodes": graph["nodes"],
+                 "edges": [dict(edge, length_m=round(edge["length_px"] * px_to_mm / 1000.0, 3) if px_to_mm else None)
+                           for edge in graph["edges"]]}
+    scene["wall_graph"] = graph
+    if plan_rooms is not None:
+        # copies as well; areas scale with the square of px_to_mm
+        area_scale = (px_to_mm / 1000.0) ** 2 if px_to_mm else None
+        plan_rooms = [dict(room, polygon_m=poly_px_to_meters(room["polygon_px"], px_to_mm),
+                           area_m2=round(room["area_px"] * area_scale, 2) if area_scale else None)
+                      for room in plan_rooms]
+    scene["rooms"] = plan_rooms
     scene["openings"] = openings
+    return scene
 
-    # Save JSON
-    out_json = out_dir / "parsed_plan.json"
-    save_json(out_json, scene)
+def write_scene(scene, out_dir, img_path, cv_img=None, out_format="json", svg_raster="link", profiler=None):
+    """Write parsed_plan.svg and parsed_plan.<out_format> (none if out_format is None).
 
-    # Create SVG (overlay)
+    cv_img is only needed for svg_raster="embed". Returns (out_json, out_svg).
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    # Create SVG (overlay) first, so its timing can go into the JSON
     out_svg = out_dir / "parsed_plan.svg"
-    svg_from_json(scene, out_svg, image_path=str(img_path))
+    with profiled(profiler, "svg"):
+        svg_from_json(scene, out_svg, image_path=str(img_path) if svg_raster == "link" else None,
+                      image_href=embedded_raster_href(cv_img) if svg_raster == "embed" else None)
+
+    # Save JSON
+    if profiler is not None:
+        scene["meta"]["profile"] = profiler.as_dict()
+    out_json = write_plan(out_dir / "parsed_plan", scene, out_format) if out_format else None
+    return out_json, out_svg
+
+def reuse_params(scale_mm=None, ocr_mode="full", pyramid=None, preprocess_params=None, extras=()):
+    """Parse settings that change the plan; plan index entries only match under the same ones."""
+    return {"scale_mm": scale_mm, "ocr": ocr_mode, "pyramid": pyramid,
+            "preprocess": dict(PREPROCESS_DEFAULTS, **(preprocess_params or {})), "extras": sorted(extras)}
+
+def check_extras(extras):
+    """Raise ValueError for names not in EXTRAS."""
+    unknown = set(extras) - set(EXTRAS)
+    if unknown:
+        raise ValueError(f"Unknown extras {', '.join(sorted(unknown))}; expected some of {', '.join(EXTRAS)}")
+
+def reused_scene(hit, img_path):
+    """Scene of a plan_index match, retitled for img_path, with meta.reused_from naming the plan it came from."""
+    img_path = Path(img_path)
+    scene = hit["scene"]
+    entry = hit["entry"]
+    scene["meta"].pop("profile", None)
+    scene["meta"].update(title=img_path.stem, source_image=str(img_path),
+                         reused_from={"image": entry["image"], "plan": entry["plan"], "line": entry["line"],
+                                      "distance": hit["distance"], "probe_diff": hit["probe_diff"]})
+    return scene
+
+def find_reusable(image, img_path, index, params, max_distance=INDEX_DEFAULTS["max_distance"], exclude=()):
+    """(reused scene or None, plan hash) of a PlanImage looked up in a plan_index.PlanIndex (exclude: see match)."""
+    h = plan_hash(image.gray())
+    hit = index.match(h, image.gray(), params, max_distance=max_distance, exclude=exclude)
+    return (reused_scene(hit, img_path) if hit else None), h
+
+@functools.lru_cache(maxsize=4)
+def _open_index(path, mtime_ns):
+    # batch workers: one index per process, reloaded only if the file changes
+    return PlanIndex.open(path)
+
+def open_index(path):
+    path = Path(path)
+    return _open_index(str(path), path.stat().st_mtime_ns if path.exists() else None)
+
+def parse_plan(img_path, out_dir, scale_mm=None, cache=None, preprocess_params=None, ocr_mode="full", ocr_threads=1,
+               tile_size=0, tile_threads=None, pyramid=None, profiler=None, out_format="json", svg_raster="link",
+               index=None, reuse_distance=INDEX_DEFAULTS["max_distance"], extras=(), reuse_exclude=()):
+    """Parse one floorplan image and write parsed_plan.json/.svg into out_dir.
+
+    cache: optional stage_cache.StageCache; OCR, preprocessing and contour stages are
+    looked up by image content hash + stage parameters before being computed.
+    preprocess_params: overrides for image_preprocess_for_contours (see PREPROCESS_DEFAULTS).
+    ocr_mode: "full" runs tesseract over the whole page; "regions" reads digits only inside
+    likely dimension-label regions (region_ocr.py), using ocr_threads threads.
+    tile_size: if set and the image is larger, preprocess in tile_size tiles on tile_threads threads.
+    pyramid: downscale factor (e.g. 0.25) for coarse-to-fine outline detection, see detect_outline_pyramid;
+    the wall graph needs the whole plan binarised and is skipped (None) in that mode.
+    extras: optional scene parts from EXTRAS to compute ("wall_graph", "rooms"); left out, they are None.
+    profiler: optional stage_profile.StageProfiler; per-stage timings are stored in meta.profile.
+    out_format: "json", "npz" or "jsonl" (see plan_format.py) for parsed_plan.<format>; None writes
+    no plan file (out_json is None) and leaves storing the returned scene to the caller.
+    svg_raster: background of parsed_plan.svg: "link" (file:// href to img_path), "embed" (downscaled
+    JPEG data URI, see SVG_EMBED_MAX_SIDE) or "none".
+    index: optional plan_index.PlanIndex. A verified near-duplicate (hash within reuse_distance,
+    same settings and size) has its stored plan written instead of being parsed, with
+    meta.reused_from. Either way the plan is added to index.added, and to the index itself if a
+    plan file was written. Saving the index is left to the caller. reuse_exclude: plan files
+    never reused (the outdated plans of a changed image).
+    Returns (scene, out_json, out_svg). Raises RuntimeError if the image cannot be read.
+
+    The steps are also available one by one (load_plan_image, plan_numbers, plan_scale, plan_mask,
+    plan_geometry / plan_geometry_pyramid, build_scene, write_scene) for plan_pipeline.py.
+    """
+    img_path = Path(img_path)
+    if svg_raster not in SVG_RASTER_MODES:
+        raise ValueError(f"Unknown SVG raster mode {svg_raster!r}; expected one of {', '.join(SVG_RASTER_MODES)}")
+    check_extras(extras)
+
+    with profiled(profiler, "load"):
+        image, digest = load_plan_image(img_path, cache)
+        cv_img = image.bgr()
+        Path(out_dir).mkdir(parents=True, exist_ok=True)
+
+    if index is not None:
+        params = reuse_params(scale_mm, ocr_mode, pyramid, preprocess_params, extras)
+        with profiled(profiler, "reuse_lookup"):
+            scene, h = find_reusable(image, img_path, index, params, reuse_distance, reuse_exclude)
+        if scene is not None:
+            out_json, out_svg = write_scene(scene, out_dir, img_path, cv_img, out_format, svg_raster, profiler)
+            # index the copy too: the entry then survives the original plan being overwritten or removed
+            index.add(index_entry(h, image.gray(), scene_outline(scene), params, img_path, out_json))
+            return scene, out_json, out_svg
+
+    # OCR: try to find numeric tokens for auto-scaling
+    with profiled(profiler, "ocr"):
+        nums = plan_numbers(image, digest, cache, ocr_mode=ocr_mode, ocr_threads=ocr_threads)
+    scale = plan_scale(nums, scale_mm)
+
+    # Preprocess and contour detection
+    if uses_pyramid(cv_img, pyramid):
+        # coarse-to-fine: full-resolution preprocessing only in tiles along the coarse outline (saves time;
+        # the band masks are still full-size, see detect_outline_pyramid)
+        geometry = plan_geometry_pyramid(cv_img, pyramid, digest, cache, preprocess_params, tile_threads, profiler)
+    else:
+        # the gray view is shared with --ocr regions
+        bin_img, bin_key = plan_mask(image.gray(), digest, cache, preprocess_params, tile_size, tile_threads, profiler)
+        if index is None:
+            image.release("gray")
+        geometry = plan_geometry(bin_img, bin_key, cache, profiler, extras, px_to_mm=scale[0])
+
+    scene = build_scene(img_path, cv_img.shape[:2], nums, scale, geometry, profiler)
+    out_json, out_svg = write_scene(scene, out_dir, img_path, cv_img, out_format, svg_raster, profiler)
+    if index is not None:
+        index.add(index_entry(h, image.gray(), geometry[0], params, img_path, out_json))
+    return scene, out_json, out_svg
+
+def open_cache(cache_dir, cache_max_mb):
+    return StageCache(cache_dir, max_bytes=int(cache_max_mb * 2**20)) if cache_dir else None
+
+def _batch_parse_one(img_path, out_dir, scale_mm, cache_dir=None, cache_max_mb=1024, ocr_mode="full", ocr_threads=1,
+                     tile_size=0, pyramid=None, profile=False, cprofile=False, out_format="json", svg_raster="link",
+                     tile_threads=1, index_path=None, reuse_distance=INDEX_DEFAULTS["max_distance"], extras=(),
+                     reuse_exclude=()):
+    """Worker entry point: never raises, returns a manifest record.
+
+    With out_format="jsonl" the plan is returned as a packed line in rec["plan_line"] for the
+    parent to append to the batch JSONL file. With index_path the plan index is consulted
+    (read-only: a fully parsed plan comes back as rec["index_entry"] for the parent to add).
+    """
+    t0 = time.perf_counter()
+    rec = {"image": str(img_path), "out_dir": str(out_dir)}
+    profiler = StageProfiler() if profile else None
+    try:
+        cache = open_cache(cache_dir, cache_max_mb)
+        index = open_index(index_path) if index_path else None
+        with cprofile_to(Path(out_dir) / "parsed_plan.prof" if cprofile else None):
+            scene, out_json, out_svg = parse_plan(img_path, out_dir, scale_mm=scale_mm, cache=cache,
+                                                  ocr_mode=ocr_mode, ocr_threads=ocr_threads,
+                                                  tile_size=tile_size, tile_threads=tile_threads, pyramid=pyramid,
+                                                  profiler=profiler,
+                                                  out_format=None if out_format == "jsonl" else out_format,
+                                                  svg_raster=svg_raster, index=index, reuse_distance=reuse_distance,
+                                                  extras=extras, reuse_exclude=reuse_exclude)
+        if out_format == "jsonl":
+            rec["plan_line"] = dumps_line(scene)
+        if index is not None and index.added:
+            rec["index_entry"] = index.added.pop()
+        if "reused_from" in scene["meta"]:
+            rec["reused_from"] = scene["meta"]["reused_from"]["image"]
+        rec.update({
+            "status": "ok",
+            "json": str(out_json) if out_json else None,
+            "svg": str(out_svg),
+            "px_to_mm": scene["scale_info"]["px_to_mm"],
+            "openings": len(scene["openings"]),
+        })
+    except Exception as e:
+        rec.update({"status": "error", "error": f"{type(e).__name__}: {e}"})
+    rec["seconds"] = round(time.perf_counter() - t0, 3)
+    if profiler is not None:
+        # partial for failed images: the stages that did run
+        rec["profile"] = profiler.as_dict()
+    return rec
+
+def collect_batch_inputs(input_dir, pattern):
+    """Return sorted image paths under input_dir matching a glob pattern (use '**/' to recurse)."""
+    return sorted(p for p in Path(input_dir).glob(pattern) if p.is_file())
+
+def batch_index(index_path, out_dir, jsonl_path=None):
+    """Plan index of a batch (default out_dir/plan_index.json), saved before the workers read it.
+
+    A batch .jsonl with indexed plans is about to be rewritten: it is kept as <name>.prev.jsonl
+    and its entries follow it (replacing those of an older .prev.jsonl), so a rerun can still
+    reuse them.
+    """
+    index = PlanIndex.open(index_path or Path(out_dir) / INDEX_NAME)
+    jsonl_path = Path(jsonl_path) if jsonl_path else None
+    if jsonl_path and jsonl_path.exists() and index.has_plan(jsonl_path):
+        prev = jsonl_path.with_suffix(".prev.jsonl")
+        index.drop_plan(prev)
+        os.replace(jsonl_path, prev)
+        index.move_plan(jsonl_path, prev)
+    index.save()
+    return index
+
+def add_to_index(index, rec, jsonl_line=None):
+    """Parent side of a batch: add a record's "index_entry" (its .jsonl line, if any, is known only here)."""
+    entry = rec.pop("index_entry", None)
+    if index is None or entry is None:
+        return
+    if jsonl_line is not None:
+        entry.update(plan=rec["jsonl"], line=jsonl_line)
+    if entry["plan"] is not None:
+        index.add(entry)
+
+def run_batch(input_dir, pattern, out_dir, scale_mm=None, workers=None, cache_dir=None, cache_max_mb=1024,
+              ocr_mode="full", ocr_threads=None, tile_size=0, pyramid=None, profile=False, cprofile=False,
+              out_format="json", svg_raster="link", reuse=False, index_path=None,
+              reuse_distance=INDEX_DEFAULTS["max_distance"], extras=()):
+    """Parse every matching image in a process pool; one output folder per image plus batch_manifest.json.
+
+    The pool size and the OpenCV / tesseract threads of each worker come from thread_plan.plan_threads
+    (workers and ocr_threads override it); the plan is printed and stored as "thread_plan".
+
+    profile: record per-stage timings for every image and add a per-stage histogram
+    (stage_profile.summarize) to the manifest as "profile_summary".
+    out_format="jsonl": plans are appended to out_dir/batch_plans.jsonl as they complete (the
+    manifest records each image's line number) instead of one plan file per image folder.
+    reuse: look every image up in the plan index (index_path, default out_dir/plan_index.json) and
+    reuse the plans of near-duplicates in it; fully parsed images are added and the index is saved
+    when the batch ends (workers see the index as it was at the start, plus their own parses).
+    """
+    input_dir = Path(input_dir)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    images = collect_batch_inputs(input_dir, pattern)
+    plan = plan_threads(len(images), workers, ocr=ocr_mode)
+    print(format_plan(plan))
+    t0 = time.perf_counter()
+    records = []
+    jsonl_path = out_dir / "batch_plans.jsonl" if out_format == "jsonl" else None
+    index = batch_index(index_path, out_dir, jsonl_path) if reuse else None
+    lines = 0
+    # the pool shuts down before the .jsonl closes, also when a worker record can't be written
+    with contextlib.ExitStack() as stack:
+        jsonl = stack.enter_context(open(jsonl_path, "w", encoding="utf-8")) if jsonl_path else None
+        pool = stack.enter_context(ProcessPoolExecutor(max_workers=plan["workers"], initializer=apply_thread_plan,
+                                                       initargs=(plan,)))
+        futs = {}
+        for img in images:
+            # mirror the input tree so equal stems in different folders don't collide
+            rel = img.relative_to(input_dir).with_suffix("")
+            futs[pool.submit(_batch_parse_one, img, out_dir / rel, scale_mm, cache_dir, cache_max_mb,
+                             ocr_mode, ocr_threads or plan["ocr_threads"], tile_size, pyramid, profile, cprofile,
+                             out_format, svg_raster, plan["tile_threads"],
+                             str(index.path) if index is not None else None,
+                             reuse_distance, extras)] = img
+        for fut in as_completed(futs):
+            rec = fut.result()
+            line = rec.pop("plan_line", None)
+            if line is not None:
+                # single writer: workers hand their line back, so no locking on the shared file
+                jsonl.write(line + "\n")
+                jsonl.flush()
+                rec.update({"jsonl": str(jsonl_path), "jsonl_line": lines})
+                lines += 1
+            add_to_index(index, rec, rec.get("jsonl_line"))
+            records.append(rec)
+            print(f"[{len(records)}/{len(images)}] {rec['status']:5s} {rec['image']} ({rec['seconds']}s)")
+    records.sort(key=lambda r: r["image"])
+    manifest = {
+        "input_dir": str(input_dir),
+        "pattern": pattern,
+        "workers": plan["workers"],
+        "thread_plan": plan,
+        "total": len(records),
+        "ok": sum(1 for r in records if r["status"] == "ok"),
+        "failed": sum(1 for r in records if r["status"] != "ok"),
+        "wall_seconds": round(time.perf_counter() - t0, 3),
+        "items": records,
+    }
+    if jsonl_path:
+        manifest["jsonl"] = str(jsonl_path)
+    if index is not None:
+        manifest["reused"] = sum(1 for r in records if "reused_from" in r)
+        manifest["plan_index"] = str(index.save())
+    if profile:
+        manifest["profile_summary"] = summarize(r.get("profile") for r in records)
+    manifest_path = out_dir / "batch_manifest.json"
+    save_json(manifest_path, manifest)
+    return manifest, manifest_path
+
+def _watch_parse_one(img_path, out_dir, **opts):
+    """watch_inputs worker: _batch_parse_one plus the files it wrote (--format jsonl: <out_dir>/parsed_plan.jsonl).
+
+    The image is new or changed, so its own earlier plans in out_dir are never reused (the index
+    the worker reads may not have dropped them yet).
+    """
+    own = [Path(out_dir) / f"parsed_plan.{fmt}" for fmt in FORMATS]
+    rec = _batch_parse_one(img_path, out_dir, reuse_exclude=own, **opts)
+    line = rec.pop("plan_line", None)
+    if line is not None:
+        jsonl_path = Path(out_dir) / "parsed_plan.jsonl"
+        try:
+            with open(jsonl_path, "w", encoding="utf-8") as f:
+                f.write(line + "\n")
+            rec["jsonl"] = str(jsonl_path)
+        except OSError as e:
+            rec.update({"status": "error", "error": f"{type(e).__name__}: {e}"})
+    rec["outputs"] = [p for p in (rec.get("json"), rec.get("jsonl"), rec.get("svg")) if p]
+    if opts.get("cprofile"):
+        rec["outputs"].append(str(Path(out_dir) / "parsed_plan.prof"))
+    return rec
+
+def watch_params(scale_mm=None, ocr_mode="full", pyramid=None, profile=False, cprofile=False, out_format="json",
+                 svg_raster="link", extras=()):
+    """Settings that change the outputs of a --watch run; inputs parsed under other ones are parsed again."""
+    params = dict(reuse_params(scale_mm, ocr_mode, pyramid, extras=extras), profile=profile, cprofile=cprofile,
+                  format=out_format, svg_raster=svg_raster, outline=OUTLINE_DEFAULTS)
+    if "wall_graph" in extras:
+        params["wall_graph"] = wall_graph.WALL_GRAPH_DEFAULTS
+    if "rooms" in extras:
+        params["rooms"] = dict(rooms.ROOM_DEFAULTS, **rooms.ROOM_MM_DEFAULTS)
+    return params
+
+def run_watch(input_dir, pattern, out_dir, scale_mm=None, workers=None, cache_dir=None, cache_max_mb=1024,
+              ocr_mode="full", ocr_threads=None, tile_size=0, pyramid=None, profile=False, cprofile=False,
+              out_format="json", svg_raster="link", reuse=False, index_path=None,
+              reuse_distance=INDEX_DEFAULTS["max_distance"], interval=WATCH_DEFAULTS["interval"],
+              settle=WATCH_DEFAULTS["settle"], once=False, extras=()):
+    """Watch mode: parse new and changed images under input_dir in a process pool as they appear.
+
+    Outputs go where run_batch puts them; <out_dir>/watch_manifest.json is the incremental state
+    (watch_inputs.py). Runs until interrupted, or one pass with once=True; returns the manifest.
+    reuse: as in run_batch; the index is saved after every pass that changed something, and the
+    entries of deleted images are dropped with their outputs, those of changed images before they
+    are parsed again (a changed image never reuses its own outdated plan).
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    # tasks arrive over time: plan for a full pool
+    plan = plan_threads(workers or usable_cores(), workers, ocr=ocr_mode)
+    print(format_plan(plan))
+    index = batch_index(index_path, out_dir) if reuse else None
+    worker = functools.partial(_watch_parse_one, scale_mm=scale_mm, cache_dir=cache_dir, cache_max_mb=cache_max_mb,
+                               ocr_mode=ocr_mode, ocr_threads=ocr_threads or plan["ocr_threads"], tile_size=tile_size,
+                               pyramid=pyramid, profile=profile, cprofile=cprofile, out_format=out_format,
+                               svg_raster=svg_raster, tile_threads=plan["tile_threads"],
+                               index_path=str(index.path) if index is not None else None,
+                               reuse_distance=reuse_distance, extras=extras)
+    params = watch_params(scale_mm, ocr_mode, pyramid, profile, cprofile, out_format, svg_raster, extras)
+
+    def on_record(rec):
+        add_to_index(index, rec, 0 if "jsonl" in rec else None)
+
+    def on_remove(item):
+        if index is not None:
+            for rel in item["outputs"]:
+                index.drop_plan(out_dir / rel)
+
+    def on_pass(stats):
+        if index is not None:
+            index.save()
+
+    return watch(input_dir, pattern, out_dir, worker, params, workers=plan["workers"], initializer=apply_thread_plan,
+                 initargs=(plan,), interval=interval, settle=settle, once=once, on_record=on_record,
+                 on_remove=on_remove, on_pass=on_pass)
+
+def main():
+    p = argparse.ArgumentParser()
+    src = p.add_mutually_exclusive_group(required=True)
+    src.add_argument("--image", help="path to floorplan image (PNG/JPG)")
+    src.add_argument("--input-dir", help="batch mode: parse every image in this folder")
+    src.add_argument("--serve", metavar="ADDR",
+                     help='run a parse server on "host:port" or "unix:/path.sock" (see plan_server.py)')
+    p.add_argument("--server", metavar="ADDR", help="send --image to a running --serve instance instead of parsing here")
+    p.add_argument("--glob", default="*.png", help="batch mode: file pattern inside --input-dir (e.g. '**/*.png')")
+    p.add_argument("--workers", type=int, default=None,
+                   help="batch mode: worker processes; --serve: worker threads (default: one per core, see thread_plan.py)")
+    p.add_argument("--pipeline", action="store_true",
+                   help="batch mode: run the parse stages as an in-process asyncio pipeline instead of one process per image")
+    p.add_argument("--stage-workers", default="",
+                   help='--pipeline: workers per stage, e.g. "load=2,preprocess=4,contours=4,ocr=2,write=2" '
+                        "(default: the cores split by each stage's share of the work, see thread_plan.py)")
+    p.add_argument("--queue-size", type=int, default=2, help="--pipeline: plans waiting in front of each stage (backpressure)")
+    p.add_argument("--watch", action="store_true",
+                   help="batch mode: keep watching --input-dir and parse only new or changed images (incremental "
+                        "<out>/watch_manifest.json; outputs of deleted images are removed; a restart resumes)")
+    p.add_argument("--once", action="store_true", help="--watch: one incremental pass, then exit")
+    p.add_argument("--interval", type=float, default=WATCH_DEFAULTS["interval"], help="--watch: seconds between scans")
+    p.add_argument("--settle", type=float, default=WATCH_DEFAULTS["settle"],
+                   help="--watch: images modified less than this many seconds ago may still be copied; they wait")
+    p.add_argument("--scale_mm", type=float, default=None, help="reference dimension in mm (optional). If provided, used to compute px->mm")
+    p.add_argument("--out", default="./plan_out",
+                   help="output directory (--serve: requests may only write inside it)")
+    p.add_argument("--cache-dir", default=None, help="reuse OCR/preprocessing/contour results stored here across runs")
+    p.add_argument("--cache-max-mb", type=float, default=1024, help="size limit of --cache-dir; least recently used entries are evicted")
+    p.add_argument("--ocr", choices=["full", "regions"], default="full",
+                   help="full: whole-page tesseract (rus+eng); regions: digits-only OCR of likely dimension labels (faster)")
+    p.add_argument("--ocr-threads", type=int, default=None,
+                   help="--ocr regions: recognise label regions in this many threads (default: from the thread plan)")
+    p.add_argument("--tile-size", type=int, default=0,
+                   help="preprocess images larger than this in overlapping tiles of this size (bounded memory); 0 = off")
+    p.add_argument("--tile-threads", type=int, default=None, help="threads for tiled preprocessing (default: from the thread plan)")
+    p.add_argument("--pyramid", type=float, default=None,
+                   help="coarse-to-fine outline detection at this downscale (e.g. 0.25); full-res work only near the walls")
+    p.add_argument("--wall-graph", dest="extras", action="append_const", const="wall_graph", default=[],
+                   help="also build the graph of all walls, interior ones too (see wall_graph.py)")
+    p.add_argument("--rooms", dest="extras", action="append_const", const="rooms", default=[],
+                   help="also segment the rooms (polygons and areas, see rooms.py); one more whole-plan pass")
+    p.add_argument("--profile", action="store_true",
+                   help="record wall/CPU time and peak RSS per stage in meta.profile (batch: per-stage histogram in the manifest)")
+    p.add_argument("--cprofile", action="store_true",
+                   help="also dump a cProfile of each parse to parsed_plan.prof (view with snakeviz, flameprof for a flamegraph)")
+    p.add_argument("--format", choices=FORMATS, default="json",
+                   help="plan output: json (pretty), npz (packed arrays) or jsonl (one compact line per plan; "
+                        "batch mode streams all plans into batch_plans.jsonl)")
+    p.add_argument("--reuse", action="store_true",
+                   help="reuse the stored plan of a near-duplicate image parsed before (perceptual-hash index, "
+                        "see plan_index.py) instead of parsing it; parsed images are added to the index")
+    p.add_argument("--index", default=None, help=f"--reuse: plan index file (default: <out>/{INDEX_NAME})")
+    p.add_argument("--reuse-distance", type=int, default=INDEX_DEFAULTS["max_distance"],
+                   help="--reuse: largest Hamming distance (of 256 hash bits) of a reuse candidate")
+    p.add_argument("--svg-raster", choices=SVG_RASTER_MODES, default="link",
+                   help="parsed_plan.svg background: link the image (file://), embed a downscaled JPEG "
+                        f"(longer side {SVG_EMBED_MAX_SIDE} px; self-contained, portable) or none")
+    args = p.parse_args()
+    if args.server and not args.image:
+        p.error("--server needs --image")
+    if args.pipeline and not args.input_dir:
+        p.error("--pipeline needs --input-dir")
+    if args.watch and (not args.input_dir or args.pipeline):
+        p.error("--watch needs --input-dir (and runs a process pool, not --pipeline)")
+    if args.once and not args.watch:
+        p.error("--once needs --watch")
+    if args.index and not args.reuse:
+        p.error("--index needs --reuse")
+    if args.reuse and (args.serve or args.server):
+        p.error("--reuse works on local parses (--image / --input-dir)")
+    if args.pipeline and (args.profile or args.cprofile):
+        p.error("--profile/--cprofile measure the whole process and can't be used with --pipeline "
+                "(its manifest has per-stage busy times)")
+
+    if args.serve:
+        from plan_server import serve
+        return serve(args.serve, workers=args.workers, cache=open_cache(args.cache_dir, args.cache_max_mb),
+                     defaults={"scale_mm": args.scale_mm, "ocr": args.ocr, "ocr_threads": args.ocr_threads,
+                               "tile_size": args.tile_size, "tile_threads": args.tile_threads,
+                               "pyramid": args.pyramid, "profile": args.profile, "format": args.format,
+                               "svg_raster": args.svg_raster, "extras": tuple(args.extras)},
+                     out_root=args.out)
+
+    if args.server:
+        from plan_server import request_parse
+        try:
+            status, resp = request_parse(args.server, args.image, args.out, scale_mm=args.scale_mm, ocr=args.ocr,
+                                         ocr_threads=args.ocr_threads, tile_size=args.tile_size,
+                                         tile_threads=args.tile_threads, pyramid=args.pyramid, profile=args.profile,
+                                         format=args.format, svg_raster=args.svg_raster,
+                                         extras=args.extras or None)
+        except OSError as e:
+            raise SystemExit(f"Cannot reach parse server {args.server}: {e}")
+        if resp.get("status") != "ok":
+            raise SystemExit(resp.get("error", f"server returned HTTP {status}"))
+        if "profile" in resp:
+            print(format_summary(summarize([resp["profile"]])))
+        print("Saved JSON:", resp["json"])
+        print("Saved SVG:", resp["svg"])
+        print(f"Parsed on {args.server} in {resp['seconds']}s.")
+        return 0
+
+    if args.watch:
+        try:
+            manifest = run_watch(args.input_dir, args.glob, args.out, scale_mm=args.scale_mm, workers=args.workers,
+                                 cache_dir=args.cache_dir, cache_max_mb=args.cache_max_mb, ocr_mode=args.ocr,
+                                 ocr_threads=args.ocr_threads, tile_size=args.tile_size, pyramid=args.pyramid,
+                                 profile=args.profile, cprofile=args.cprofile, out_format=args.format,
+                                 svg_raster=args.svg_raster, reuse=args.reuse, index_path=args.index,
+                                 reuse_distance=args.reuse_distance, interval=args.interval, settle=args.settle,
+                                 once=args.once, extras=tuple(args.extras))
+        except ValueError as e:
+            raise SystemExit(str(e))
+        except KeyboardInterrupt:
+            print("Stopped; the watch manifest keeps every finished image.")
+            return 130
+        s = manifest.summary()
+        print(f"{s['inputs']} images tracked ({s['failed']} failed). Saved manifest: {manifest.path}")
+        return 1 if s["failed"] else 0
+
+    if args.input_dir and args.pipeline:
+        from plan_pipeline import parse_concurrency, run_pipeline_batch
+        try:
+            concurrency = parse_concurrency(args.stage_workers)
+        except ValueError as e:
+            p.error(str(e))
+        if args.workers:
+            # --workers sizes the CPU-bound stages unless they are set explicitly
+            concurrency = dict({"preprocess": args.workers, "contours": args.workers}, **concurrency)
+        manifest, manifest_path = run_pipeline_batch(args.input_dir, args.glob, args.out, scale_mm=args.scale_mm,
+                                                     cache_dir=args.cache_dir, cache_max_mb=args.cache_max_mb,
+                                                     ocr_mode=args.ocr, ocr_threads=args.ocr_threads,
+                                                     tile_size=args.tile_size, pyramid=args.pyramid,
+                                                     out_format=args.format, svg_raster=args.svg_raster,
+                                                     concurrency=concurrency, queue_size=max(1, args.queue_size),
+                                                     reuse=args.reuse, index_path=args.index,
+                                                     reuse_distance=args.reuse_distance, extras=tuple(args.extras))
+        busy = ", ".join(f"{k} {v}s" for k, v in manifest["pipeline"]["busy_seconds"].items())
+        reused = f", {manifest['reused']} reused" if "reused" in manifest else ""
+        print(f"Parsed {manifest['ok']}/{manifest['total']} images{reused} in {manifest['wall_seconds']}s "
+              f"(stage busy: {busy}).")
+        if "jsonl" in manifest:
+            print("Saved plans:", manifest["jsonl"])
+        print("Saved manifest:", manifest_path)
+        return 1 if manifest["failed"] else 0
+
+    if args.input_dir:
+        manifest, manifest_path = run_batch(args.input_dir, args.glob, args.out,
+                                            scale_mm=args.scale_mm, workers=args.workers,
+                                            cache_dir=args.cache_dir, cache_max_mb=args.cache_max_mb,
+                                            ocr_mode=args.ocr, ocr_threads=args.ocr_threads,
+                                            tile_size=args.tile_size, pyramid=args.pyramid,
+                                            profile=args.profile, cprofile=args.cprofile, out_format=args.format,
+                                            svg_raster=args.svg_raster, reuse=args.reuse, index_path=args.index,
+                                            reuse_distance=args.reuse_distance, extras=tuple(args.extras))
+        if args.profile:
+            print(format_summary(manifest["profile_summary"]))
+        reused = f", {manifest['reused']} reused" if "reused" in manifest else ""
+        print(f"Parsed {manifest['ok']}/{manifest['total']} images{reused} in {manifest['wall_seconds']}s "
+              f"({manifest['workers']} workers).")
+        if "jsonl" in manifest:
+            print("Saved plans:", manifest["jsonl"])
+        print("Saved manifest:", manifest_path)
+        return 1 if manifest["failed"] else 0
+
+    # one image: all cores go to its OpenCV / tesseract threads
+    plan = plan_threads(1, ocr=args.ocr)
+    apply_thread_plan(plan)
+    profiler = StageProfiler() if args.profile else None
+    try:
+        index = PlanIndex.open(args.index or Path(args.out) / INDEX_NAME) if args.reuse else None
+    except ValueError as e:
+        raise SystemExit(str(e))
+    try:
+        with cprofile_to(Path(args.out) / "parsed_plan.prof" if args.cprofile else None):
+            scene, out_json, out_svg = parse_plan(args.image, args.out, scale_mm=args.scale_mm,
+                                                  cache=open_cache(args.cache_dir, args.cache_max_mb),
+                                                  ocr_mode=args.ocr, ocr_threads=args.ocr_threads or plan["ocr_threads"],
+                                                  tile_size=args.tile_size,
+                                                  tile_threads=args.tile_threads or plan["tile_threads"],
+                                                  pyramid=args.pyramid, profiler=profiler, out_format=args.format,
+                                                  svg_raster=args.svg_raster, index=index,
+                                                  reuse_distance=args.reuse_distance, extras=tuple(args.extras))
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+    if index is not None and index.added:
+        print("Added to plan index:", index.save())
+    if profiler is not None:
+        print(format_summary(summarize([scene["meta"]["profile"]])))
+    px_to_mm = scene["scale_info"]["px_to_mm"]
+    scale_used = scene["scale_info"]["scale_value_mm"]
 
     print("Saved JSON:", out_json)
     print("Saved SVG:", out_svg)
+    reused = scene["meta"].get("reused_from")
+    if reused:
+        print(f"Reused the plan of {reused['image']} (hash distance {reused['distance']}); no parse needed.")
     if px_to_mm:
         print(f"Scale auto-detected: 1 px = {px_to_mm:.4f} mm  (reference {scale_used} mm).")
     else:
         print("No reliable scale detected. Provide --scale_mm <mm> referencing a numeric label on the image (e.g., 6250).")
+    return 0
 
 if __name__ == "__main__":
-    main()
+    raise SystemExit(main())
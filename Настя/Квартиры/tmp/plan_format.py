@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+plan_format.py
+
+Output formats for parse_floorplan.py and extract_upper_scheme.py results, and a reader
+that loads them with coordinates as NumPy arrays.
+
+    json   pretty-printed JSON (indent=2), the default; unchanged
+    npz    compressed NumPy container: every coordinate list is one packed array member,
+           the rest of the document is a small JSON skeleton ("scene" member)
+    jsonl  one compact JSON line per plan; coordinate lists are base64 packed arrays, so a
+           batch can stream lines into one file as results complete
+
+Packing rules (npz and jsonl):
+    - a list of equal-length numeric lists (polygon, bbox list, ...) becomes a 2-D array
+      (int32 when all values are integers, else float64, so values round-trip exactly)
+    - a non-empty list of dicts with identical keys (OCR tokens, openings, door arcs) is stored
+      column-wise: scalar and fixed-length columns become 1-D / 2-D arrays, others stay lists
+      (e.g. ragged polylines become a list of arrays)
+
+Usage:
+    from plan_format import load_plan, iter_plans, plan_polygons
+    plan = load_plan("plan_out/parsed_plan.npz")         # or .json
+    for poly in plan_polygons(plan):                       # (N, 2) arrays
+        ...
+    for plan in iter_plans("plan_out/batch_plans.jsonl"):  # one plan per line
+        ocr = plan["detected_numbers_ocr"]                 # {"text": [...], "bbox": (n, 4) array, "center": (n, 2) array}
+
+With columns=False the column-wise lists are turned back into lists of dicts (values still arrays).
+"""
+import base64
+import io
+import json
+from pathlib import Path
+
+from lazy_import import lazy_import
+
+np = lazy_import("numpy")
+
+FORMATS = ("json", "npz", "jsonl")
+SUFFIXES = {"json": ".json", "npz": ".npz", "jsonl": ".jsonl"}
+
+ARRAY_KEY = "__array__"
+COLUMNS_KEY = "__columns__"
+SCENE_MEMBER = "scene"
+
+
+def _as_array(seq, min_ndim, max_ndim=None):
+    """seq as a numeric ndarray with min_ndim..max_ndim dimensions, or None if it is not one."""
+    try:
+        arr = np.asarray(seq)
+    except ValueError:  # ragged
+        return None
+    if arr.size == 0 or arr.dtype.kind not in "iuf" or arr.ndim < min_ndim or (max_ndim and arr.ndim > max_ndim):
+        return None
+    if arr.dtype.kind in "iu" and -2**31 <= arr.min() and arr.max() < 2**31:
+        arr = arr.astype(np.int32)
+    return arr
+
+
+def pack(obj):
+    """Replace coordinate lists by ndarrays and uniform lists of dicts by {COLUMNS_KEY: {key: column}}."""
+    if isinstance(obj, dict):
+        return {k: pack(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        arr = _as_array(obj, 2)
+        if arr is not None:
+            return arr
+        if obj and all(isinstance(o, dict) and o for o in obj) and all(o.keys() == obj[0].keys() for o in obj):
+            return {COLUMNS_KEY: {k: _pack_column([o[k] for o in obj]) for k in obj[0]}}
+        return [pack(v) for v in obj]
+    return obj
+
+
+def _pack_column(values):
+    # scalars -> 1-D, fixed-length vectors -> 2-D; polylines and anything else stay per item
+    arr = _as_array(values, 1, 2)
+    return arr if arr is not None else pack(values)
+
+
+def _encode(obj, store):
+    """Replace ndarrays by {ARRAY_KEY: ...} markers produced by store(arr)."""
+    if isinstance(obj, dict):
+        return {k: _encode(v, store) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_encode(v, store) for v in obj]
+    if isinstance(obj, np.ndarray):
+        return store(obj)
+    return obj
+
+
+def _decode(obj, fetch, columns):
+    if isinstance(obj, dict):
+        if ARRAY_KEY in obj:
+            return fetch(obj)
+        if COLUMNS_KEY in obj:
+            cols = {k: _decode(v, fetch, columns) for k, v in obj[COLUMNS_KEY].items()}
+            if columns:
+                return cols
+            n = len(next(iter(cols.values())))
+            return [{k: v[i] for k, v in cols.items()} for i in range(n)]
+        return {k: _decode(v, fetch, columns) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_decode(v, fetch, columns) for v in obj]
+    return obj
+
+
+def _b64_array(arr):
+    arr = np.ascontiguousarray(arr)
+    return {ARRAY_KEY: arr.dtype.str, "shape": list(arr.shape), "data": base64.b64encode(arr.tobytes()).decode("ascii")}
+
+
+def _b64_fetch(marker):
+    return np.frombuffer(base64.b64decode(marker["data"]), dtype=marker[ARRAY_KEY]).reshape(marker["shape"])
+
+
+def dumps_line(data):
+    """One compact JSON line (no trailing newline) with packed coordinate arrays."""
+    return json.dumps(_encode(pack(data), _b64_array), ensure_ascii=False, separators=(",", ":"))
+
+
+def loads_line(line, columns=True):
+    return _decode(json.loads(line), _b64_fetch, columns)
+
+
+def write_plan(path_stem, data, fmt="json"):
+    """Write data as <path_stem>.json / .npz / .jsonl (single line); returns the path written."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown output format {fmt!r}; expected one of {', '.join(FORMATS)}")
+    path = Path(path_stem).with_suffix(SUFFIXES[fmt])
+    if fmt == "json":
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+    elif fmt == "jsonl":
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(dumps_line(data) + "\n")
+    else:
+        arrays = {}
+
+        def store(arr):
+            name = f"a{len(arrays)}"
+            arrays[name] = arr
+            return {ARRAY_KEY: name}
+
+        skeleton = json.dumps(_encode(pack(data), store), ensure_ascii=False, separators=(",", ":"))
+        # write through a buffer: np.savez_compressed appends ".npz" to names without it
+        buf = io.BytesIO()
+        np.savez_compressed(buf, **{SCENE_MEMBER: np.array(skeleton)}, **arrays)
+        path.write_bytes(buf.getvalue())
+    return path
+
+
+def load_plan(path, columns=True):
+    """Load one plan from .npz, .json or a single-line .jsonl file, with coordinates as ndarrays."""
+    path = Path(path)
+    if path.suffix == ".npz":
+        with np.load(path, allow_pickle=False) as z:
+            return _decode(json.loads(str(z[SCENE_MEMBER])), lambda m: z[m[ARRAY_KEY]], columns)
+    if path.suffix == ".jsonl":
+        with open(path, encoding="utf-8") as f:
+            return loads_line(f.readline(), columns)
+    # plain JSON has to build the per-point lists first; pack them like the other formats
+    with open(path, encoding="utf-8") as f:
+        return _decode(pack(json.load(f)), None, columns)
+
+
+def to_lists(obj):
+    """A loaded plan (columns=False) with its ndarrays turned back into lists, as parsed_plan.json holds them."""
+    if isinstance(obj, dict):
+        return {k: to_lists(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [to_lists(v) for v in obj]
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    return obj
+
+
+def iter_plans(path, columns=True):
+    """Yield every plan of a .jsonl file (one per line); .npz/.json files yield their single plan."""
+    path = Path(path)
+    if path.suffix != ".jsonl":
+        yield load_plan(path, columns)
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield loads_line(line, columns)
+
+
+def plan_polygons(plan):
+    """Outline polygons of a loaded plan as (N, 2) arrays.
+
+    parse_floorplan.py output: the walls_px polylines; extract_upper_scheme.py output: the
+    apartment outline in page pixels.
+    """
+    walls = plan.get("walls_px")
+    if isinstance(walls, dict):  # column-wise
+        return list(walls["polyline_px"])
+    if walls:
+        return [w["polyline_px"] for w in walls]
+    outline = plan.get("apartment_outline_page")
+    return [outline] if isinstance(outline, np.ndarray) else []
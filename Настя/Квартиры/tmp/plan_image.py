@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+plan_image.py
+
+Decode-once images for parse_floorplan.py and extract_upper_scheme.py.
+
+A PlanImage holds one uint8 pixel buffer (a decoded file, or the samples of a PyMuPDF pixmap
+used in place) and hands out the views the stages need:
+
+    image.bgr() / image.rgb()   ndarray in OpenCV / PIL channel order: the buffer itself when the
+                                order matches, otherwise one converted copy, kept for later calls
+    image.gray()                luminance, computed once and kept
+    image.pil()                 PIL image, one copy, kept (PIL stores RGB as 4 bytes per pixel and
+                                can't wrap a NumPy buffer, so this is never zero-copy)
+    image.crop(box)             PlanImage over a rectangle of the same buffer, no copy
+
+A plan file is read and decoded once and its digest is taken from the same bytes; OCR,
+preprocessing and the SVG background then share those pixels instead of decoding the file
+again or copying the page for each stage.
+
+Usage:
+    image, digest = PlanImage.from_file("plan.png", digest=True)   # one read: decode + SHA-256
+    image = PlanImage.from_pixmap(page.get_pixmap(matrix=m))      # zero-copy over the samples
+    crop = image.crop((x0, y0, x1, y1)); gray = crop.gray()
+"""
+import hashlib
+from pathlib import Path
+
+from lazy_import import lazy_import
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+Image = lazy_import("PIL.Image")
+
+ORDERS = ("RGB", "BGR")
+
+
+class _PixmapBuffer:
+    """Exposes a fitz.Pixmap's samples through the NumPy array interface.
+
+    NumPy keeps this object (and so the pixmap) as the base of every array made from it.
+    """
+
+    def __init__(self, pix):
+        self.pix = pix
+        self.__array_interface__ = {"version": 3, "typestr": "|u1", "shape": (pix.height, pix.width, pix.n),
+                                    "strides": (pix.stride, pix.n, 1), "data": (pix.samples_ptr, False)}
+
+
+def pixmap_array(pix):
+    """(height, width, n) uint8 array over pix's samples without copying; the array keeps pix alive."""
+    return np.asarray(_PixmapBuffer(pix))
+
+
+class PlanImage:
+    """One decoded image buffer with ndarray, gray and PIL views made on demand."""
+
+    def __init__(self, array, order="RGB"):
+        if order not in ORDERS:
+            raise ValueError(f"Unknown channel order {order!r}; expected one of {', '.join(ORDERS)}")
+        self.array = array
+        self.order = order
+        self._views = {}
+
+    @classmethod
+    def from_file(cls, path, digest=False):
+        """Read and decode path once; returns (image, SHA-256 of the file bytes if digest else None).
+
+        The digest equals stage_cache.file_digest(path). Raises RuntimeError if the file can't be
+        read or decoded.
+        """
+        try:
+            data = Path(path).read_bytes()
+        except OSError:
+            data = b""
+        array = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR) if data else None
+        if array is None:
+            raise RuntimeError("Cannot open image: " + str(path))
+        return cls(array, "BGR"), hashlib.sha256(data).hexdigest() if digest else None
+
+    @classmethod
+    def from_pixmap(cls, pix):
+        """Wrap an RGB fitz.Pixmap (alpha=False) without copying its samples."""
+        if pix.n != 3:
+            raise ValueError(f"Expected an RGB pixmap without alpha, got {pix.n} channels")
+        return cls(pixmap_array(pix), "RGB")
+
+    @classmethod
+    def wrap(cls, img, order="RGB"):
+        """PlanImage of a PlanImage (itself), an ndarray in `order`, or a PIL image (one copy)."""
+        if isinstance(img, cls):
+            return img
+        if isinstance(img, np.ndarray):
+            return cls(img, order)
+        rgb = img if img.mode == "RGB" else img.convert("RGB")
+        image = cls(np.asarray(rgb), "RGB")
+        image._views["pil"] = rgb
+        return image
+
+    @property
+    def height(self):
+        return self.array.shape[0]
+
+    @property
+    def width(self):
+        return self.array.shape[1]
+
+    @property
+    def size(self):
+        """(width, height), as PIL's Image.size."""
+        return self.array.shape[1], self.array.shape[0]
+
+    def _view(self, name, make):
+        view = self._views.get(name)
+        if view is None:
+            view = self._views[name] = make()
+        return view
+
+    def rgb(self):
+        if self.order == "RGB":
+            return self.array
+        return self._view("rgb", lambda: cv2.cvtColor(self.array, cv2.COLOR_BGR2RGB))
+
+    def bgr(self):
+        if self.order == "BGR":
+            return self.array
+        return self._view("bgr", lambda: cv2.cvtColor(self.array, cv2.COLOR_RGB2BGR))
+
+    def gray(self):
+        code = cv2.COLOR_RGB2GRAY if self.order == "RGB" else cv2.COLOR_BGR2GRAY
+        return self._view("gray", lambda: cv2.cvtColor(self.array, code))
+
+    def pil(self):
+        return self._view("pil", lambda: Image.fromarray(self.rgb()))
+
+    def crop(self, box):
+        """PlanImage over box = (x0, y0, x1, y1) of this buffer (a view: no pixels are copied)."""
+        x0, y0, x1, y1 = (int(v) for v in box)
+        return PlanImage(self.array[y0:y1, x0:x1], self.order)
+
+    def copy(self):
+        """PlanImage with its own buffer, e.g. a crop that must outlive a large page."""
+        return PlanImage(self.array.copy(), self.order)
+
+    def release(self, *names):
+        """Drop kept conversions ("gray", "pil", "rgb", "bgr"; all if none given); the buffer stays."""
+        for name in names or list(self._views):
+            self._views.pop(name, None)
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+plan_index.py
+
+Perceptual-hash index of parsed plans for parse_floorplan.py --reuse: the same typical layout
+comes back for many buildings and brochure pages, and a near-duplicate input can take the plan
+of an earlier parse instead of running OCR and contour detection again.
+
+    plan_hash(gray)     256-bit difference hash (dHash) of the plan shrunk to 17x16: unchanged by
+                        re-encoding, small tone shifts and resampling, while another layout flips
+                        dozens of bits
+    BKTree              metric tree over Hamming distance: a search within distance d only
+                        descends into children whose edge distance lies in [k - d, k + d]
+    PlanIndex           plan_index.json next to the outputs: one entry per fully parsed plan
+                        (hash, pixel size, parse parameters, where the plan was written and a
+                        wall probe); the tree is rebuilt on open
+
+A hash match is only a candidate. The stored plan is reused if it was parsed with the same
+parameters at the same pixel size and its wall probe agrees: the gray levels sampled along its
+outer wall outline in the new image may differ from those of the original image by at most
+max_probe_diff on average. Coordinates are pixels, so an input that is shifted or rescaled fails
+this check and gets a full parse, which is then added to the index.
+
+Usage:
+    index = PlanIndex.open("plan_out/plan_index.json")
+    hit = index.match(plan_hash(gray), gray, params)        # {"entry", "scene", "distance", "probe_diff"} or None
+    index.add(index_entry(plan_hash(gray), gray, outline, params, "plan.png", "plan_out/parsed_plan.json"))
+    index.save()
+
+    python plan_index.py plan_out/plan_index.json [--image new.png] [--max-distance 24]
+"""
+import argparse
+import base64
+import itertools
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+from lazy_import import lazy_import
+from plan_format import load_plan, loads_line, to_lists
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+HASH_SIZE = 16          # hash bits = HASH_SIZE ** 2
+PROBE_SAMPLES = 256     # gray levels sampled along the outer outline
+INDEX_DEFAULTS = {"max_distance": 24, "max_probe_diff": 12.0}
+INDEX_NAME = "plan_index.json"
+INDEX_VERSION = 1
+
+
+def plan_hash(gray, hash_size=HASH_SIZE):
+    """dHash of a gray image as an int: bit i is set where a pixel of the shrunk image is brighter than its right neighbour."""
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = np.packbits(small[:, 1:] > small[:, :-1])
+    return int.from_bytes(bits.tobytes(), "big")
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def probe_points(outline, samples=PROBE_SAMPLES):
+    """`samples` points evenly spaced along a closed polyline, (samples, 2) float array."""
+    a = np.asarray(outline, dtype=np.float64).reshape(-1, 2)
+    b = np.roll(a, -1, axis=0)
+    lengths = np.hypot(*(b - a).T)
+    ends = np.concatenate([[0.0], np.cumsum(lengths)])
+    at = (np.arange(samples) + 0.5) * ends[-1] / samples
+    seg = np.clip(np.searchsorted(ends, at, side="right") - 1, 0, len(a) - 1)
+    t = (at - ends[seg]) / np.maximum(lengths[seg], 1e-9)
+    return a[seg] + (b - a)[seg] * t[:, None]
+
+
+def wall_probe(gray, outline, samples=PROBE_SAMPLES):
+    """uint8 gray levels (3x3 mean) at probe_points(outline); None without an outline."""
+    if outline is None or len(outline) < 2:
+        return None
+    pts = probe_points(outline, samples)
+    h, w = gray.shape[:2]
+    x = np.clip(np.rint(pts[:, 0]).astype(np.int64), 1, max(1, w - 2))
+    y = np.clip(np.rint(pts[:, 1]).astype(np.int64), 1, max(1, h - 2))
+    # 3x3 means of the sampled pixels only: nine gathers instead of blurring the page
+    acc = np.zeros(len(pts), dtype=np.int64)
+    for dy, dx in itertools.product((-1, 0, 1), repeat=2):
+        acc += gray[np.clip(y + dy, 0, h - 1), np.clip(x + dx, 0, w - 1)]
+    return ((acc + 4) // 9).astype(np.uint8)
+
+
+def scene_outline(scene):
+    """Outer wall polyline of a parse_floorplan scene (what the wall probe samples), or None."""
+    walls = scene.get("walls_px") or []
+    return walls[0]["polyline_px"] if walls else None
+
+
+def index_entry(h, gray, outline, params, image, plan=None, line=None):
+    """Index entry of a full parse; plan/line: the plan file (and line of a batch .jsonl) it was written to."""
+    probe = wall_probe(gray, outline)
+    return {"hash": f"{h:0{HASH_SIZE * HASH_SIZE // 4}x}", "size": [int(gray.shape[1]), int(gray.shape[0])],
+            "params": params, "image": str(image), "plan": str(plan) if plan is not None else None, "line": line,
+            "probe": base64.b64encode(probe.tobytes()).decode("ascii") if probe is not None else None}
+
+
+class BKTree:
+    """BK-tree over int hashes with Hamming distance; nodes are [hash, items, {distance: child}]."""
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, h, item):
+        if self.root is None:
+            self.root = [h, [item], {}]
+            return
+        node = self.root
+        while True:
+            d = hamming(h, node[0])
+            if d == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [h, [item], {}]
+                return
+            node = child
+
+    def search(self, h, max_distance):
+        """[(distance, item)] of every item within max_distance, nearest first."""
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node_h, items, children = stack.pop()
+            d = hamming(h, node_h)
+            if d <= max_distance:
+                found.extend((d, item) for item in items)
+            # triangle inequality: only these subtrees can hold hashes within max_distance
+            stack.extend(child for k, child in children.items() if d - max_distance <= k <= d + max_distance)
+        found.sort(key=lambda t: t[0])
+        return found
+
+
+class PlanIndex:
+    """plan_index.json with a BK-tree over its hashes; match() and add() are thread-safe, save() writes atomically."""
+
+    def __init__(self, path, entries=()):
+        self.path = Path(path)
+        self.entries = []
+        self.tree = BKTree()
+        self._slots = {}
+        self._lock = threading.Lock()
+        # entries add()ed since open, as given (batch workers hand theirs to the parent)
+        self.added = []
+        for entry in entries:
+            self._add(entry)
+
+    @classmethod
+    def open(cls, path):
+        """Load path (an empty index if it doesn't exist yet); raises ValueError on an unreadable index."""
+        path = Path(path)
+        if not path.exists():
+            return cls(path)
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            raise ValueError(f"Cannot read plan index {path}: {e}")
+        if data.get("version") != INDEX_VERSION or data.get("hash_size") != HASH_SIZE:
+            raise ValueError(f"Plan index {path} has version {data.get('version')} / hash size {data.get('hash_size')}; "
+                             f"expected {INDEX_VERSION} / {HASH_SIZE} (delete it to rebuild)")
+        return cls(path, data["entries"])
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _plan_path(self, entry):
+        return self.path.parent / entry["plan"]
+
+    def _relative(self, plan):
+        try:
+            return os.path.relpath(Path(plan).resolve(), self.path.parent.resolve())
+        except ValueError:  # another drive (Windows)
+            return str(Path(plan).resolve())
+
+    def _add(self, entry):
+        key = (entry["plan"], entry["line"])
+        old = self._slots.get(key)
+        if old is not None:
+            # the plan file was rewritten: the old entry is dead, its tree item is skipped
+            self.entries[old] = None
+        self._slots[key] = len(self.entries)
+        self.entries.append(entry)
+        self.tree.add(int(entry["hash"], 16), len(self.entries) - 1)
+
+    def add(self, entry):
+        """Add an index_entry(), replacing the entry of the same plan; its plan path is stored relative to the index.
+
+        An entry without a plan location (not written yet, e.g. a batch .jsonl line) is only
+        recorded in .added.
+        """
+        with self._lock:
+            self.added.append(entry)
+            if entry["plan"] is not None:
+                self._add(dict(entry, plan=self._relative(entry["plan"])))
+
+    def has_plan(self, plan):
+        rel = self._relative(plan)
+        with self._lock:
+            return any(k[0] == rel for k in self._slots)
+
+    def drop_plan(self, plan):
+        """Forget every entry stored in plan (e.g. a batch .jsonl about to be rewritten)."""
+        rel = self._relative(plan)
+        with self._lock:
+            for key in [k for k in self._slots if k[0] == rel]:
+                self.entries[self._slots.pop(key)] = None
+
+    def move_plan(self, plan, new_plan):
+        """Point the entries stored in plan at new_plan (the file was renamed; lines are unchanged)."""
+        rel, new_rel = self._relative(plan), self._relative(new_plan)
+        with self._lock:
+            for key in [k for k in self._slots if k[0] == rel]:
+                i = self._slots.pop(key)
+                self.entries[i] = dict(self.entries[i], plan=new_rel)
+                self._slots[(new_rel, key[1])] = i
+
+    def load_scene(self, entry):
+        """The stored plan of an entry as plain lists/dicts (raises OSError if its file is gone)."""
+        path = self._plan_path(entry)
+        if entry["line"] is not None:
+            with open(path, encoding="utf-8") as f:
+                line = next(itertools.islice(f, entry["line"], None), None)
+            if line is None:
+                raise OSError(f"{path} has no line {entry['line']}")
+            return to_lists(loads_line(line, columns=False))
+        if path.suffix == ".json":
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        return to_lists(load_plan(path, columns=False))
+
+    def candidates(self, h, max_distance=INDEX_DEFAULTS["max_distance"]):
+        """[(distance, entry)] within max_distance of hash h, nearest first."""
+        with self._lock:
+            found = self.tree.search(h, max_distance)
+            return [(d, self.entries[i]) for d, i in found if self.entries[i] is not None]
+
+    def match(self, h, gray, params, max_distance=INDEX_DEFAULTS["max_distance"],
+              max_probe_diff=INDEX_DEFAULTS["max_probe_diff"], exclude=()):
+        """Nearest verified entry for an image: {"entry", "scene", "distance", "probe_diff"} or None.
+
+        Candidates need the same parse params and pixel size, a readable plan and a wall probe
+        within max_probe_diff (entries without an outline are matched on the hash alone).
+        exclude: plan files never matched (e.g. the image's own outdated plan).
+        """
+        size = [int(gray.shape[1]), int(gray.shape[0])]
+        skip = {self._relative(p) for p in exclude}
+        for d, entry in self.candidates(h, max_distance):
+            if entry["size"] != size or entry["params"] != params or entry["plan"] in skip:
+                continue
+            try:
+                scene = self.load_scene(entry)
+            except (OSError, ValueError):
+                continue
+            probe_diff = None
+            if entry["probe"] is not None:
+                probe = wall_probe(gray, scene_outline(scene))
+                if probe is None:
+                    continue
+                ref = np.frombuffer(base64.b64decode(entry["probe"]), dtype=np.uint8)
+                probe_diff = float(np.abs(probe.astype(np.int16) - ref).mean())
+                if probe_diff > max_probe_diff:
+                    continue
+            return {"entry": entry, "scene": scene, "distance": d, "probe_diff": probe_diff}
+        return None
+
+    def save(self):
+        """Write the live entries to path (through a temporary file, so readers never see half an index)."""
+        with self._lock:
+            data = {"version": INDEX_VERSION, "hash_size": HASH_SIZE, "entries": [e for e in self.entries if e is not None]}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix=".plan_index.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        return self.path
+
+
+def main():
+    p = argparse.ArgumentParser(description="List a plan index or look up images in it.")
+    p.add_argument("index", help=f"path to {INDEX_NAME}")
+    p.add_argument("--image", action="append", default=[], help="show the index entries near this image (repeatable)")
+    p.add_argument("--max-distance", type=int, default=INDEX_DEFAULTS["max_distance"],
+                   help=f"Hamming distance limit of the lookup (of {HASH_SIZE * HASH_SIZE} bits)")
+    args = p.parse_args()
+    try:
+        index = PlanIndex.open(args.index)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    print(f"{args.index}: {len(index)} plans")
+    if not args.image:
+        for entry in index.entries:
+            if entry is not None:
+                where = entry["plan"] if entry["line"] is None else f"{entry['plan']}:{entry['line']}"
+                print(f"  {entry['hash'][:16]}  {entry['size'][0]}x{entry['size'][1]}  {entry['image']} -> {where}")
+        return 0
+    for img in args.image:
+        gray = cv2.imread(img, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            print(f"{img}: cannot read")
+            continue
+        found = index.candidates(plan_hash(gray), args.max_distance)
+        print(f"{img}: {len(found)} within distance {args.max_distance}")
+        for d, entry in found:
+            print(f"  {d:3d}  {entry['size'][0]}x{entry['size'][1]}  {entry['image']}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+plan_pipeline.py
+
+Asyncio batch pipeline for parse_floorplan.py: the parse steps run as separate stages joined
+by bounded queues, so file reads, OpenCV work and OCR of different plans overlap instead of
+each plan going through all steps before the next one starts.
+
+    load        read the image (+ content digest for --cache-dir)        I/O
+    preprocess  binary plan mask (pyramid mode: the whole outline)      CPU, OpenCV releases the GIL
+    contours    outline, contour list (--wall-graph: wall graph)        CPU, OpenCV releases the GIL
+    ocr         numeric tokens and scale (then --rooms, which needs it)  tesseract subprocess / CPU
+    write       openings, scene, SVG and plan file                      I/O
+
+Every stage has its own thread pool of `concurrency[stage]` workers (default: the usable cores
+split by each stage's share of the work, thread_plan.plan_pipeline_threads; OpenCV and tesseract
+run single-threaded inside the stages), and the queue in front of
+it holds at most queue_size plans. A full queue makes the stage feeding it wait (backpressure),
+so no more than sum(concurrency) + 6 * queue_size + 1 plans are held in memory (one per stage
+worker, the len(STAGES) + 1 queues, the one being stored), however many images the batch has. A plan whose step fails skips the remaining steps and is reported with
+status "error"; the batch goes on.
+
+With reuse=True the load stage looks every plan up in the plan index (plan_index.py); a
+verified near-duplicate skips preprocess, contours and OCR and is written from the stored
+plan. Plans parsed earlier in the same batch are found too: the index is shared in-process.
+
+Usage:
+    python parse_floorplan.py --input-dir plans --pipeline [--stage-workers preprocess=4,ocr=2] [--queue-size 2]
+
+    from plan_pipeline import run_pipeline_batch
+    manifest, manifest_path = run_pipeline_batch("plans", "*.png", "plan_out", concurrency={"ocr": 2})
+
+The manifest matches parse_floorplan.run_batch (batch_manifest.json), plus per-item
+"stage_seconds", the "thread_plan" with the stage concurrency, and a "pipeline" entry with the
+queue size and the busy time of each stage.
+"""
+import asyncio
+import contextlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from lazy_import import lazy_import
+from plan_index import INDEX_DEFAULTS, index_entry, scene_outline
+from thread_plan import apply_thread_plan, format_plan, plan_pipeline_threads
+
+cv2 = lazy_import("cv2")
+pf = lazy_import("parse_floorplan")
+
+STAGES = ("load", "preprocess", "contours", "ocr", "write")
+DEFAULT_QUEUE_SIZE = 2
+
+
+def parse_concurrency(text):
+    """'preprocess=4,ocr=2' -> {"preprocess": 4, "ocr": 2}; raises ValueError on unknown stages."""
+    out = {}
+    for part in filter(None, (p.strip() for p in (text or "").split(","))):
+        name, _, value = part.partition("=")
+        name = name.strip()
+        if name not in STAGES or not value.strip().isdigit() or int(value) < 1:
+            raise ValueError(f"Bad stage worker setting {part!r}; expected <stage>=<n> with stage in {', '.join(STAGES)}")
+        out[name] = int(value)
+    return out
+
+
+# ---------------------------------------------------------------- stage steps (run in worker threads)
+
+def _load(job, opts):
+    job["plan_image"], job["digest"] = pf.load_plan_image(job["image"], opts["cache"])
+    if opts["index"] is not None:
+        scene, job["hash"] = pf.find_reusable(job["plan_image"], job["image"], opts["index"], opts["reuse_params"],
+                                              opts["reuse_distance"])
+        if scene is not None:
+            job["scene"] = scene
+            job["index_entry"] = index_entry(job["hash"], job["plan_image"].gray(), scene_outline(scene),
+                                             opts["reuse_params"], job["image"])
+
+
+def _preprocess(job, opts):
+    if "scene" in job:
+        return
+    image = job["plan_image"]
+    if pf.uses_pyramid(image.bgr(), opts["pyramid"]):
+        job["geometry"] = pf.plan_geometry_pyramid(image.bgr(), opts["pyramid"], job["digest"], opts["cache"],
+                                                   tile_threads=1)
+    else:
+        # --ocr regions reuses the gray view later
+        job["mask"] = pf.plan_mask(image.gray(), job["digest"], opts["cache"], tile_size=opts["tile_size"],
+                                   tile_threads=1)
+
+
+def _contours(job, opts):
+    if "mask" in job:
+        # rooms wait for the scale (OCR stage); only they still need the mask then
+        bin_img, bin_key = job["mask"] if "rooms" in opts["extras"] else job.pop("mask")
+        job["geometry"] = pf.plan_geometry(bin_img, bin_key, opts["cache"], extras=set(opts["extras"]) - {"rooms"})
+    if opts["index"] is not None and "geometry" in job:
+        # the wall probe needs the pixels, which the OCR stage may drop
+        job["index_entry"] = index_entry(job["hash"], job["plan_image"].gray(), job["geometry"][0],
+                                         opts["reuse_params"], job["image"])
+
+
+def _ocr(job, opts):
+    image = job["plan_image"]
+    if "scene" not in job:
+        nums = pf.plan_numbers(image, job["digest"], opts["cache"], ocr_mode=opts["ocr_mode"],
+                               ocr_threads=opts["ocr_threads"])
+        job["nums"] = nums
+        job["scale"] = pf.plan_scale(nums, opts["scale_mm"])
+    if "mask" in job:
+        bin_img, bin_key = job.pop("mask")
+        job["geometry"] = job["geometry"][:3] + (pf.plan_rooms(bin_img, bin_key, job["scale"][0], opts["cache"]),)
+    image.release("gray")
+    if opts["svg_raster"] != "embed":
+        # only the embedded SVG background still needs the pixels
+        job.pop("plan_image")
+
+
+def _write(job, opts):
+    scene = job.pop("scene", None)
+    if scene is None:
+        scene = pf.build_scene(job["image"], job["size"], job.pop("nums"), job.pop("scale"), job.pop("geometry"))
+    out_format = opts["out_format"]
+    if out_format == "jsonl":
+        job["plan_line"] = pf.dumps_line(scene)
+    image = job.pop("plan_image", None)
+    out_json, out_svg = pf.write_scene(scene, job["out_dir"], job["image"], image.bgr() if image else None,
+                                       None if out_format == "jsonl" else out_format, opts["svg_raster"])
+    job["rec"].update({
+        "status": "ok",
+        "json": str(out_json) if out_json else None,
+        "svg": str(out_svg),
+        "px_to_mm": scene["scale_info"]["px_to_mm"],
+        "openings": len(scene["openings"]),
+    })
+    if "reused_from" in scene["meta"]:
+        job["rec"]["reused_from"] = scene["meta"]["reused_from"]["image"]
+    entry = job.pop("index_entry", None)
+    if entry is not None:
+        # added by the sink, which also knows the .jsonl line
+        job["rec"]["index_entry"] = dict(entry, plan=str(out_json) if out_json else None)
+
+
+STEPS = {"load": _load, "preprocess": _preprocess, "contours": _contours, "ocr": _ocr, "write": _write}
+
+
+# ---------------------------------------------------------------- pipeline
+
+async def run_pipeline(jobs, opts, sink, concurrency=None, queue_size=DEFAULT_QUEUE_SIZE):
+    """Push jobs (dicts with "image", "out_dir", "rec") through STAGES; sink(job) gets each finished job.
+
+    concurrency: {stage: workers} (default: thread_plan.plan_pipeline_threads()).
+    sink runs in the event loop thread, in completion order. If it raises, no more jobs are
+    started, the ones in flight finish without reaching it and its exception is raised.
+    Returns {stage: busy seconds}.
+    """
+    conc = plan_pipeline_threads(ocr=opts["ocr_mode"], stages=concurrency)["stages"]
+    loop = asyncio.get_running_loop()
+    queues = [asyncio.Queue(maxsize=queue_size) for _ in STAGES] + [asyncio.Queue(maxsize=queue_size)]
+    pools = {name: ThreadPoolExecutor(max_workers=conc[name], thread_name_prefix=f"plan-{name}") for name in STAGES}
+    busy = dict.fromkeys(STAGES, 0.0)
+    sink_error = []
+
+    async def stage_worker(i, name):
+        q_in, q_out = queues[i], queues[i + 1]
+        while True:
+            job = await q_in.get()
+            try:
+                if job["rec"].get("status") != "error":
+                    t0 = time.perf_counter()
+                    try:
+                        await loop.run_in_executor(pools[name], STEPS[name], job, opts)
+                    except Exception as e:
+                        job["rec"].update({"status": "error", "error": f"{type(e).__name__}: {e}", "failed_stage": name})
+                        # drop whatever the earlier stages left behind
+                        for key in ("plan_image", "mask", "geometry", "nums", "scale", "scene", "index_entry"):
+                            job.pop(key, None)
+                    dt = time.perf_counter() - t0
+                    busy[name] += dt
+                    job["rec"]["stage_seconds"][name] = round(dt, 4)
+                    if name == "load" and "plan_image" in job:
+                        job["size"] = job["plan_image"].array.shape[:2]
+                # blocks while the next queue is full: backpressure up the chain
+                await q_out.put(job)
+            finally:
+                q_in.task_done()
+
+    async def drain():
+        while True:
+            job = await queues[-1].get()
+            try:
+                job["rec"]["seconds"] = round(time.perf_counter() - job.pop("t0"), 3)
+                if not sink_error:
+                    sink(job)
+            except Exception as e:
+                # keep draining: the queues must still empty for the joins below to return
+                sink_error.append(e)
+            finally:
+                queues[-1].task_done()
+
+    workers = [[asyncio.create_task(stage_worker(i, name)) for _ in range(conc[name])] for i, name in enumerate(STAGES)]
+    drainer = asyncio.create_task(drain())
+    try:
+        for job in jobs:
+            if sink_error:
+                break
+            job["t0"] = time.perf_counter()
+            job["rec"].setdefault("stage_seconds", {})
+            await queues[0].put(job)
+        # stages finish front to back: a queue is only empty for good once its producers are done
+        for i, stage_workers in enumerate(workers):
+            await queues[i].join()
+            for w in stage_workers:
+                w.cancel()
+        await queues[-1].join()
+        if sink_error:
+            raise sink_error[0]
+    finally:
+        drainer.cancel()
+        for stage_workers in workers:
+            for w in stage_workers:
+                w.cancel()
+        for pool in pools.values():
+            pool.shutdown(wait=True)
+    return {name: round(busy[name], 3) for name in STAGES}
+
+
+def run_pipeline_batch(input_dir, pattern, out_dir, scale_mm=None, cache_dir=None, cache_max_mb=1024, ocr_mode="full",
+                       ocr_threads=None, tile_size=0, pyramid=None, out_format="json", svg_raster="link",
+                       concurrency=None, queue_size=DEFAULT_QUEUE_SIZE, reuse=False, index_path=None,
+                       reuse_distance=INDEX_DEFAULTS["max_distance"], extras=()):
+    """parse_floorplan.run_batch through the staged pipeline, in this process; returns (manifest, manifest_path).
+
+    concurrency: {stage: workers} overrides for thread_plan.plan_pipeline_threads().
+    reuse / index_path / reuse_distance / extras: as for run_batch.
+    """
+    if svg_raster not in pf.SVG_RASTER_MODES:
+        raise ValueError(f"Unknown SVG raster mode {svg_raster!r}; expected one of {', '.join(pf.SVG_RASTER_MODES)}")
+    pf.check_extras(extras)
+    input_dir = Path(input_dir)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    images = pf.collect_batch_inputs(input_dir, pattern)
+    plan = plan_pipeline_threads(ocr=ocr_mode, stages=concurrency)
+    print(format_plan(plan))
+    opts = {"cache": pf.open_cache(cache_dir, cache_max_mb), "scale_mm": scale_mm, "ocr_mode": ocr_mode,
+            "ocr_threads": ocr_threads or plan["ocr_threads"], "tile_size": tile_size, "pyramid": pyramid, "out_format": out_format,
+            "svg_raster": svg_raster, "extras": extras}
+    records = []
+    jsonl_path = out_dir / "batch_plans.jsonl" if out_format == "jsonl" else None
+    opts["index"] = pf.batch_index(index_path, out_dir, jsonl_path) if reuse else None
+    opts["reuse_params"] = pf.reuse_params(scale_mm, ocr_mode, pyramid, extras=extras)
+    opts["reuse_distance"] = reuse_distance
+    lines = 0
+
+    def jobs():
+        for img in images:
+            # mirror the input tree so equal stems in different folders don't collide
+            rel = img.relative_to(input_dir).with_suffix("")
+            yield {"image": img, "out_dir": out_dir / rel, "rec": {"image": str(img), "out_dir": str(out_dir / rel)}}
+
+    def sink(job):
+        nonlocal lines
+        rec = job["rec"]
+        line = job.get("plan_line")
+        if line is not None:
+            # single writer (the event loop thread), as in run_batch
+            jsonl.write(line + "\n")
+            jsonl.flush()
+            rec.update({"jsonl": str(jsonl_path), "jsonl_line": lines})
+            lines += 1
+        pf.add_to_index(opts["index"], rec, rec.get("jsonl_line"))
+        records.append(rec)
+        print(f"[{len(records)}/{len(images)}] {rec['status']:5s} {rec['image']} ({rec['seconds']}s)")
+
+    # the stages provide the parallelism: keep OpenCV and tesseract from adding their own threads
+    prev_threads, prev_omp = cv2.getNumThreads(), os.environ.get("OMP_THREAD_LIMIT")
+    apply_thread_plan(plan)
+    t0 = time.perf_counter()
+    try:
+        with open(jsonl_path, "w", encoding="utf-8") if jsonl_path else contextlib.nullcontext() as jsonl:
+            busy = asyncio.run(run_pipeline(jobs(), opts, sink, plan["stages"], queue_size))
+    finally:
+        cv2.setNumThreads(prev_threads)
+        if prev_omp is None:
+            os.environ.pop("OMP_THREAD_LIMIT", None)
+        else:
+            os.environ["OMP_THREAD_LIMIT"] = prev_omp
+    records.sort(key=lambda r: r["image"])
+    manifest = {
+        "input_dir": str(input_dir),
+        "pattern": pattern,
+        "workers": sum(plan["stages"].values()),
+        "thread_plan": plan,
+        "total": len(records),
+        "ok": sum(1 for r in records if r["status"] == "ok"),
+        "failed": sum(1 for r in records if r["status"] != "ok"),
+        "wall_seconds": round(time.perf_counter() - t0, 3),
+        "pipeline": {"queue_size": queue_size, "busy_seconds": busy},
+        "items": records,
+    }
+    if jsonl_path:
+        manifest["jsonl"] = str(jsonl_path)
+    if opts["index"] is not None:
+        manifest["reused"] = sum(1 for r in records if "reused_from" in r)
+        manifest["plan_index"] = str(opts["index"].save())
+    manifest_path = out_dir / "batch_manifest.json"
+    pf.save_json(manifest_path, manifest)
+    return manifest, manifest_path
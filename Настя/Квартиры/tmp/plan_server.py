@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+plan_server.py
+
+Persistent parse server for parse_floorplan.py. A one-off run spends most of a sub-second
+parse importing OpenCV / NumPy / PIL / tesseract bindings; the server pays that once, keeps
+the stage cache open and (with tesserocr installed, --ocr regions) one warm tesseract engine
+per worker thread and per region-OCR thread, and answers parse requests concurrently.
+
+Usage:
+    python parse_floorplan.py --serve 8765 [--workers 4] [--cache-dir /tmp/plan_cache] [--ocr regions]
+    python parse_floorplan.py --serve unix:/tmp/floorplan.sock --out /tmp/plan_out
+    python parse_floorplan.py --server unix:/tmp/floorplan.sock --image plan.png --out /tmp/plan_out/plan
+
+Protocol: HTTP/1.1 with JSON bodies, on TCP or a Unix socket. Paths are resolved on the server,
+and "out" must lie inside the server's --out directory (out_root); anything else is a 400.
+A TCP address without a host binds 127.0.0.1. The server has no authentication: binding any
+other host prints a warning, since every client that can reach it may read images the server
+can read and write plans below out_root.
+    GET  /health  -> {"status": "ok", "workers", "thread_plan", "served", "failed", "cache_hits", "cache_misses"}
+    POST /parse   {"image": ..., "out": ..., optional "scale_mm", "ocr", "ocr_threads",
+                   "tile_size", "tile_threads", "pyramid", "profile", "format", "svg_raster",
+                   "extras" (list, e.g. ["rooms"])}
+                  -> 200 {"status": "ok", "json", "svg", "px_to_mm", "scale_value_mm", "openings", "seconds"}
+                     400 malformed request, 422 parse failure: {"status": "error", "error": ...}
+
+Notes:
+    - --ocr full still starts one tesseract process per plan (pytesseract); only --ocr regions
+      with tesserocr keeps the language data loaded between requests.
+    - "profile" (and --profile) needs a --workers 1 server. Of the per-stage numbers only wall_s
+      belongs to the request alone; cpu_s (os.times) and peak_rss_mb (VmHWM, reset through
+      /proc/self/clear_refs) are process-wide and would mix in, and be reset by, requests running
+      next to it. Profiles from a multi-worker server are refused (400) rather than misreported.
+"""
+import http.client
+import ipaddress
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+
+from thread_plan import apply_thread_plan, format_plan, plan_threads, usable_cores
+
+# request field -> type; anything not given falls back to the server's defaults
+PARSE_OPTIONS = {
+    "scale_mm": float,
+    "ocr": str,
+    "ocr_threads": int,
+    "tile_size": int,
+    "tile_threads": int,
+    "pyramid": float,
+    "profile": bool,
+    "format": str,
+    "svg_raster": str,
+    "extras": tuple,
+}
+
+PROFILE_NEEDS_ONE_WORKER = ("profile needs a --workers 1 server: CPU time and peak RSS are measured "
+                            "for the whole process, not per request")
+
+
+def parse_address(address):
+    """"unix:/path.sock" -> ("unix", path); "host:port" or "port" -> ("tcp", (host, port))."""
+    if address.startswith("unix:"):
+        return "unix", address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    return "tcp", (host or "127.0.0.1", int(port))
+
+
+def is_loopback(host):
+    """True for localhost and loopback addresses (only this machine can connect)."""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host.strip("[]")).is_loopback
+    except ValueError:
+        return False
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        # a socket file left behind by a killed server would make bind() fail
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        super().server_bind()
+        self.server_name, self.server_port = "localhost", 0
+
+
+class PlanServer:
+    """Runs parse_plan() on a fixed pool of worker threads, so per-thread OCR engines stay warm."""
+
+    def __init__(self, workers=None, cache=None, defaults=None, out_root="."):
+        self.cache = cache
+        # requests may only write below this directory
+        self.out_root = Path(out_root).resolve()
+        self.defaults = dict(defaults or {})
+        # requests run side by side in one process: each worker thread gets its share of the cores
+        self.thread_plan = plan_threads(workers or usable_cores(), workers, ocr=self.defaults.get("ocr", "full"))
+        self.workers = self.thread_plan["workers"]
+        if self.defaults.get("profile") and self.workers > 1:
+            raise ValueError(PROFILE_NEEDS_ONE_WORKER)
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="parse")
+        self.served = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def warm_up(self):
+        """Import the heavy modules and create one OCR engine per worker thread and per region-OCR thread."""
+        import parse_floorplan as pf
+        from lazy_import import load_now
+        # in this thread, before the worker threads share the modules
+        load_now(pf.cv2, pf.np, pf.Image, pf.ImageDraw, pf.ImageFont, pf.pytesseract, pf.region_ocr)
+        apply_thread_plan(self.thread_plan)
+        if self.defaults.get("ocr") != "regions":
+            return
+        # a barrier makes every worker thread take exactly one warm-up task
+        barrier = threading.Barrier(self.workers)
+
+        def warm():
+            barrier.wait()
+            return pf.region_ocr.warm_up()
+
+        list(self.pool.map(lambda _: warm(), range(self.workers)))
+        # with ocr_threads > 1 the regions are recognised in the region-OCR pool, not in the worker
+        # threads; requests asking for another thread count get a pool of that size, warmed on first use
+        ocr_threads = self.defaults.get("ocr_threads") or self.thread_plan["ocr_threads"]
+        if ocr_threads > 1:
+            pf.region_ocr.warm_up_pool(ocr_threads)
+
+    def check(self, request):
+        """Raise ValueError for a /parse request this server can't answer faithfully."""
+        if not isinstance(request, dict) or not request.get("image") or not request.get("out"):
+            raise ValueError('"image" and "out" are required')
+        if not Path(request["out"]).resolve().is_relative_to(self.out_root):
+            raise ValueError(f'"out" must be inside the server\'s output root {self.out_root}')
+        if request.get("profile") and self.workers > 1:
+            raise ValueError(PROFILE_NEEDS_ONE_WORKER)
+
+    def parse(self, request):
+        """Run one /parse request in the worker pool; returns the response body."""
+        return self.pool.submit(self._parse, request).result()
+
+    def _parse(self, request):
+        import parse_floorplan as pf
+        from stage_profile import StageProfiler
+
+        t0 = time.perf_counter()
+        try:
+            opts = dict(self.defaults)
+            opts.update((k, PARSE_OPTIONS[k](v)) for k, v in request.items() if k in PARSE_OPTIONS and v is not None)
+            profiler = StageProfiler() if opts.get("profile") else None
+            scene, out_json, out_svg = pf.parse_plan(request["image"], request["out"], scale_mm=opts.get("scale_mm"),
+                                                     cache=self.cache, ocr_mode=opts.get("ocr", "full"),
+                                                     ocr_threads=opts.get("ocr_threads") or self.thread_plan["ocr_threads"],
+                                                     tile_size=opts.get("tile_size", 0),
+                                                     tile_threads=opts.get("tile_threads") or self.thread_plan["tile_threads"],
+                                                     pyramid=opts.get("pyramid"), profiler=profiler,
+                                                     out_format=opts.get("format", "json"),
+                                                     svg_raster=opts.get("svg_raster", "link"),
+                                                     extras=opts.get("extras", ()))
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            return {"status": "error", "error": f"{type(e).__name__}: {e}"}
+        with self._lock:
+            self.served += 1
+        resp = {
+            "status": "ok",
+            "json": str(out_json),
+            "svg": str(out_svg),
+            "px_to_mm": scene["scale_info"]["px_to_mm"],
+            "scale_value_mm": scene["scale_info"]["scale_value_mm"],
+            "openings": len(scene["openings"]),
+            "seconds": round(time.perf_counter() - t0, 4),
+        }
+        if profiler is not None:
+            resp["profile"] = scene["meta"]["profile"]
+        return resp
+
+    def health(self):
+        return {
+            "status": "ok",
+            "workers": self.workers,
+            "thread_plan": self.thread_plan,
+            "served": self.served,
+            "failed": self.failed,
+            "cache_hits": self.cache.hits if self.cache else None,
+            "cache_misses": self.cache.misses if self.cache else None,
+        }
+
+
+def _handler_for(plan_server):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def address_string(self):
+            # Unix socket peers have no (host, port)
+            return self.client_address[0] if self.client_address else "unix"
+
+        def _reply(self, code, body):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._reply(200, plan_server.health())
+            else:
+                self._reply(404, {"status": "error", "error": f"unknown path {self.path}"})
+
+        def do_POST(self):
+            if self.path != "/parse":
+                self._reply(404, {"status": "error", "error": f"unknown path {self.path}"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                request = json.loads(self.rfile.read(length) or b"{}")
+                plan_server.check(request)
+            except ValueError as e:
+                self._reply(400, {"status": "error", "error": str(e)})
+                return
+            resp = plan_server.parse(request)
+            self._reply(200 if resp["status"] == "ok" else 422, resp)
+
+    return Handler
+
+
+def serve(address, workers=None, cache=None, defaults=None, out_root="."):
+    """Serve parse requests on address ("host:port" or "unix:/path") until interrupted.
+
+    Requests may only write below out_root.
+    """
+    try:
+        plan_server = PlanServer(workers=workers, cache=cache, defaults=defaults, out_root=out_root)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    kind, addr = parse_address(address)
+    if kind == "tcp" and not is_loopback(addr[0]):
+        print(f"warning: serving on {addr[0]}, reachable from other machines without authentication; any client "
+              f"can read images this server can read and write below {plan_server.out_root}. "
+              "Bind 127.0.0.1 or a Unix socket unless the network is trusted.", file=sys.stderr, flush=True)
+    t0 = time.perf_counter()
+    plan_server.warm_up()
+    server_cls = _ThreadingUnixHTTPServer if kind == "unix" else _ThreadingHTTPServer
+    with server_cls(addr, _handler_for(plan_server)) as httpd:
+        # SIGTERM (service managers, kill) stops as cleanly as Ctrl+C; shutdown() must not run in the serving thread
+        signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=httpd.shutdown).start())
+        print(format_plan(plan_server.thread_plan))
+        print(f"Serving parse requests on {address} with {plan_server.workers} workers, writing below "
+              f"{plan_server.out_root} (warm-up {time.perf_counter() - t0:.2f}s). Ctrl+C to stop.", flush=True)
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            plan_server.pool.shutdown(wait=True)
+            if kind == "unix" and os.path.exists(addr):
+                os.unlink(addr)
+    return 0
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+def request(address, method, path, body=None, timeout=None):
+    """Send one request to a running server; returns (HTTP status, decoded JSON body)."""
+    kind, addr = parse_address(address)
+    if kind == "unix":
+        conn = _UnixHTTPConnection(addr, timeout=timeout)
+    else:
+        conn = http.client.HTTPConnection(*addr, timeout=timeout)
+    try:
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = {"Content-Type": "application/json"} if data is not None else {}
+        conn.request(method, path, body=data, headers=headers)
+        resp = conn.getresponse()
+        return resp.status, json.loads(resp.read() or b"{}")
+    finally:
+        conn.close()
+
+
+def request_parse(address, image, out, timeout=None, **options):
+    """POST /parse; image and out are made absolute since the server may run elsewhere on disk."""
+    body = {"image": os.path.abspath(image), "out": os.path.abspath(out)}
+    body.update((k, v) for k, v in options.items() if v is not None)
+    return request(address, "POST", "/parse", body, timeout=timeout)
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+region_ocr.py
+
+Dimension-label OCR restricted to likely text regions, for parse_floorplan.py.
+
+Instead of running tesseract over the whole plan and discarding every non-numeric word,
+glyph-sized connected components are grouped into short text regions and only those crops
+are recognised, with a digit whitelist and a single-line page segmentation mode.
+
+The recogniser is kept warm in-process when tesserocr is installed (one TessBaseAPI per
+thread, created once and reused for every region and every plan the process parses).
+Without tesserocr each region goes through pytesseract, i.e. one tesseract subprocess per
+crop, which still benefits from the small crops and the thread pool.
+
+Dependencies:
+    pip install opencv-python numpy pillow pytesseract
+    optional: pip install tesserocr   (persistent engine, much lower per-region overhead)
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from PIL import Image
+import pytesseract
+
+# Optional: tesserocr keeps the tesseract engine loaded between calls (if installed)
+try:
+    import tesserocr
+except Exception:
+    tesserocr = None
+
+DIGIT_LANG = "eng"
+DIGIT_WHITELIST = "0123456789.,"
+REGION_DEFAULTS = {"min_glyph_h": 5, "max_glyph_h": 40, "min_glyph_area": 8, "pad": 4, "target_h": 32}
+
+# tesseract is CPU-bound: more threads than this only add engines (and pools, one per size)
+MAX_REGION_THREADS = 4 * (os.cpu_count() or 1)
+
+_local = threading.local()
+_pools = {}  # thread count -> pool; pools are never replaced, so running plans keep theirs
+_pool_lock = threading.Lock()
+
+
+def find_label_regions(gray, min_glyph_h=5, max_glyph_h=40, min_glyph_area=8, pad=4):
+    """Return padded boxes (x, y, w, h) around groups of glyph-sized components.
+
+    gray: uint8 grayscale image. Long wall lines and large symbols are rejected by the
+    glyph size filter; neighbouring glyphs are merged by a dilation scaled to the median
+    glyph height, in both directions so vertical dimension labels are grouped too.
+    """
+    # local threshold: labels sit on tinted room fills as well as on white
+    bw = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 15, 20)
+    nb, labels, stats, _ = cv2.connectedComponentsWithStats(bw, connectivity=8)
+    w = stats[:, cv2.CC_STAT_WIDTH]
+    h = stats[:, cv2.CC_STAT_HEIGHT]
+    area = stats[:, cv2.CC_STAT_AREA]
+    size = np.maximum(w, h)
+    glyph = (size >= min_glyph_h) & (size <= max_glyph_h) & (area >= min_glyph_area)
+    glyph[0] = False
+    if not glyph.any():
+        return []
+    lut = np.where(glyph, 255, 0).astype(np.uint8)
+    mask = lut[labels]
+
+    k = max(3, int(np.median(size[glyph]) * 0.6))
+    grouped = cv2.bitwise_or(cv2.dilate(mask, np.ones((1, k), np.uint8)),
+                             cv2.dilate(mask, np.ones((k, 1), np.uint8)))
+    nb, _, stats, _ = cv2.connectedComponentsWithStats(grouped, connectivity=8)
+    H, W = gray.shape[:2]
+    boxes = []
+    for x, y, ww, hh, _ in stats[1:]:
+        x0, y0 = max(0, x - pad), max(0, y - pad)
+        x1, y1 = min(W, x + ww + pad), min(H, y + hh + pad)
+        boxes.append((int(x0), int(y0), int(x1 - x0), int(y1 - y0)))
+    return boxes
+
+
+def _engine():
+    """This thread's warm tesserocr engine (None when tesserocr is unavailable)."""
+    if tesserocr is None:
+        return None
+    api = getattr(_local, "api", None)
+    if api is None:
+        api = tesserocr.PyTessBaseAPI(lang=DIGIT_LANG, psm=tesserocr.PSM.SINGLE_LINE)
+        api.SetVariable("tessedit_char_whitelist", DIGIT_WHITELIST)
+        _local.api = api
+    return api
+
+
+def warm_up():
+    """Create this thread's tesserocr engine now (loads the language data).
+
+    Returns False when tesserocr is unavailable and every region will go through pytesseract.
+    """
+    return _engine() is not None
+
+
+def _region_pool(threads):
+    """Long-lived thread pool of this size, so per-thread engines stay warm across plans.
+
+    Each size gets its own pool: plans asking for different thread counts (concurrent server
+    requests) never shut down a pool another plan is still mapping over.
+    """
+    threads = min(threads, MAX_REGION_THREADS)
+    with _pool_lock:
+        pool = _pools.get(threads)
+        if pool is None:
+            pool = _pools[threads] = ThreadPoolExecutor(max_workers=threads,
+                                                        thread_name_prefix=f"region-ocr-{threads}")
+        return pool
+
+
+def warm_up_pool(threads):
+    """warm_up() in every thread of the region pool of this size, before the first plan uses it.
+
+    A barrier holds each thread until all of them have taken a task, so no thread warms twice
+    while another stays cold. Returns False when tesserocr is unavailable.
+    """
+    pool = _region_pool(threads)
+    barrier = threading.Barrier(pool._max_workers)
+
+    def warm(_):
+        barrier.wait()
+        return warm_up()
+
+    return all(list(pool.map(warm, range(pool._max_workers))))
+
+
+def _words_tesserocr(api, crop_pil):
+    api.SetImage(crop_pil)
+    api.Recognize()
+    words = []
+    ri = api.GetIterator()
+    level = tesserocr.RIL.WORD
+    for r in tesserocr.iterate_level(ri, level):
+        txt = r.GetUTF8Text(level)
+        box = r.BoundingBox(level)
+        if txt and box:
+            x0, y0, x1, y1 = box
+            words.append((txt, x0, y0, x1 - x0, y1 - y0))
+    return words
+
+
+def _words_pytesseract(crop_pil):
+    config = f"--psm 7 -c tessedit_char_whitelist={DIGIT_WHITELIST}"
+    data = pytesseract.image_to_data(crop_pil, output_type=pytesseract.Output.DICT, lang=DIGIT_LANG, config=config)
+    return [(t, data['left'][i], data['top'][i], data['width'][i], data['height'][i])
+            for i, t in enumerate(data['text']) if t.strip()]
+
+
+def _ocr_region(gray, box, target_h=32):
+    """OCR one region; returns numeric tokens in full-image coordinates."""
+    x, y, w, h = box
+    crop = gray[y:y + h, x:x + w]
+    vertical = h > 1.5 * w
+    if vertical:
+        crop = cv2.rotate(crop, cv2.ROTATE_90_CLOCKWISE)
+    scale = max(1.0, target_h / crop.shape[0])
+    if scale > 1.0:
+        crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+    crop_pil = Image.fromarray(crop)
+    api = _engine()
+    words = _words_tesserocr(api, crop_pil) if api is not None else _words_pytesseract(crop_pil)
+
+    nums = []
+    for txt, wx, wy, ww, wh in words:
+        t = txt.strip().replace(',', '.')
+        if not t or not t.replace('.', '', 1).isdigit():
+            continue
+        if vertical:
+            # word boxes of the rotated crop don't map back cleanly; report the region
+            bx, by, bw, bh = x, y, w, h
+        else:
+            bx, by = x + int(wx / scale), y + int(wy / scale)
+            bw, bh = int(ww / scale), int(wh / scale)
+        nums.append({'text': t, 'bbox': [int(bx), int(by), int(bw), int(bh)],
+                     'center': [int(bx + bw/2), int(by + bh/2)]})
+    return nums
+
+
+def ocr_number_regions(gray, threads=1, **params):
+    """Numeric tokens (same format as parse_floorplan.ocr_numbers) from label regions only.
+
+    threads > 1 recognises regions in parallel; tesseract releases the GIL while it works.
+    """
+    params = dict(REGION_DEFAULTS, **params)
+    boxes = find_label_regions(gray, params["min_glyph_h"], params["max_glyph_h"],
+                               params["min_glyph_area"], params["pad"])
+    if threads > 1 and len(boxes) > 1:
+        pool = _region_pool(threads)
+        per_region = list(pool.map(lambda b: _ocr_region(gray, b, params["target_h"]), boxes))
+    else:
+        per_region = [_ocr_region(gray, b, params["target_h"]) for b in boxes]
+    # reading order, like tesseract's full-page output
+    nums = [n for region in per_region for n in region]
+    nums.sort(key=lambda n: (n['bbox'][1], n['bbox'][0]))
+    # padded regions may overlap; drop the same label read twice
+    tol = 2 * params["pad"]
+    unique = []
+    for n in nums:
+        if not any(u['text'] == n['text'] and abs(u['center'][0] - n['center'][0]) <= tol
+                   and abs(u['center'][1] - n['center'][1]) <= tol for u in unique):
+            unique.append(n)
+    return unique
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+rooms.py
+
+Room segmentation for parse_floorplan.py: every enclosed room of a binary plan mask with its
+area, centroid and simplified outline.
+
+  1. wall mask: the plan mask is closed (hatched / double-line walls become solid), opened
+     (dimension lines, text strokes and furniture lines thinner than stroke_px disappear) and
+     only straight horizontal / vertical runs of at least wall_run_px are kept.
+  2. door gaps: free space farther than door_gap_px / 2 from any wall is a room core, so
+     openings up to door_gap_px wide no longer connect neighbouring rooms. Cores touching
+     the image border are the outside. With a known scale (room_params) door_gap_px comes
+     from a door width in mm instead.
+  3. the cores are regrown up to the walls (watershed seeded with the cores, walls as their
+     own basin), so a room keeps its full floor area and the door gaps are split between
+     the rooms on both sides. A core reaches about 0.75 * door_gap_px (its room's corners);
+     free space it doesn't reach and enclosed free space without a core of its own
+     (corridors, closets narrower than door_gap_px) are rooms by themselves. Regions nowhere
+     min_width_px wide are cavities in double-line walls, not rooms.
+  4. connectedComponentsWithStats over the regrown rooms and over those leftovers labels
+     every room and yields its pixel area, bounding box and centroid; one
+     findContours(RETR_FLOODFILL) call over the label image traces all room outlines at once.
+
+Everything is whole-image OpenCV / NumPy work (a handful of linear passes), so the cost
+depends on the image size, not on the number of rooms.
+
+Result (JSON-ready, rooms in raster order of their top-left pixel):
+    [{"id": "room_1", "polygon_px": [[x, y], ...], "area_px": ..., "centroid_px": [x, y],
+      "bbox_px": [x, y, w, h]}, ...]
+"""
+import argparse
+import json
+import sys
+
+import cv2
+import numpy as np
+
+from stage_cache import pack_contours
+
+ROOM_DEFAULTS = {
+    "hatch_close_px": 3,     # px, closing kernel that fills hatched / double-line walls (0: off)
+    "stroke_px": 2,          # px, opening kernel: thinner strokes are not walls
+    "wall_run_px": 10,       # px, shortest straight horizontal / vertical wall run kept
+    "door_gap_px": 40,       # px, widest opening closed between two rooms
+    "min_width_px": 12,      # px, narrower leftover regions (no core) are wall cavities, not rooms
+    "min_room_px": 1000,     # px^2, smaller regions are wall artefacts, not rooms
+    "epsilon_factor": 0.01,  # outline simplification tolerance, fraction of the room perimeter
+}
+
+# replace door_gap_px / min_room_px when the plan's scale is known (room_params)
+ROOM_MM_DEFAULTS = {
+    "door_width_mm": 1000,   # mm, widest door opening closed between two rooms
+    "min_width_mm": 500,     # mm, narrowest corridor / closet
+    "min_room_m2": 1.0,      # m^2, smaller regions are not rooms
+}
+
+# reach of a core when regrown, in door gaps: sqrt(2) / 2 (a room corner seen from its core's corner) plus a margin
+CORE_REACH = 0.75
+
+
+def room_params(px_to_mm=None, door_width_mm=1000, min_width_mm=500, min_room_m2=1.0):
+    """ROOM_DEFAULTS, with the door gap, narrowest and smallest room converted from mm when px_to_mm is known."""
+    params = dict(ROOM_DEFAULTS)
+    if px_to_mm:
+        params["door_gap_px"] = max(1, round(door_width_mm / px_to_mm))
+        params["min_width_px"] = max(1, round(min_width_mm / px_to_mm))
+        params["min_room_px"] = max(1, round(min_room_m2 * 1e6 / px_to_mm ** 2))
+    return params
+
+
+def wall_mask(bin_img, hatch_close_px=3, stroke_px=2, wall_run_px=10):
+    """uint8 mask (255 = wall) of the straight wall runs in a binary plan mask."""
+    mask = bin_img
+    if hatch_close_px:
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((hatch_close_px, hatch_close_px), np.uint8))
+    if stroke_px:
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, np.ones((stroke_px, stroke_px), np.uint8))
+    horizontal = cv2.morphologyEx(mask, cv2.MORPH_OPEN, np.ones((1, wall_run_px), np.uint8))
+    vertical = cv2.morphologyEx(mask, cv2.MORPH_OPEN, np.ones((wall_run_px, 1), np.uint8))
+    return cv2.bitwise_or(horizontal, vertical)
+
+
+def room_labels(bin_img, hatch_close_px=3, stroke_px=2, wall_run_px=10, door_gap_px=40, min_width_px=12, **_):
+    """(n, labels, stats, centroids) as from connectedComponentsWithStats over the rooms of a plan mask.
+
+    Label 0 is walls, outside and the watershed lines between rooms; regions narrower than
+    min_width_px and leftovers touching the image border (outside) keep a label with area 0.
+    """
+    wall = wall_mask(bin_img, hatch_close_px, stroke_px, wall_run_px)
+    free = wall == 0
+    dist = cv2.distanceTransform(free.view(np.uint8), cv2.DIST_L2, 3)
+    core_mask = (dist > door_gap_px / 2.0).view(np.uint8)
+    n, cores = cv2.connectedComponents(core_mask, connectivity=4)
+    # watershed markers: 1 = walls, k + 1 = core k, 0 = free space still to be assigned
+    markers = cores + 1
+    markers[cores == 0] = 0
+    markers[~free] = 1
+    cv2.watershed(cv2.merge([wall, wall, wall]), markers)
+    # cores touching the image border are the outside (watershed sets the border itself to -1)
+    inside = np.ones(n + 1, bool)
+    inside[:2] = False
+    inside[np.concatenate([cores[0], cores[-1], cores[:, 0], cores[:, -1]]) + 1] = False
+    in_room = free & inside[np.maximum(markers, 0)]
+    reached = cv2.distanceTransform(1 - core_mask, cv2.DIST_L2, 3) <= CORE_REACH * door_gap_px
+    room = in_room & reached
+    # the walls' basin floods only free space without a core: enclosed corridors and closets
+    rest = (in_room & ~reached) | (free & (markers == 1))
+    # watershed lines (-1) are 8-connected, so 4-connectivity keeps the rooms on both sides apart
+    n, labels, stats, centroids = cv2.connectedComponentsWithStats(room.view(np.uint8), connectivity=4)
+    n_rest, rest_labels, rest_stats, rest_centroids = cv2.connectedComponentsWithStats(rest.view(np.uint8),
+                                                                                       connectivity=4)
+    # leftovers reaching the image border are outside too; watershed took the border pixels
+    # themselves (-1), so look one pixel further in
+    edge = rest_labels[1:-1, 1:-1]
+    rest_stats[np.concatenate([edge[0], edge[-1], edge[:, 0], edge[:, -1]]), cv2.CC_STAT_AREA] = 0
+    labels[rest] = rest_labels[rest] + (n - 1)
+    n += n_rest - 1
+    stats = np.concatenate([stats, rest_stats[1:]])
+    wide = np.zeros(n, bool)
+    wide[labels[dist >= min_width_px / 2.0]] = True
+    stats[~wide, cv2.CC_STAT_AREA] = 0
+    return n, labels, stats, np.concatenate([centroids, rest_centroids[1:]])
+
+
+def segment_rooms(bin_img, hatch_close_px=3, stroke_px=2, wall_run_px=10, door_gap_px=40, min_width_px=12,
+                  min_room_px=1000, epsilon_factor=0.01):
+    """Rooms of a binary plan mask (255 = ink), see the module docstring for the schema."""
+    n, labels, stats, centroids = room_labels(bin_img, hatch_close_px, stroke_px, wall_run_px, door_gap_px,
+                                              min_width_px)
+    keep = stats[:, cv2.CC_STAT_AREA] >= min_room_px
+    keep[0] = False
+    if not keep.any():
+        return []
+    if not keep[1:].all():
+        labels[~keep[labels]] = 0
+    contours, hierarchy = cv2.findContours(labels, cv2.RETR_FLOODFILL, cv2.CHAIN_APPROX_SIMPLE)
+    points, offsets = pack_contours(contours)
+    # each region's first contour point lies on the region; room regions are connected, so
+    # their outer contour is the only top-level one carrying their label
+    first = points[offsets[:-1]]
+    owner = labels[first[:, 1], first[:, 0]]
+    outer = (hierarchy[0][:, 3] < 0) & (owner > 0)
+    # perimeter of every contour from one pass over the packed points (closing segment included)
+    nxt = np.arange(1, len(points) + 1)
+    nxt[offsets[1:] - 1] = offsets[:-1]
+    seg = np.hypot(*(points[nxt] - points).T.astype(np.float64))
+    perimeter = np.add.reduceat(seg, offsets[:-1]) if len(points) else np.zeros(0)
+
+    outline = {}
+    for i in np.flatnonzero(outer):
+        label = int(owner[i])
+        if label not in outline:
+            outline[label] = cv2.approxPolyDP(contours[i], epsilon_factor * perimeter[i], True).reshape(-1, 2)
+    result = []
+    for label in np.flatnonzero(keep):
+        x, y, w, h, area = stats[label].tolist()
+        poly = outline.get(int(label))
+        result.append({
+            "id": f"room_{len(result) + 1}",
+            "polygon_px": poly.tolist() if poly is not None else [[x, y], [x + w, y], [x + w, y + h], [x, y + h]],
+            "area_px": area,
+            "centroid_px": [round(float(c), 1) for c in centroids[label]],
+            "bbox_px": [x, y, w, h],
+        })
+    return result
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Segment the rooms of a floor plan image")
+    ap.add_argument("image", help="plan image, or its binary mask with --mask")
+    ap.add_argument("--mask", action="store_true", help="the image is already a binary mask (white = ink)")
+    ap.add_argument("--door-gap", type=int, default=None,
+                    help=f"widest opening (px) closed between two rooms (default {ROOM_DEFAULTS['door_gap_px']}, "
+                         f"or {ROOM_MM_DEFAULTS['door_width_mm']} mm with --px-to-mm)")
+    ap.add_argument("--px-to-mm", type=float, default=None,
+                    help="plan scale; door gap and smallest room then come from ROOM_MM_DEFAULTS")
+    ap.add_argument("--preview", help="write a colour preview of the rooms here")
+    args = ap.parse_args(argv)
+    if args.mask:
+        bin_img = cv2.imread(args.image, cv2.IMREAD_GRAYSCALE)
+    else:
+        from parse_floorplan import image_preprocess_for_contours
+        bin_img = image_preprocess_for_contours(cv2.imread(args.image))
+    if bin_img is None:
+        sys.exit(f"Cannot read {args.image}")
+    params = room_params(args.px_to_mm, **ROOM_MM_DEFAULTS)
+    if args.door_gap:
+        params["door_gap_px"] = args.door_gap
+    found = segment_rooms(bin_img, **params)
+    if args.preview:
+        vis = cv2.cvtColor(255 - wall_mask(bin_img, params["hatch_close_px"], params["stroke_px"],
+                                           params["wall_run_px"]), cv2.COLOR_GRAY2BGR)
+        colours = np.random.default_rng(1).integers(60, 230, (len(found), 3)).tolist()
+        for room, colour in zip(found, colours):
+            cv2.polylines(vis, [np.int32(room["polygon_px"])], True, colour, 2)
+            cv2.putText(vis, room["id"], tuple(int(c) for c in room["centroid_px"]), cv2.FONT_HERSHEY_SIMPLEX,
+                        0.4, colour, 1)
+        cv2.imwrite(args.preview, vis)
+    json.dump(found, sys.stdout, ensure_ascii=False, indent=1)
+    print()
+
+
+if __name__ == "__main__":
+    main()
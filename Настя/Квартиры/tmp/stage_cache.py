@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+stage_cache.py
+
+Content-addressed on-disk cache for the expensive stages of parse_floorplan.py and
+extract_upper_scheme.py (OCR, bilateral filtering, PDF rasterisation, contours, crop boxes).
+
+A cache key is the SHA-256 of the stage name plus its parameters; the first parameter is
+normally the content hash of the input file (file_digest) or the key of the upstream stage,
+so changing a downstream threshold reuses everything above it.
+
+Entries are single compressed .npz files: ndarrays are stored as arrays, the surrounding
+structure (dicts, lists, tuples, numbers, strings) as a small JSON header. Hits refresh the
+file mtime; when the directory grows past max_bytes the least recently used files are removed.
+
+Usage:
+    cache = StageCache("/tmp/plan_cache", max_bytes=512 * 2**20)
+    nums, ocr_key = cached(cache, "ocr", (file_digest(path), "rus+eng"), lambda: ocr_numbers(pil))
+"""
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from lazy_import import lazy_import
+
+np = lazy_import("numpy")
+
+DEFAULT_MAX_BYTES = 1024 * 2**20
+_META = "__meta__"
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """SHA-256 of a file's content."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def pack_contours(contours):
+    """OpenCV contour list -> (points Nx2 int32, offsets) for compact storage."""
+    lengths = np.fromiter(map(len, contours), dtype=np.int64, count=len(contours))
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    if not len(lengths):
+        return np.zeros((0, 2), dtype=np.int32), offsets
+    try:
+        # findContours output is (n, 1, 2) throughout: one concatenate, no per-contour reshape
+        points = np.concatenate(contours).reshape(-1, 2)
+    except ValueError:  # mixed (n, 2) / (n, 1, 2) shapes
+        points = np.concatenate([np.reshape(c, (-1, 2)) for c in contours])
+    return points.astype(np.int32, copy=False), offsets
+
+
+def unpack_contours(points, offsets):
+    """Inverse of pack_contours: list of (n,1,2) int32 arrays, as cv2.findContours returns."""
+    return [points[offsets[i]:offsets[i + 1]].reshape(-1, 1, 2) for i in range(len(offsets) - 1)]
+
+
+def _encode(value, arrays):
+    if isinstance(value, np.ndarray):
+        arrays.append(value)
+        return {"__nd__": len(arrays) - 1}
+    if isinstance(value, tuple):
+        return {"__tuple__": [_encode(v, arrays) for v in value]}
+    if isinstance(value, list):
+        return [_encode(v, arrays) for v in value]
+    if isinstance(value, dict):
+        return {str(k): _encode(v, arrays) for k, v in value.items()}
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _decode(node, arrays):
+    if isinstance(node, dict):
+        if "__nd__" in node:
+            return arrays[node["__nd__"]]
+        if "__tuple__" in node:
+            return tuple(_decode(v, arrays) for v in node["__tuple__"])
+        return {k: _decode(v, arrays) for k, v in node.items()}
+    if isinstance(node, list):
+        return [_decode(v, arrays) for v in node]
+    return node
+
+
+class StageCache:
+    """Size-bounded LRU store of stage outputs under a directory."""
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_bytes)
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, stage, parts):
+        blob = json.dumps([stage, _encode(parts, [])], sort_keys=True, default=str)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return self.root / key[:2] / f"{key}.npz"
+
+    def get(self, key):
+        """Return (True, value) on a hit, (False, None) otherwise."""
+        p = self._path(key)
+        try:
+            with np.load(p, allow_pickle=False) as z:
+                meta = json.loads(bytes(z[_META]).decode("utf-8"))
+                arrays = [z[f"a{i}"] for i in range(meta["n_arrays"])]
+        except FileNotFoundError:
+            return False, None
+        except Exception:
+            # truncated or foreign file: drop it and recompute
+            p.unlink(missing_ok=True)
+            return False, None
+        try:
+            os.utime(p)
+        except OSError:
+            pass
+        return True, _decode(meta["value"], arrays)
+
+    def put(self, key, value):
+        arrays = []
+        meta = {"value": _encode(value, arrays), "n_arrays": len(arrays)}
+        payload = {f"a{i}": a for i, a in enumerate(arrays)}
+        payload[_META] = np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8)
+        p = self._path(key)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        # write-then-rename so concurrent workers never see a half-written entry
+        fd, tmp = tempfile.mkstemp(dir=p.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(f, **payload)
+            os.replace(tmp, p)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        total = 0
+        for p in self.root.glob("*/*.npz"):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+            total += st.st_size
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for _, size, p in entries:
+            if total <= self.max_bytes:
+                break
+            p.unlink(missing_ok=True)
+            total -= size
+
+    def get_or_compute(self, stage, parts, compute):
+        key = self.key(stage, parts)
+        hit, value = self.get(key)
+        if hit:
+            self.hits += 1
+            return value, key
+        self.misses += 1
+        value = compute()
+        self.put(key, value)
+        return value, key
+
+
+def cached(cache, stage, parts, compute):
+    """Run compute() through cache when one is configured.
+
+    Returns (value, key); key is None without a cache. Pass key as a part of downstream
+    stages so they are invalidated together with their input.
+    """
+    if cache is None:
+        return compute(), None
+    return cache.get_or_compute(stage, parts, compute)
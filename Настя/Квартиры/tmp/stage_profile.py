@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+stage_profile.py
+
+Per-stage wall time, CPU time and peak RSS for parse_floorplan.py and extract_upper_scheme.py.
+
+Each named stage (OCR, preprocessing, contours, openings, SVG/preview writing, ...) is wrapped
+in a context manager that records:
+    - wall_s:      elapsed wall-clock time
+    - cpu_s:       CPU time of this process and its finished children (tesseract subprocesses
+                   started by pytesseract count towards the OCR stage)
+    - peak_rss_mb: peak resident set size reached during the stage. On Linux the kernel
+                   high-water mark is reset at the start of each stage, so this is the stage's
+                   own peak; elsewhere it is the process peak so far (monotonic).
+
+Batch runs aggregate the per-item stage lists with summarize() into a per-stage histogram.
+
+Usage:
+    prof = StageProfiler()
+    with profiled(prof, "ocr"):
+        nums = ocr_numbers(pil)
+    scene["meta"]["profile"] = prof.as_dict()
+
+    with cprofile_to("parsed_plan.prof"):   # view with snakeviz, or flameprof for a flamegraph
+        parse_plan(...)
+"""
+import bisect
+import os
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# fixed, log-spaced bucket edges (seconds) so histograms of different runs line up
+HISTOGRAM_EDGES_S = [0.001, 0.003, 0.01, 0.03, 0.1, 0.3, 1.0, 3.0, 10.0, 30.0]
+
+
+def _reset_peak_rss():
+    """Reset the kernel's RSS high-water mark (Linux); returns False where unsupported."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 2**20 if os.uname().sysname == "Darwin" else peak / 1024
+
+
+def _cpu_seconds():
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+class StageProfiler:
+    """Collects one record per stage, in execution order; repeated names are kept separately."""
+
+    def __init__(self):
+        self.stages = []
+        self._t0 = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        peak_resettable = _reset_peak_rss()
+        w0, c0 = time.perf_counter(), _cpu_seconds()
+        try:
+            yield
+        finally:
+            peak = _peak_rss_mb()
+            self.stages.append({
+                "stage": name,
+                "wall_s": round(time.perf_counter() - w0, 4),
+                "cpu_s": round(_cpu_seconds() - c0, 4),
+                "peak_rss_mb": round(peak, 1) if peak is not None else None,
+                "peak_is_stage_local": peak_resettable,
+            })
+
+    def as_dict(self):
+        peaks = [s["peak_rss_mb"] for s in self.stages if s["peak_rss_mb"] is not None]
+        return {
+            "wall_s": round(time.perf_counter() - self._t0, 4),
+            "cpu_s": round(sum(s["cpu_s"] for s in self.stages), 4),
+            "peak_rss_mb": max(peaks) if peaks else None,
+            "stages": list(self.stages),
+        }
+
+
+def profiled(profiler, name):
+    """profiler.stage(name), or a no-op context when profiling is off (profiler is None)."""
+    return profiler.stage(name) if profiler is not None else nullcontext()
+
+
+@contextmanager
+def cprofile_to(path):
+    """Run the block under cProfile and dump pstats to path; no-op when path is None."""
+    if path is None:
+        yield
+        return
+    import cProfile
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        yield
+    finally:
+        prof.disable()
+        prof.dump_stats(str(path))
+
+
+def _percentile(sorted_vals, q):
+    if not sorted_vals:
+        return None
+    i = (len(sorted_vals) - 1) * q
+    lo = int(i)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (i - lo)
+
+
+def summarize(profiles):
+    """Aggregate StageProfiler.as_dict() results of a batch into per-stage statistics.
+
+    Returns {stage: {n, total_s, mean_s, p50_s, p90_s, max_s, cpu_total_s, peak_rss_mb_max,
+    histogram: {edges_s, counts}}}, stages in first-seen order. counts has one more bucket than
+    edges_s: the last one collects everything >= the last edge.
+    """
+    walls, cpus, peaks = {}, {}, {}
+    for prof in profiles:
+        if not prof:
+            continue
+        for s in prof["stages"]:
+            walls.setdefault(s["stage"], []).append(s["wall_s"])
+            cpus.setdefault(s["stage"], []).append(s["cpu_s"])
+            if s["peak_rss_mb"] is not None:
+                peaks.setdefault(s["stage"], []).append(s["peak_rss_mb"])
+    summary = {}
+    for name, vals in walls.items():
+        vals = sorted(vals)
+        counts = [0] * (len(HISTOGRAM_EDGES_S) + 1)
+        for v in vals:
+            counts[bisect.bisect_right(HISTOGRAM_EDGES_S, v)] += 1
+        summary[name] = {
+            "n": len(vals),
+            "total_s": round(sum(vals), 4),
+            "mean_s": round(sum(vals) / len(vals), 4),
+            "p50_s": round(_percentile(vals, 0.5), 4),
+            "p90_s": round(_percentile(vals, 0.9), 4),
+            "max_s": vals[-1],
+            "cpu_total_s": round(sum(cpus[name]), 4),
+            "peak_rss_mb_max": max(peaks[name]) if name in peaks else None,
+            "histogram": {"edges_s": HISTOGRAM_EDGES_S, "counts": counts},
+        }
+    return summary
+
+
+def format_summary(summary):
+    """Text table of summarize() output, one row per stage with a bucket-count histogram."""
+    labels = ["<1ms"] + [f"<{e:g}s" for e in HISTOGRAM_EDGES_S[1:]] + [f">={HISTOGRAM_EDGES_S[-1]:g}s"]
+    grand = sum(s["total_s"] for s in summary.values()) or 1.0
+    lines = [f"{'stage':22s} {'n':>5s} {'mean':>8s} {'p50':>8s} {'p90':>8s} {'max':>8s} {'share':>6s}  histogram"]
+    for name, s in summary.items():
+        hist = " ".join(f"{labels[i]}:{c}" for i, c in enumerate(s["histogram"]["counts"]) if c)
+        lines.append(f"{name:22s} {s['n']:5d} {s['mean_s']:8.3f} {s['p50_s']:8.3f} {s['p90_s']:8.3f} "
+                     f"{s['max_s']:8.3f} {s['total_s'] / grand:6.1%}  {hist}")
+    return "\n".join(lines)
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+sweep_floorplan.py
+
+Parameter sweeps for parse_floorplan.py and extract_upper_scheme.py in one process.
+
+Every combination of a parameter grid is evaluated, but each intermediate (rendered page,
+crop, grayscale, blurred image, binary mask, components, contours) is computed once per
+distinct set of upstream parameters and shared by every combination below it. Results can
+be scored against a ground-truth JSON in the bench_floorplan.py synth format.
+
+Usage:
+    python sweep_floorplan.py extract page-6.pdf --grid block_size=15,21,31 --grid thresh_c=5,9 \\
+        --grid std_ratio_thresh=0.25,0.35 [--page 1] [--truth plan.truth.json] [--top 10] [--json sweep.json]
+    python sweep_floorplan.py parse "7.1 2Д.png" --grid epsilon_factor=0.005,0.01,0.02 --grid block_size=11,15
+    python sweep_floorplan.py extract page-6.pdf --list     # stages, their parameters and defaults
+
+    # synthetic plan with ground truth, then sweep against it
+    python bench_floorplan.py synth --out /tmp/synth --size 2000x1400
+    python sweep_floorplan.py parse /tmp/synth/synth_2000x1400_0.png --truth /tmp/synth/synth_2000x1400_0.truth.json \\
+        --grid block_size=11,15,21 --grid min_bbox_dim=5,10,20
+
+Notes:
+    - Combinations run with upstream parameters varying slowest, so image-sized intermediates
+      on the main chain keep only their latest value; results of side branches (door arcs,
+      outlines, openings) are kept for the whole sweep.
+    - The parse sweep skips OCR (no mm scale); geometry is scored in pixels.
+    - Extract ground truth is in page pixels at zoom 2 (as written by bench_floorplan.py synth);
+      results of other zooms are scaled to it before scoring.
+    - With --truth combinations are ranked by the mean of the available metrics (outline IoU and
+      opening / door recall); without it they are listed in grid order with their counts.
+"""
+import argparse
+import inspect
+import itertools
+import json
+import sys
+import time
+import warnings
+from collections import namedtuple
+from pathlib import Path
+
+import cv2
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE))
+warnings.filterwarnings("ignore", message=".*fitz.*deprecated")
+
+import parse_floorplan as pf  # noqa: E402
+import extract_upper_scheme as eus  # noqa: E402
+
+TRUTH_ZOOM = 2.0
+
+# one pipeline step: inputs are names of earlier stages, params {name: default}
+Stage = namedtuple("Stage", "name inputs params fn")
+
+
+def _defaults(fn, *names):
+    """Default values of fn's keyword parameters, so the sweep follows the pipeline's own defaults."""
+    sig = inspect.signature(fn).parameters
+    return {n: sig[n].default for n in names}
+
+
+def _pick(d, *names):
+    return {n: d[n] for n in names}
+
+
+def extract_stages(page):
+    """extract_upper_scheme.py's raster pipeline for one PDF page as a stage graph."""
+
+    def crop(page_arr, white_thresh, min_area, pad):
+        box = eus.find_top_region_and_crop(page_arr, white_thresh=white_thresh, min_area=min_area, pad=pad)
+        x0, y0, x1, y1 = box
+        return box, page_arr[y0:y1, x0:x1]
+
+    crop_defaults = eus.PREPROCESS_CROP_DEFAULTS
+    return [
+        Stage("render", (), {"zoom": 2.0}, lambda zoom: eus.render_page(page, zoom)),
+        Stage("crop", ("render",), _defaults(eus.find_top_region_and_crop, "white_thresh", "min_area", "pad"), crop),
+        Stage("gray", ("crop",), {}, lambda c: cv2.cvtColor(c[1], cv2.COLOR_RGB2GRAY)),
+        Stage("blur", ("gray",), _pick(crop_defaults, "blur_ksize"),
+              lambda gray, blur_ksize: cv2.GaussianBlur(gray, (blur_ksize, blur_ksize), 0)),
+        Stage("binary", ("blur",), _pick(crop_defaults, "block_size", "thresh_c", "close_iterations"), eus.binarize_crop),
+        Stage("components", ("binary",), _pick(crop_defaults, "min_component_area"), eus.crop_components),
+        Stage("raw_contours", ("binary",), {},
+              lambda binary: cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[0]),
+        Stage("contours", ("components",), _defaults(eus.extract_contours_from_crop, "approx_epsilon_factor"),
+              lambda pre, approx_epsilon_factor: eus.extract_contours_from_crop(
+                  None, approx_epsilon_factor=approx_epsilon_factor, pre=pre)),
+        Stage("door_arcs", ("raw_contours",),
+              _defaults(eus.detect_door_arcs, "area_min", "area_max", "std_ratio_thresh", "coverage_min_deg",
+                        "coverage_max_deg"),
+              lambda contours, **p: eus.detect_door_arcs(contours, **p)),
+    ]
+
+
+def parse_stages(cv_img):
+    """parse_floorplan.py's full-resolution pipeline (without OCR) as a stage graph."""
+    prep = pf.PREPROCESS_DEFAULTS
+    return [
+        Stage("gray", (), {}, lambda: cv2.cvtColor(cv_img, cv2.COLOR_BGR2GRAY)),
+        Stage("smooth", ("gray",), _pick(prep, "bilateral_d", "sigma_color", "sigma_space"), pf.smooth_for_contours),
+        Stage("binary", ("smooth",), _pick(prep, "block_size", "thresh_c"), pf.binarize_for_contours),
+        Stage("contours_list", ("binary",), {},
+              lambda binary: cv2.findContours(binary, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)[0]),
+        Stage("outline", ("binary",), dict(pf.OUTLINE_DEFAULTS), pf.main_outline),
+        Stage("openings", ("contours_list", "outline"), _defaults(pf.detect_openings_from_small_contours, "min_bbox_dim"),
+              lambda contours, poly, min_bbox_dim: pf.detect_openings_from_small_contours(
+                  contours, poly or [], min_bbox_dim=min_bbox_dim)),
+    ]
+
+
+def sweep(stages, grid, stats=None):
+    """Yield (params, values) for every combination of grid; values maps stage name -> result.
+
+    grid: {param: [values]} for any subset of the stages' parameters; the rest use their defaults.
+    Each stage result is memoised on (its own params, its inputs' keys). Combinations are
+    enumerated in stage order, so a stage whose upstream swept parameters are a prefix of that
+    order sees each key in one contiguous run and keeps a single memo slot.
+    stats: optional dict filled with {stage: {"computed": n, "seconds": s}}.
+    """
+    known = [p for s in stages for p in s.params]
+    unknown = sorted(set(grid) - set(known))
+    if unknown:
+        raise ValueError(f"Unknown parameter(s) {', '.join(unknown)}; this pipeline has: {', '.join(known)}")
+    swept = [p for p in known if p in grid]
+
+    upstream = {}
+    for s in stages:
+        upstream[s.name] = set(s.params).union(*(upstream[i] for i in s.inputs))
+    single_slot = {}
+    for s in stages:
+        mine = upstream[s.name] & set(swept)
+        single_slot[s.name] = mine == set(swept[:len(mine)])
+
+    memo = {s.name: {} for s in stages}
+    if stats is not None:
+        stats.update((s.name, {"computed": 0, "seconds": 0.0}) for s in stages)
+    for combo in itertools.product(*(grid[p] for p in swept)):
+        params = dict(zip(swept, combo))
+        keys, values = {}, {}
+        for s in stages:
+            own = {p: params.get(p, d) for p, d in s.params.items()}
+            key = (tuple(own.items()), tuple(keys[i] for i in s.inputs))
+            cache = memo[s.name]
+            if key not in cache:
+                if single_slot[s.name]:
+                    cache.clear()
+                t0 = time.perf_counter()
+                cache[key] = s.fn(*(values[i] for i in s.inputs), **own)
+                if stats is not None:
+                    stats[s.name]["computed"] += 1
+                    stats[s.name]["seconds"] += time.perf_counter() - t0
+            keys[s.name] = key
+            values[s.name] = cache[key]
+        yield params, values
+
+
+def extract_result(values, zoom, scale=1.0):
+    """Page-coordinate result (extract JSON field names) of one extract combination, scaled by `scale`."""
+    (x0, y0, _, _), _ = values["crop"]
+    main_poly, openings = values["contours"]
+    s = scale
+    return {
+        "apartment_outline_page": [[(px + x0) * s, (py + y0) * s] for px, py in (main_poly or [])],
+        "openings_page": [{"center_page": [(o["center"][0] + x0) * s, (o["center"][1] + y0) * s], "area": o["area"]}
+                          for o in openings],
+        "door_arcs_page": [{"center_page": [(d["center_px"][0] + x0) * s, (d["center_px"][1] + y0) * s],
+                            "radius_px": d["radius_px"] * s}
+                           for d in values["door_arcs"]],
+    }
+
+
+def parse_result(values):
+    poly = values["outline"]
+    return {"walls_px": [{"id": "outer", "polyline_px": poly}] if poly else [], "openings": values["openings"]}
+
+
+def _counts(kind, result):
+    if kind == "extract":
+        return {"outline_vertices": len(result["apartment_outline_page"]), "openings": len(result["openings_page"]),
+                "door_arcs": len(result["door_arcs_page"])}
+    walls = result["walls_px"]
+    return {"outline_vertices": len(walls[0]["polyline_px"]) if walls else 0, "openings": len(result["openings"])}
+
+
+def _overall(metrics):
+    vals = [metrics[k] for k in ("outline_iou", "openings_recall", "door_recall") if metrics.get(k) is not None]
+    return round(sum(vals) / len(vals), 4) if vals else None
+
+
+def _grid_values(text):
+    name, _, vals = text.partition("=")
+    if not vals:
+        raise argparse.ArgumentTypeError(f"expected name=v1,v2,... got {text!r}")
+    out = []
+    for v in vals.split(","):
+        try:
+            out.append(json.loads(v))
+        except ValueError:
+            out.append(v)
+    return name.strip(), out
+
+
+def run(args):
+    truth = json.loads(Path(args.truth).read_text(encoding="utf-8")) if args.truth else None
+    if truth is not None:
+        from bench_floorplan import score_extract, score_parse
+
+    doc = None
+    if args.kind == "extract":
+        doc = eus.fitz.open(args.input)
+        stages = extract_stages(doc.load_page(args.page - 1))
+    else:
+        cv_img = cv2.imread(args.input)
+        if cv_img is None:
+            print(f"Cannot open image: {args.input}")
+            return 2
+        stages = parse_stages(cv_img)
+
+    if args.list:
+        for s in stages:
+            params = ", ".join(f"{k}={v}" for k, v in s.params.items()) or "-"
+            print(f"{s.name:14s} <- {', '.join(s.inputs) or 'input':24s} {params}")
+        return 0
+
+    grid = {}
+    for name, vals in args.grid:
+        grid.setdefault(name, []).extend(vals)
+    stats = {}
+    results = []
+    t0 = time.perf_counter()
+    try:
+        for params, values in sweep(stages, grid, stats):
+            if args.kind == "extract":
+                zoom = params.get("zoom", stages[0].params["zoom"])
+                result = extract_result(values, zoom, scale=TRUTH_ZOOM / zoom if truth else 1.0)
+            else:
+                result = parse_result(values)
+            rec = {"params": params, "counts": _counts(args.kind, result)}
+            if truth is not None:
+                rec["metrics"] = score_extract(result, truth) if args.kind == "extract" else score_parse(result, truth)
+                rec["score"] = _overall(rec["metrics"])
+            results.append(rec)
+    except (ValueError, RuntimeError) as e:
+        print(e)
+        return 2
+    finally:
+        if doc is not None:
+            doc.close()
+    wall = time.perf_counter() - t0
+
+    ranked = sorted(results, key=lambda r: -(r["score"] or 0)) if truth is not None else results
+    for i, rec in enumerate(ranked[:args.top], 1):
+        params = " ".join(f"{k}={v}" for k, v in rec["params"].items())
+        counts = " ".join(f"{k}={v}" for k, v in rec["counts"].items())
+        score = f"score={rec['score']} " if "score" in rec else ""
+        print(f"{i:3d}. {score}{params}  [{counts}]")
+    print(f"{len(results)} combinations in {wall:.2f}s; stage computations: "
+          + ", ".join(f"{k} {v['computed']}" for k, v in stats.items()))
+
+    if args.json:
+        report = {
+            "kind": args.kind,
+            "input": str(args.input),
+            "truth": str(args.truth) if args.truth else None,
+            "grid": grid,
+            "wall_s": round(wall, 4),
+            "stages": {k: {"computed": v["computed"], "seconds": round(v["seconds"], 4)} for k, v in stats.items()},
+            "results": ranked,
+        }
+        Path(args.json).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print("Saved report:", args.json)
+    return 0
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.split("\n\n")[1].strip())
+    p.add_argument("kind", choices=("extract", "parse"), help="pipeline: extract_upper_scheme (PDF) or parse_floorplan (image)")
+    p.add_argument("input", help="PDF for extract, PNG/JPG for parse")
+    p.add_argument("--grid", type=_grid_values, action="append", default=[], metavar="NAME=V1,V2,...",
+                   help="values to try for one parameter (repeatable); see --list")
+    p.add_argument("--page", type=int, default=1, help="extract: 1-based page number")
+    p.add_argument("--truth", default=None, help="ground-truth JSON (bench_floorplan.py synth format) to score against")
+    p.add_argument("--top", type=int, default=10, help="print this many combinations")
+    p.add_argument("--json", default=None, help="write every combination with counts/metrics here")
+    p.add_argument("--list", action="store_true", help="print the stage graph with parameters and defaults")
+    return run(p.parse_args(argv))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the scripts are plain top-level modules next to this folder
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
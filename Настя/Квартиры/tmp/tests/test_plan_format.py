@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from plan_format import FORMATS, iter_plans, load_plan, pack, plan_polygons, to_lists, write_plan
+
+
+def _scene():
+    return {
+        "image": "7.1 2Д.png",
+        "scale_info": {"px_to_mm": 5.25, "scale_value_mm": None},
+        "walls_px": [{"id": "wall_1", "polyline_px": [[0, 0], [120, 0], [120, 80], [0, 80]]},
+                     {"id": "wall_2", "polyline_px": [[10, 10], [30, 10], [30, 40]]}],
+        "openings": [{"id": "op_1", "center": [60.5, 0.0], "bbox": [50, -4, 21, 8], "width_mm": 900}],
+        "detected_numbers_ocr": [{"text": "3200", "bbox": [5, 6, 40, 12], "center": [25.0, 12.0], "conf": 91},
+                                 {"text": "1500", "bbox": [80, 6, 38, 12], "center": [99.0, 12.0], "conf": 88.5}],
+        "door_arcs": [],
+        "meta": {"extras": ["rooms"], "big": 2**40, "profile": {"ocr": {"wall_s": 0.123456789}}},
+    }
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_round_trip(tmp_path, fmt):
+    scene = _scene()
+    path = write_plan(tmp_path / "parsed_plan", scene, fmt)
+    assert to_lists(load_plan(path, columns=False)) == scene
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_columns(tmp_path, fmt):
+    plan = load_plan(write_plan(tmp_path / "parsed_plan", _scene(), fmt))
+    ocr = plan["detected_numbers_ocr"]
+    assert list(ocr["text"]) == ["3200", "1500"]
+    assert ocr["bbox"].shape == (2, 4) and ocr["bbox"].dtype == np.int32
+    assert ocr["center"].dtype == np.float64
+    # ragged polylines stay one array per wall
+    assert [p.shape for p in plan_polygons(plan)] == [(4, 2), (3, 2)]
+
+
+def test_pack_keeps_exact_values():
+    packed = pack({"pts": [[0.1, 2], [3, 4.5]], "ints": [[2**31, 0], [1, 2]]})
+    assert packed["pts"].dtype == np.float64 and packed["pts"][0, 0] == 0.1
+    # out of int32 range: kept as int64, not wrapped
+    assert packed["ints"][0, 0] == 2**31
+
+
+def test_iter_plans_jsonl(tmp_path):
+    from plan_format import dumps_line
+    scenes = [_scene(), dict(_scene(), image="other.png")]
+    path = tmp_path / "batch_plans.jsonl"
+    path.write_text("".join(dumps_line(s) + "\n" for s in scenes), encoding="utf-8")
+    assert [to_lists(p) for p in iter_plans(path, columns=False)] == scenes
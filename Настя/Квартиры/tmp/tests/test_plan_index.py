@@ -0,0 +1,43 @@
+import random
+
+import pytest
+
+from plan_index import BKTree, hamming
+
+
+def _hashes(n, seed):
+    rng = random.Random(seed)
+    centres = [rng.getrandbits(256) for _ in range(8)]
+    hashes = []
+    for _ in range(n):
+        # near-duplicates around a few plans, and some unrelated ones
+        h = rng.choice(centres) if rng.random() < 0.8 else rng.getrandbits(256)
+        for bit in rng.sample(range(256), rng.randint(0, 40)):
+            h ^= 1 << bit
+        hashes.append(h)
+    return hashes
+
+
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("max_distance", [0, 5, 24, 60])
+def test_search_matches_brute_force(seed, max_distance):
+    hashes = _hashes(400, seed)
+    tree = BKTree()
+    for i, h in enumerate(hashes):
+        tree.add(h, i)
+    for q in _hashes(30, seed + 100) + hashes[:10]:
+        found = tree.search(q, max_distance)
+        expected = sorted((hamming(q, h), i) for i, h in enumerate(hashes) if hamming(q, h) <= max_distance)
+        assert sorted(found) == expected
+        # nearest first
+        assert [d for d, _ in found] == sorted(d for d, _ in found)
+
+
+def test_duplicates_and_empty():
+    tree = BKTree()
+    assert tree.search(123, 10) == []
+    tree.add(0b1011, "a")
+    tree.add(0b1011, "b")
+    tree.add(0b0011, "c")
+    assert tree.search(0b1011, 0) == [(0, "a"), (0, "b")]
+    assert sorted(tree.search(0b1011, 1)) == [(0, "a"), (0, "b"), (1, "c")]
@@ -0,0 +1,37 @@
+import cv2
+import numpy as np
+import pytest
+
+from rooms import room_params, segment_rooms
+
+
+def _two_rooms(margin, door=30, wall=8):
+    """400 x 300 px flat split by a wall with a door gap; 255 = ink."""
+    img = np.zeros((300 + 2 * margin, 400 + 2 * margin), np.uint8)
+    cv2.rectangle(img, (margin, margin), (margin + 399, margin + 299), 255, wall)
+    x = margin + 200
+    cv2.line(img, (x, margin), (x, margin + 130), 255, wall)
+    cv2.line(img, (x, margin + 130 + door), (x, margin + 299), 255, wall)
+    return img
+
+
+@pytest.mark.parametrize("margin", [3, 10, 60])
+def test_door_gap_splits_rooms(margin):
+    rooms = segment_rooms(_two_rooms(margin))
+    # the margin outside the flat is never a room, however thin
+    assert len(rooms) == 2
+    left, right = sorted(rooms, key=lambda r: r["centroid_px"][0])
+    assert left["centroid_px"][0] < margin + 200 < right["centroid_px"][0]
+    for room in rooms:
+        assert 50000 < room["area_px"] < 60000
+        x, y, w, h = room["bbox_px"]
+        assert margin < x and margin < y and x + w < margin + 400 and y + h < margin + 300
+
+
+def test_wider_opening_joins_rooms():
+    assert len(segment_rooms(_two_rooms(60, door=120))) == 1
+
+
+def test_room_params_from_scale():
+    params = room_params(px_to_mm=10.0)
+    assert params["door_gap_px"] == 100 and params["min_width_px"] == 50 and params["min_room_px"] == 10000
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from stage_cache import StageCache, cached, pack_contours, unpack_contours
+
+
+def _contours(seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 5000, size=(n, 1, 2)).astype(np.int32) for n in (1, 4, 250, 2)]
+
+
+def test_contours_round_trip():
+    contours = _contours()
+    points, offsets = pack_contours(contours)
+    assert points.shape == (257, 2) and points.dtype == np.int32
+    assert offsets.tolist() == [0, 1, 5, 255, 257]
+    back = unpack_contours(points, offsets)
+    assert len(back) == len(contours)
+    for a, b in zip(back, contours):
+        assert a.shape == b.shape and np.array_equal(a, b)
+
+
+def test_contours_mixed_shapes_and_empty():
+    contours = [np.array([[1, 2], [3, 4]]), np.array([[[5, 6]]])]
+    back = unpack_contours(*pack_contours(contours))
+    assert [c.reshape(-1, 2).tolist() for c in back] == [[[1, 2], [3, 4]], [[5, 6]]]
+    points, offsets = pack_contours([])
+    assert points.shape == (0, 2) and unpack_contours(points, offsets) == []
+
+
+def test_cache_round_trip(tmp_path):
+    cache = StageCache(tmp_path)
+    points, offsets = pack_contours(_contours())
+    value = {"points": points, "offsets": offsets, "box": (1, 2, 3, 4), "nums": [{"text": "3200"}]}
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return value
+
+    first, key = cached(cache, "contours", ("digest", 0.5), compute)
+    again, key2 = cached(cache, "contours", ("digest", 0.5), compute)
+    assert key == key2 and len(calls) == 1 and (cache.hits, cache.misses) == (1, 1)
+    assert again["box"] == (1, 2, 3, 4) and again["nums"] == [{"text": "3200"}]
+    assert np.array_equal(again["points"], points) and np.array_equal(again["offsets"], offsets)
+    # another parameter is another entry
+    cached(cache, "contours", ("digest", 0.6), compute)
+    assert len(calls) == 2
+
+
+def test_truncated_entry_is_recomputed(tmp_path):
+    cache = StageCache(tmp_path)
+    _, key = cached(cache, "ocr", ("digest",), lambda: [1, 2])
+    cache._path(key).write_bytes(b"not an npz")
+    assert cache.get(key) == (False, None)
+    assert not cache._path(key).exists()
+
+
+@pytest.mark.parametrize("max_bytes", [0, 10**9])
+def test_eviction(tmp_path, max_bytes):
+    cache = StageCache(tmp_path, max_bytes=max_bytes)
+    cached(cache, "ocr", ("a",), lambda: np.zeros(1000))
+    assert len(list(tmp_path.glob("*/*.npz"))) == (0 if max_bytes == 0 else 1)
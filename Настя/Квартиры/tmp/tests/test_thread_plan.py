@@ -0,0 +1,36 @@
+import random
+
+import pytest
+
+from thread_plan import PIPELINE_STAGE_WEIGHTS, plan_pipeline_threads, split_cores
+
+
+def test_split_cores_random():
+    rng = random.Random(0)
+    for _ in range(5000):
+        weights = {f"s{i}": rng.choice([rng.uniform(0.01, 100), rng.randint(1, 5)]) for i in range(rng.randint(1, 6))}
+        cores = rng.randint(1, 64)
+        split = split_cores(cores, weights)
+        assert split.keys() == weights.keys()
+        assert min(split.values()) >= 1
+        # exactly the cores, unless there are more stages than cores (one thread each)
+        assert sum(split.values()) == max(cores, len(weights))
+
+
+@pytest.mark.parametrize("cores, weights, expected", [
+    (8, {"a": 1, "b": 1}, {"a": 4, "b": 4}),
+    (7, {"a": 2, "b": 1}, {"a": 5, "b": 2}),
+    (3, {"a": 100, "b": 1, "c": 1}, {"a": 1, "b": 1, "c": 1}),
+    (4, {"a": 100, "b": 1, "c": 1}, {"a": 2, "b": 1, "c": 1}),
+])
+def test_split_cores_examples(cores, weights, expected):
+    assert split_cores(cores, weights) == expected
+
+
+@pytest.mark.parametrize("ocr", sorted(PIPELINE_STAGE_WEIGHTS))
+@pytest.mark.parametrize("cores", [1, 2, 3, 4, 8, 16])
+def test_pipeline_cpu_stages_fit_the_cores(ocr, cores):
+    plan = plan_pipeline_threads(cores=cores, ocr=ocr)
+    weights = PIPELINE_STAGE_WEIGHTS[ocr]
+    cpu = sum(n for name, n in plan["stages"].items() if name in weights)
+    assert cpu == max(cores, len(weights))
@@ -0,0 +1,32 @@
+import numpy as np
+
+from wall_graph import grid_cells, grid_pairs, merge_segments, snap_graph
+
+
+def test_double_line_wall_merges_thin_line_dropped():
+    segs = np.array([[0, 0, 100, 0], [0, 8, 100, 8], [0, 50, 100, 50]], np.float64)
+    [(x0, y0, x1, y1, thickness)] = merge_segments(segs)
+    assert (x0, y0, x1, y1) == (0.0, 4.0, 100.0, 4.0)
+    assert thickness == 9.0
+
+
+def test_snap_corners_and_t_junction():
+    # a slightly sloppy rectangle and an interior wall ending on both long walls
+    walls = [(0, 0, 200, 2, 10), (203, 0, 201, 150, 10), (198, 152, 1, 149, 10), (-2, 151, 1, 3, 10),
+             (100, 1, 100, 148, 10)]
+    nodes, edges = snap_graph(walls)
+    assert len(nodes) == 6
+    assert len(edges) == 7
+    degree = np.bincount([v for e in edges for v in e["nodes"]])
+    assert sorted(degree.tolist()) == [2, 2, 2, 2, 3, 3]
+
+
+def test_grid_pairs_finds_all_close_pairs():
+    rng = np.random.default_rng(0)
+    pts = rng.uniform(0, 500, size=(300, 2))
+    cells = grid_cells(np.concatenate([pts, pts], axis=1), 10)
+    found = {tuple(p) for p in grid_pairs(cells, cells).tolist() if p[0] < p[1]}
+    close = {(i, j) for i in range(len(pts)) for j in range(i + 1, len(pts))
+             if np.hypot(*(pts[i] - pts[j])) <= 10}
+    # candidates are a superset of every pair within one cell size
+    assert close <= found
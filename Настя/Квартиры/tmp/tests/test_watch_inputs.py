@@ -0,0 +1,120 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from watch_inputs import WatchManifest, params_hash, sync_once
+
+PHASH = params_hash({"ocr": "full"})
+
+
+def _worker(path, out):
+    """watch worker protocol: "die*" kills its process, "bad*" fails, anything else is copied."""
+    name = Path(path).name
+    if name.startswith("die"):
+        os._exit(1)
+    if name.startswith("bad"):
+        return {"status": "error", "error": "bad input", "outputs": []}
+    Path(out).mkdir(parents=True, exist_ok=True)
+    dst = Path(out) / "plan.json"
+    dst.write_text(Path(path).read_text())
+    return {"status": "ok", "seconds": 0.0, "outputs": [str(dst)]}
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    inp, out = tmp_path / "in", tmp_path / "out"
+    inp.mkdir()
+    out.mkdir()
+    return inp, out
+
+
+def _sync(manifest, out, phash=PHASH):
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        return sync_once(manifest, "*.txt", out, _worker, phash, pool, log=lambda *_: None)
+
+
+def _bump(path, text=None):
+    if text is not None:
+        path.write_text(text)
+    st = path.stat()
+    # an older mtime: a newer one would count as still being copied (settle)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns - 10**10))
+
+
+def test_only_new_and_changed_inputs_run(dirs):
+    inp, out = dirs
+    (inp / "a.txt").write_text("a")
+    (inp / "b.txt").write_text("b")
+    manifest = WatchManifest(out / "watch_manifest.json", inp)
+    assert _sync(manifest, out)["processed"] == 2
+    assert (out / "a" / "plan.json").read_text() == "a"
+    assert _sync(manifest, out)["processed"] == 0
+
+    # touched with the same content: only the manifest follows
+    _bump(inp / "a.txt")
+    assert _sync(manifest, out)["processed"] == 0
+    assert manifest.items["a.txt"]["mtime_ns"] == (inp / "a.txt").stat().st_mtime_ns
+
+    _bump(inp / "b.txt", "b2")
+    assert _sync(manifest, out)["processed"] == 1
+    assert (out / "b" / "plan.json").read_text() == "b2"
+
+    # other parameters redo everything
+    assert _sync(manifest, out, params_hash({"ocr": "regions"}))["processed"] == 2
+
+
+def test_removed_input_loses_its_outputs(dirs):
+    inp, out = dirs
+    (inp / "a.txt").write_text("a")
+    manifest = WatchManifest(out / "watch_manifest.json", inp)
+    _sync(manifest, out)
+    (inp / "a.txt").unlink()
+    assert _sync(manifest, out)["removed"] == 1
+    assert "a.txt" not in manifest.items and not (out / "a").exists()
+
+
+def test_failed_input_waits_for_a_change(dirs):
+    inp, out = dirs
+    (inp / "bad.txt").write_text("x")
+    manifest = WatchManifest(out / "watch_manifest.json", inp)
+    assert _sync(manifest, out)["failed"] == 1
+    assert manifest.items["bad.txt"]["error"] == "bad input"
+    assert _sync(manifest, out)["processed"] == 0
+    _bump(inp / "bad.txt", "y")
+    assert _sync(manifest, out)["processed"] == 1
+
+
+def test_dead_worker_only_fails_its_own_input(dirs):
+    inp, out = dirs
+    for name in ("a", "b", "c", "d", "die"):
+        (inp / f"{name}.txt").write_text(name)
+    manifest = WatchManifest(out / "watch_manifest.json", inp)
+
+    stats = _sync(manifest, out)
+    assert stats["broken"]
+    # inputs lost with the pool are not recorded, they become suspects
+    assert "die.txt" not in manifest.items and "die.txt" in manifest.suspects
+    for rel in ("a.txt", "b.txt", "c.txt", "d.txt"):
+        assert manifest.items.get(rel, {}).get("status") == "ok" or rel in manifest.suspects
+
+    # next pass, new pool: each suspect runs alone, so only the crasher is recorded as failed
+    _sync(manifest, out)
+    assert manifest.items["die.txt"]["status"] == "error"
+    assert "worker process died" in manifest.items["die.txt"]["error"]
+    assert all(manifest.items[f"{n}.txt"]["status"] == "ok" for n in "abcd")
+    assert not manifest.suspects
+    assert _sync(manifest, out)["processed"] == 0
+
+
+def test_manifest_resumes(dirs):
+    inp, out = dirs
+    (inp / "a.txt").write_text("a")
+    manifest = WatchManifest(out / "watch_manifest.json", inp)
+    _sync(manifest, out)
+    reopened = WatchManifest.open(out / "watch_manifest.json", inp)
+    assert reopened.items == manifest.items
+    assert _sync(reopened, out)["processed"] == 0
+    with pytest.raises(ValueError):
+        WatchManifest.open(out / "watch_manifest.json", out)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+thread_plan.py
+
+Core-aware thread budgets for the parallel runs of parse_floorplan.py and extract_upper_scheme.py.
+
+Left alone, OpenCV starts a thread pool as large as the machine and tesseract runs OpenMP with
+one thread per core, in every process. N worker processes then put N * cores threads on the
+same cores, and a parallel batch ends up slower than a serial one. plan_threads() decides once,
+from the usable core count and what the tasks spend their time on, how many workers to run and
+how many threads each of them may use:
+
+    workers       worker processes (threads for --serve) working on different images/pages
+    cv_threads    cv2.setNumThreads() in each worker
+    omp_threads   OMP_THREAD_LIMIT for the tesseract runs of each worker
+    ocr_threads   label regions recognised in parallel per worker (--ocr regions)
+    tile_threads  threads for tiled / pyramid preprocessing per worker
+
+The stages of one task run one after another, so each of them may use the worker's whole share
+of the cores, but no more: workers * share <= cores. Few tasks on a big machine leave a share
+of several cores to every worker; a long batch gets one single-threaded worker per core. With a
+per-worker memory estimate the worker count is also capped by the available memory.
+apply_thread_plan() installs a plan (ProcessPoolExecutor initializer), format_plan() is the
+report the scripts print and store in their manifests ("thread_plan").
+
+plan_pipeline_threads() does the same for plan_pipeline.py, where the stages run side by side
+in one process: the cores are split between the CPU stages by their expected share of the work
+(largest remainder, so the stages never hold more threads than cores). Every stage needs one
+thread, so only a machine with fewer cores than CPU stages runs more (threads_per_core > 1).
+
+Usage:
+    python thread_plan.py --tasks 40 [--ocr full|regions|none] [--workers 4] [--pipeline]
+"""
+import argparse
+import os
+from pathlib import Path
+
+from lazy_import import lazy_import
+
+cv2 = lazy_import("cv2")
+
+# tesseract's OpenMP parts gain little beyond a few threads; spare cores are better used elsewhere
+TESSERACT_MAX_THREADS = 4
+
+# relative CPU time of the plan_pipeline.py stages per OCR mode (load and write are I/O bound)
+PIPELINE_STAGE_WEIGHTS = {
+    "full": {"preprocess": 1.0, "contours": 1.0, "ocr": 3.0},
+    "regions": {"preprocess": 1.0, "contours": 1.0, "ocr": 1.0},
+}
+PIPELINE_IO_WORKERS = 2
+
+
+def usable_cores():
+    """Cores this process may run on: the CPU affinity mask, capped by a cgroup v2 CPU quota (containers)."""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:  # macOS / Windows
+        cores = os.cpu_count() or 1
+    try:
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()[:2]
+        if quota != "max":
+            cores = min(cores, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(1, cores)
+
+
+def available_memory_mb():
+    """MemAvailable (Linux), capped by a cgroup v2 memory limit; None where it can't be read."""
+    try:
+        with open("/proc/meminfo") as f:
+            avail = next(int(line.split()[1]) / 1024 for line in f if line.startswith("MemAvailable:"))
+    except (OSError, StopIteration, ValueError):
+        return None
+    try:
+        limit = Path("/sys/fs/cgroup/memory.max").read_text().strip()
+        used = Path("/sys/fs/cgroup/memory.current").read_text().strip()
+        if limit != "max":
+            avail = min(avail, (int(limit) - int(used)) / 2**20)
+    except (OSError, ValueError):
+        pass
+    return max(0.0, avail)
+
+
+def plan_threads(tasks, workers=None, cores=None, ocr=None, worker_memory_mb=None):
+    """Process/thread split for `tasks` independent tasks.
+
+    workers: fixed worker count (default: one per core); never more than one per task.
+    cores: core count to plan for (default: usable_cores()).
+    ocr: "full" (one whole-page tesseract run per task), "regions" (many small ones) or None (no OCR).
+    worker_memory_mb: peak memory of one worker; the default worker count is then also limited
+    to what fits into available_memory_mb().
+    """
+    cores = cores or usable_cores()
+    memory_mb = available_memory_mb() if worker_memory_mb else None
+    if workers is None and memory_mb is not None:
+        workers = max(1, min(cores, int(memory_mb // worker_memory_mb)))
+    workers = max(1, min(workers or cores, tasks))
+    share = max(1, cores // workers)
+    plan = {"cores": cores, "tasks": tasks, "workers": workers, "cv_threads": share, "tile_threads": share,
+            "ocr_threads": 1, "omp_threads": 1}
+    if ocr == "regions":
+        # the regions are small: recognising several at once beats OpenMP inside each one
+        plan["ocr_threads"] = share
+    elif ocr == "full":
+        plan["omp_threads"] = min(share, TESSERACT_MAX_THREADS)
+    # > 1 only when more workers than cores were asked for
+    plan["threads_per_core"] = round(workers * share / cores, 2)
+    if memory_mb is not None:
+        plan.update(worker_memory_mb=worker_memory_mb, available_memory_mb=round(memory_mb))
+    return plan
+
+
+def split_cores(cores, weights):
+    """{name: threads} summing to cores by weight (largest remainder), at least one each.
+
+    With fewer cores than names the sum is len(weights): every name still gets its one thread.
+    """
+    total = sum(weights.values())
+    exact = {name: cores * w / total for name, w in weights.items()}
+    split = {name: max(1, int(share)) for name, share in exact.items()}
+    spare = cores - sum(split.values())
+    # raising small shares to one can overshoot: take the excess back from the most over-served
+    while spare < 0 and any(n > 1 for n in split.values()):
+        name = max((name for name in split if split[name] > 1), key=lambda name: split[name] - exact[name])
+        split[name] -= 1
+        spare += 1
+    for name in sorted(exact, key=lambda n: int(exact[n]) - exact[n])[:max(0, spare)]:
+        split[name] += 1
+    return split
+
+
+def plan_pipeline_threads(cores=None, ocr="full", stages=None):
+    """Stage concurrency for plan_pipeline.py; stages: {stage: workers} overrides."""
+    cores = cores or usable_cores()
+    weights = PIPELINE_STAGE_WEIGHTS.get(ocr, PIPELINE_STAGE_WEIGHTS["full"])
+    conc = {"load": PIPELINE_IO_WORKERS}
+    conc.update(split_cores(cores, weights))
+    conc["write"] = PIPELINE_IO_WORKERS
+    conc.update(stages or {})
+    cpu_workers = sum(n for name, n in conc.items() if name in weights)
+    # every stage thread is single-threaded inside: the stages themselves are the parallelism
+    return {"cores": cores, "stages": conc, "cv_threads": 1, "tile_threads": 1, "ocr_threads": 1, "omp_threads": 1,
+            "threads_per_core": round(cpu_workers / cores, 2)}
+
+
+def apply_thread_plan(plan):
+    """Install a plan in this process: OpenCV thread count and tesseract's OpenMP limit (inherited by its runs)."""
+    os.environ["OMP_THREAD_LIMIT"] = str(plan["omp_threads"])
+    cv2.setNumThreads(plan["cv_threads"])
+
+
+def format_plan(plan):
+    """One-line report, e.g. "thread plan: 8 cores, 40 tasks -> 8 workers x 1 thread (...)"."""
+    inner = (f"OpenCV {plan['cv_threads']}, tesseract OMP {plan['omp_threads']}, "
+             f"OCR regions {plan['ocr_threads']}, tiles {plan['tile_threads']}")
+    if "stages" in plan:
+        stages = ", ".join(f"{name} {n}" for name, n in plan["stages"].items())
+        head = f"thread plan: {plan['cores']} cores -> pipeline stages {stages}"
+    else:
+        workers, share = plan["workers"], plan["cv_threads"]
+        head = (f"thread plan: {plan['cores']} cores, {plan['tasks']} tasks -> {workers} worker{'s' * (workers > 1)} "
+                f"x {share} thread{'s' * (share > 1)}")
+    note = f"; {plan['threads_per_core']} threads per core" if plan["threads_per_core"] > 1 else ""
+    if note and "stages" in plan:
+        note += " (each stage needs a thread; the stages take turns on the cores)"
+    if "worker_memory_mb" in plan:
+        note += f"; {plan['worker_memory_mb']} MB per worker of {plan['available_memory_mb']} MB available"
+    return f"{head} ({inner}){note}"
+
+
+def main():
+    p = argparse.ArgumentParser(description="Show the thread plan the floorplan scripts would use.")
+    p.add_argument("--tasks", type=int, default=1, help="images or pages in the run")
+    p.add_argument("--workers", type=int, default=None, help="fixed worker count (as --workers of the scripts)")
+    p.add_argument("--cores", type=int, default=None, help=f"plan for this many cores (detected: {usable_cores()})")
+    p.add_argument("--ocr", choices=["full", "regions", "none"], default="full",
+                   help="OCR of the tasks: parse_floorplan --ocr full/regions, none for extract_upper_scheme")
+    p.add_argument("--worker-memory-mb", type=float, default=None,
+                   help="peak memory per worker; limits the default worker count to the available memory")
+    p.add_argument("--pipeline", action="store_true", help="plan for parse_floorplan --pipeline")
+    args = p.parse_args()
+    ocr = None if args.ocr == "none" else args.ocr
+    if args.pipeline:
+        plan = plan_pipeline_threads(args.cores, ocr)
+    else:
+        plan = plan_threads(args.tasks, args.workers, args.cores, ocr, args.worker_memory_mb)
+    print(format_plan(plan))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
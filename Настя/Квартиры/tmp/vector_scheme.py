@@ -0,0 +1,492 @@
+#!/usr/bin/env python3
+"""
+vector_scheme.py
+
+Vector-native scheme extraction for extract_upper_scheme.py.
+
+Brochure PDFs are drawn, not scanned: PyMuPDF returns the page's path objects directly, so
+the apartment outline, wall segments and door-swing arcs can be read from the drawing list
+with exact coordinates instead of being recovered from a rasterised page by thresholding
+and contours.
+
+    - scheme location: bounding boxes of the non-white drawings are merged into regions the
+      same way find_top_region_and_crop merges non-white pixels; the top-most region wins
+    - outline:  the largest closed filled path inside the region (the floor fill)
+    - walls:    straight segments drawn with the wall pen, clipped to the region. The wall pen
+                is the widest dark stroke width carrying at least wall_min_share of the stroked
+                length (dimension lines, hatching and fixtures are thinner and more numerous);
+                strokes at least wall_width_ratio of its width and within wall_ink_tol of its
+                ink are walls too (thinner partitions, outlines of hatched walls). Short
+                parallel runs (hatching drawn with the wall pen) are dropped.
+    - openings: gaps between collinear wall segments, opening_min_gap_pt..opening_max_gap_pt
+                wide with no wall across them; the gaps on both faces of a wall merge into one
+    - arcs:     runs of Bezier curves that fit a circle, with the door-arc coverage limits, a
+                radius of a door width and the hinge (centre) on a wall
+
+Checked on page-6.pdf: the walls are the thick wall bodies and hatched wall outlines only, the
+openings the 5 breaks in them (balcony door, window, 3 passages) and there are no door arcs
+(the doors are drawn with straight leaves). Doors in thin partitions that are drawn with the
+fixture pen (the bathroom there) have no wall gap to find.
+
+Everything is returned in page pixels at the given zoom, so results drop into the same JSON
+fields as the raster path. extract_scheme_vector returns None when the page has no usable
+vector floor fill (scanned or image-only PDFs); callers then fall back to rendering.
+
+Dependencies:
+    pip install pymupdf opencv-python numpy
+"""
+import math
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+VECTOR_DEFAULTS = {
+    "white_thresh": 245,
+    "min_area": 200,
+    "pad": 20,
+    "bezier_steps": 8,
+    "min_outline_frac": 0.1,
+    "dark_ink": 128,            # strokes darker than this are plan lines
+    "min_wall_width_pt": 0.3,   # thinner strokes are never walls
+    "wall_min_share": 0.1,      # of the dark stroked length, for a width to be the wall pen
+    "wall_width_ratio": 0.4,    # of the wall pen width, for thinner walls
+    "wall_ink_tol": 40,         # luminance difference from the wall pen (grey dimension lines differ)
+    "min_wall_len_pt": 4.0,
+    "wall_line_tol_pt": 0.5,    # offset between segments on one line
+    "wall_angle_tol_deg": 3.0,
+    "hatch_max_len_pt": 8.0,    # hatch strokes: shorter than this ...
+    "hatch_spacing_pt": 4.0,    # ... with hatch_min_run parallel neighbours this close
+    "hatch_min_run": 3,
+    "opening_min_gap_pt": 8.0,
+    "opening_max_gap_pt": 60.0,
+    "opening_merge_pt": 10.0,   # thickest wall: gaps on both of its faces are one opening
+    "arc_min_radius_pt": 5.0,
+    "arc_max_radius_pt": 50.0,
+    "arc_hinge_tol_pt": 3.0,
+    "arc_max_rel_residual": 0.03,
+    "coverage_min_deg": 20,
+    "coverage_max_deg": 260,
+}
+
+_EPS = 1e-3
+
+
+@lru_cache(maxsize=1024)
+def _luminance(rgb):
+    if not rgb:
+        return None
+    if len(rgb) == 1:  # gray
+        return 255.0 * rgb[0]
+    if len(rgb) == 4:  # CMYK
+        c, m, y, k = rgb
+        rgb = ((1 - c) * (1 - k), (1 - m) * (1 - k), (1 - y) * (1 - k))
+    return 255.0 * (0.299 * rgb[0] + 0.587 * rgb[1] + 0.114 * rgb[2])
+
+
+def _ink(path, white_thresh):
+    """Luminance of the darkest paint of a path, or None if it paints only white."""
+    lums = [_luminance(path.get("fill")) if "f" in path["type"] else None,
+            _luminance(path.get("color")) if "s" in path["type"] else None]
+    lums = [v for v in lums if v is not None and v < white_thresh]
+    return min(lums) if lums else None
+
+
+@lru_cache(maxsize=None)
+def _bezier_basis(steps):
+    """(steps, 4) Bernstein weights for t in (0, 1]; basis @ control points samples a cubic."""
+    t = np.linspace(0.0, 1.0, steps + 1)[1:, None]
+    u = 1.0 - t
+    return np.hstack([u ** 3, 3 * u ** 2 * t, 3 * u * t ** 2, t ** 3])
+
+
+def path_subpaths(path, bezier_steps=8):
+    """Split one get_cdrawings() path into polylines.
+
+    Returns a list of dicts: pts (n, 2) float64 in PDF points (curves sampled with bezier_steps
+    points each), closed, and runs [(kind, i0, i1)]: maximal stretches of "l" or "c" items,
+    as inclusive index ranges into pts.
+    Rectangles and quads become closed 4-point polylines of their own.
+    """
+    subs = []
+    cur = None
+
+    def flush():
+        if cur is not None and len(cur["pts"]) > 1:
+            subs.append(cur)
+
+    for item in path["items"]:
+        kind = item[0]
+        if kind in ("re", "qu"):
+            flush()
+            if kind == "re":
+                x0, y0, x1, y1 = item[1]
+                pts = [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+            else:
+                ul, ur, ll, lr = item[1]
+                pts = [ul, ur, lr, ll]
+            subs.append({"pts": [tuple(p) for p in pts] + [tuple(pts[0])], "closed": True, "runs": [("l", 0, 4)]})
+            cur = None
+            continue
+        start = tuple(item[1])
+        if cur is None or abs(cur["pts"][-1][0] - start[0]) > _EPS or abs(cur["pts"][-1][1] - start[1]) > _EPS:
+            flush()
+            cur = {"pts": [start], "closed": False, "runs": []}
+        i0 = len(cur["pts"]) - 1
+        if kind == "l":
+            cur["pts"].append(tuple(item[2]))
+        elif kind == "c":
+            cur["pts"].extend((_bezier_basis(bezier_steps) @ np.array(item[1:5], dtype=np.float64)).tolist())
+        else:
+            continue
+        i1 = len(cur["pts"]) - 1
+        if cur["runs"] and cur["runs"][-1][0] == kind:
+            cur["runs"][-1] = (kind, cur["runs"][-1][1], i1)
+        else:
+            cur["runs"].append((kind, i0, i1))
+    flush()
+    for sub in subs:
+        pts = np.asarray(sub["pts"], dtype=np.float64)
+        sub["pts"] = pts
+        if not sub["closed"]:
+            sub["closed"] = bool(np.all(np.abs(pts[0] - pts[-1]) <= _EPS)) or bool(path.get("closePath"))
+    return subs
+
+
+def polygon_area(pts):
+    x, y = pts[:, 0], pts[:, 1]
+    return 0.5 * abs(float(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))))
+
+
+def simplify_polygon(pts, tol=1e-6):
+    """Drop repeated and collinear vertices of a closed polygon; geometry is unchanged."""
+    if len(pts) > 1 and np.all(np.abs(pts[0] - pts[-1]) <= _EPS):
+        pts = pts[:-1]
+    keep = np.ones(len(pts), dtype=bool)
+    changed = True
+    while changed and keep.sum() > 3:
+        changed = False
+        idx = np.nonzero(keep)[0]
+        p = pts[idx]
+        a, b = np.roll(p, 1, axis=0), np.roll(p, -1, axis=0)
+        cross = (p[:, 0] - a[:, 0]) * (b[:, 1] - a[:, 1]) - (p[:, 1] - a[:, 1]) * (b[:, 0] - a[:, 0])
+        scale = np.hypot(b[:, 0] - a[:, 0], b[:, 1] - a[:, 1]) + 1e-12
+        dup = np.all(np.abs(p - a) <= _EPS, axis=1)
+        drop = dup | (np.abs(cross) / scale <= tol + _EPS)
+        if drop.any() and (~drop).sum() >= 3:
+            # drop every other flagged vertex per pass so neighbours are re-evaluated
+            first = np.nonzero(drop)[0][::2]
+            keep[idx[first]] = False
+            changed = True
+    return pts[keep]
+
+
+def locate_scheme_box(rects, page_rect, zoom=2.0, min_area=200, pad=20):
+    """Crop box (x0, y0, x1, y1) in page pixels of the top-most region of drawings.
+
+    rects: bounding boxes (PDF points) of the non-white drawings; page_rect: the page's
+    (x0, y0, x1, y1), whose top-left corner is pixel (0, 0). The boxes are painted into a page-sized mask at `zoom` and merged with the
+    same morphology as extract_upper_scheme.nonwhite_components, so min_area and pad keep their
+    raster meaning. Returns None if the page has no non-white drawings.
+    """
+    ox, oy = page_rect[0], page_rect[1]
+    W, H = int(math.ceil((page_rect[2] - ox) * zoom)), int(math.ceil((page_rect[3] - oy) * zoom))
+    mask = np.zeros((H, W), dtype=np.uint8)
+    for x0, y0, x1, y1 in rects:
+        x0, y0, x1, y1 = x0 - ox, y0 - oy, x1 - ox, y1 - oy
+        c0, r0 = max(0, int(x0 * zoom)), max(0, int(y0 * zoom))
+        c1, r1 = min(W, int(math.ceil(x1 * zoom)) + 1), min(H, int(math.ceil(y1 * zoom)) + 1)
+        if c1 > c0 and r1 > r0:
+            mask[r0:r1, c0:c1] = 255
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5))
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=2)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=1)
+    num_labels, _, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    cand = [i for i in range(1, num_labels) if stats[i, cv2.CC_STAT_AREA] >= min_area]
+    if not cand:
+        return None
+    top = min(cand, key=lambda i: centroids[i][1])
+    x, y, ww, hh = (int(v) for v in stats[top, :4])
+    return (max(0, x - pad), max(0, y - pad), min(W, x + ww + pad), min(H, y + hh + pad))
+
+
+def _point_segment_dist(pts, segs):
+    """Distance of each point (n, 2) to its nearest segment of segs (m, 4)."""
+    a, b = segs[None, :, :2], segs[None, :, 2:]
+    d = b - a
+    denom = (d ** 2).sum(axis=2)
+    t = np.clip(((pts[:, None, :] - a) * d).sum(axis=2) / np.where(denom == 0, 1.0, denom), 0.0, 1.0)
+    proj = a + t[..., None] * d
+    return np.hypot(*(proj - pts[:, None, :]).transpose(2, 0, 1)).min(axis=1)
+
+
+def clip_segments(segs, box):
+    """(segments inside box, mask of the kept ones): segs (n, 4) clipped to box (x0, y0, x1, y1) (Liang-Barsky)."""
+    p0, d = segs[:, :2], segs[:, 2:] - segs[:, :2]
+    t0, t1 = np.zeros(len(segs)), np.ones(len(segs))
+    for k in range(2):
+        flat = d[:, k] == 0
+        step = np.where(flat, 1.0, d[:, k])
+        ta, tb = (box[k] - p0[:, k]) / step, (box[k + 2] - p0[:, k]) / step
+        t0 = np.where(flat, t0, np.maximum(t0, np.minimum(ta, tb)))
+        t1 = np.where(flat, t1, np.minimum(t1, np.maximum(ta, tb)))
+        t1[flat & ((p0[:, k] < box[k]) | (p0[:, k] > box[k + 2]))] = -1.0
+    keep = t0 <= t1
+    return np.hstack([p0 + t0[:, None] * d, p0 + t1[:, None] * d])[keep], keep
+
+
+def wall_pen(widths, inks, lengths, min_width=0.3, min_share=0.1):
+    """(width, ink) of the wall pen: the widest stroke width carrying min_share of the stroked length.
+
+    widths, inks, lengths: per segment. Returns None if no width of at least min_width qualifies.
+    """
+    widths = np.round(widths, 2)
+    classes, inverse = np.unique(widths, return_inverse=True)
+    share = np.bincount(inverse, weights=lengths) / max(float(lengths.sum()), _EPS)
+    ok = np.flatnonzero((share >= min_share) & (classes >= min_width))
+    if not len(ok):
+        return None
+    pen = ok[-1]
+    members = inverse == pen
+    # the pen's ink: its most used luminance, by length
+    ink_vals, ink_inv = np.unique(np.round(inks[members]), return_inverse=True)
+    return float(classes[pen]), float(ink_vals[np.argmax(np.bincount(ink_inv, weights=lengths[members]))])
+
+
+def _directions(segs):
+    d = segs[:, 2:] - segs[:, :2]
+    length = np.hypot(d[:, 0], d[:, 1])
+    return d / np.maximum(length, _EPS)[:, None], length
+
+
+def drop_hatching(segs, max_len=8.0, spacing=4.0, min_run=3, angle_tol_deg=3.0):
+    """segs without hatch strokes: short segments with min_run parallel short neighbours within spacing."""
+    u, length = _directions(segs)
+    short = np.flatnonzero(length < max_len)
+    if len(short) <= min_run:
+        return segs
+    su = u[short]
+    mid = (segs[short, :2] + segs[short, 2:]) / 2
+    parallel = np.abs(su @ su.T) >= math.cos(math.radians(angle_tol_deg))
+    near = np.hypot(*(mid[:, None] - mid[None]).transpose(2, 0, 1)) <= spacing
+    hatch = (parallel & near).sum(axis=1) - 1 >= min_run
+    keep = np.ones(len(segs), bool)
+    keep[short[hatch]] = False
+    return segs[keep]
+
+
+def _crosses(p, q, segs):
+    """Whether segment p-q properly crosses any of segs (n, 4) (touching at an end does not count)."""
+    a, b = segs[:, :2], segs[:, 2:]
+
+    def orient(o, s, t):
+        return (s[..., 0] - o[..., 0]) * (t[..., 1] - o[..., 1]) - (s[..., 1] - o[..., 1]) * (t[..., 0] - o[..., 0])
+
+    d1, d2 = orient(p, q, a), orient(p, q, b)
+    d3, d4 = orient(a, b, p), orient(a, b, q)
+    tol = _EPS * 10
+    return bool(np.any((d1 * d2 < -tol) & (d3 * d4 < -tol)))
+
+
+def wall_gaps(walls, min_gap=8.0, max_gap=60.0, line_tol=0.5, angle_tol_deg=3.0):
+    """Gaps (m, 4) between collinear wall segments: from a segment end to the next segment on its line.
+
+    A gap is min_gap..max_gap long, not covered by another segment on the same line and not
+    crossed by any wall.
+    """
+    if not len(walls):
+        return np.zeros((0, 4))
+    u, _ = _directions(walls)
+    a, b = walls[:, :2], walls[:, 2:]
+    cos_tol = math.cos(math.radians(angle_tol_deg))
+    gaps = {}
+    for i in range(len(walls)):
+        for end, out in ((b[i], u[i]), (a[i], -u[i])):
+            normal = np.array([-out[1], out[0]])
+            on_line = (np.abs(u @ out) >= cos_tol) & (np.abs((a - end) @ normal) <= line_tol) \
+                & (np.abs((b - end) @ normal) <= line_tol)
+            s0, s1 = (a - end) @ out, (b - end) @ out
+            lo, hi = np.minimum(s0, s1), np.maximum(s0, s1)
+            ahead = on_line & (lo >= min_gap) & (lo <= max_gap)
+            if not ahead.any():
+                continue
+            gap = lo[ahead].min()
+            covered = on_line & (hi > _EPS) & (lo < gap - _EPS)
+            covered[i] = False
+            if covered.any():
+                continue
+            far = end + gap * out
+            if _crosses(end, far, walls):
+                continue
+            key = tuple(sorted((tuple(np.round(end, 2)), tuple(np.round(far, 2)))))
+            gaps[key] = [*end, *far]
+    return np.array(list(gaps.values()), dtype=np.float64).reshape(-1, 4)
+
+
+def merge_gaps(gaps, merge_dist=10.0, angle_tol_deg=3.0):
+    """Group gaps that are parallel, overlap along their direction and lie within merge_dist of each other.
+
+    Returns a list of (n_i, 2) endpoint arrays, one per group (the gaps on both faces of a wall
+    are one opening).
+    """
+    n = len(gaps)
+    parent = list(range(n))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    u, _ = _directions(gaps)
+    cos_tol = math.cos(math.radians(angle_tol_deg))
+    for i in range(n):
+        for j in range(i + 1, n):
+            if abs(u[i] @ u[j]) < cos_tol:
+                continue
+            s = [(gaps[j, :2] - gaps[i, :2]) @ u[i], (gaps[j, 2:] - gaps[i, :2]) @ u[i]]
+            length_i = (gaps[i, 2:] - gaps[i, :2]) @ u[i]
+            offset = abs((gaps[j, :2] - gaps[i, :2]) @ np.array([-u[i, 1], u[i, 0]]))
+            if offset <= merge_dist and max(s) > _EPS and min(s) < length_i - _EPS:
+                parent[find(i)] = find(j)
+    groups = {}
+    for i in range(n):
+        groups.setdefault(find(i), []).append(gaps[i].reshape(2, 2))
+    return [np.vstack(g) for g in groups.values()]
+
+
+def fit_circle(pts):
+    """Least-squares circle through points: (cx, cy, r, rms residual)."""
+    x, y = pts[:, 0], pts[:, 1]
+    A = np.column_stack([x, y, np.ones_like(x)])
+    b = x ** 2 + y ** 2
+    (c0, c1, c2), *_ = np.linalg.lstsq(A, b, rcond=None)
+    cx, cy = c0 / 2, c1 / 2
+    r = math.sqrt(max(c2 + cx ** 2 + cy ** 2, 0.0))
+    resid = np.hypot(x - cx, y - cy) - r
+    return cx, cy, r, float(np.sqrt((resid ** 2).mean()))
+
+
+def _arc_from_run(pts, p):
+    if len(pts) < 4:
+        return None
+    # shortest chord an acceptable arc can have; cheaper than fitting every glyph curve
+    extent = np.ptp(pts, axis=0)
+    if math.hypot(*extent) < 2 * p["arc_min_radius_pt"] * math.sin(math.radians(p["coverage_min_deg"]) / 2):
+        return None
+    cx, cy, r, rms = fit_circle(pts)
+    if not (p["arc_min_radius_pt"] <= r <= p["arc_max_radius_pt"]) or rms > p["arc_max_rel_residual"] * r:
+        return None
+    ang = np.unwrap(np.arctan2(pts[:, 1] - cy, pts[:, 0] - cx))
+    coverage = math.degrees(abs(ang[-1] - ang[0]))
+    if not (p["coverage_min_deg"] < coverage < p["coverage_max_deg"]):
+        return None
+    return cx, cy, r, coverage
+
+
+def extract_scheme_vector(paths, page_rect, zoom=2.0, **params):
+    """Scheme geometry from a page's get_cdrawings() list, in page pixels at `zoom`.
+
+    page_rect: (x0, y0, x1, y1) of the page in PDF points, i.e. what the rendered pixmap covers.
+
+    Returns a dict with crop_box (x0, y0, x1, y1), outline [[x, y], ...], walls
+    [[x0, y0, x1, y1], ...], openings [{bbox, area, center}] and door_arcs
+    [{center_px, radius_px, coverage_deg}], or None when there is no vector floor fill.
+    """
+    p = dict(VECTOR_DEFAULTS, **params)
+    inked = [(path, ink) for path in paths for ink in [_ink(path, p["white_thresh"])] if ink is not None]
+    box = locate_scheme_box([path["rect"] for path, _ in inked], page_rect, zoom, p["min_area"], p["pad"])
+    if box is None:
+        return None
+    ox, oy = page_rect[0], page_rect[1]
+    bx0, by0, bx1, by1 = box[0] / zoom + ox, box[1] / zoom + oy, box[2] / zoom + ox, box[3] / zoom + oy
+
+    def inside(rect):
+        x0, y0, x1, y1 = rect
+        return x0 >= bx0 - _EPS and y0 >= by0 - _EPS and x1 <= bx1 + _EPS and y1 <= by1 + _EPS
+
+    def overlaps(rect):
+        x0, y0, x1, y1 = rect
+        return x0 < bx1 and x1 > bx0 and y0 < by1 and y1 > by0
+
+    min_outline_area = p["min_outline_frac"] * (bx1 - bx0) * (by1 - by0)
+    outline, outline_area = None, 0.0
+    segs, seg_pens, curves = [], [], []
+    for path, ink in inked:
+        if not overlaps(path["rect"]):
+            continue
+        x0, y0, x1, y1 = path["rect"]
+        # only fills big enough to be the floor can become the outline (skips glyphs and hatching)
+        fill_candidate = "f" in path["type"] and inside(path["rect"]) and (x1 - x0) * (y1 - y0) >= min_outline_area
+        stroke = "s" in path["type"] and ink < p["dark_ink"]
+        if not (fill_candidate or stroke):
+            continue
+        subs = path_subpaths(path, p["bezier_steps"])
+        if fill_candidate:
+            for sub in subs:
+                if len(sub["pts"]) >= 4:
+                    area = polygon_area(sub["pts"])
+                    if area > outline_area:
+                        outline, outline_area = sub["pts"], area
+        if stroke:
+            for sub in subs:
+                for kind, i0, i1 in sub["runs"]:
+                    run = sub["pts"][i0:i1 + 1]
+                    if kind == "l":
+                        segs.append(np.hstack([run[:-1], run[1:]]))
+                        seg_pens.append(np.repeat([[path.get("width") or 0.0, ink]], len(run) - 1, axis=0))
+                    else:
+                        curves.append(run)
+    if outline is None or outline_area < min_outline_area:
+        return None
+    outline = simplify_polygon(outline)
+
+    walls, pen_width = np.zeros((0, 4)), 0.0
+    if segs:
+        segs, seg_pens = np.vstack(segs), np.vstack(seg_pens)
+        # clip first: the pen statistics and the walls only count what lies in the scheme box
+        box_segs, kept = clip_segments(segs, (bx0, by0, bx1, by1))
+        pens = seg_pens[kept]
+        _, length = _directions(box_segs)
+        pen = wall_pen(pens[:, 0], pens[:, 1], length, p["min_wall_width_pt"], p["wall_min_share"])
+        if pen is not None:
+            pen_width, pen_ink = pen
+            is_wall = ((pens[:, 0] >= max(p["wall_width_ratio"] * pen_width, p["min_wall_width_pt"]) - _EPS)
+                       & (np.abs(pens[:, 1] - pen_ink) <= p["wall_ink_tol"]) & (length >= p["min_wall_len_pt"]))
+            walls = drop_hatching(box_segs[is_wall], p["hatch_max_len_pt"], p["hatch_spacing_pt"],
+                                  p["hatch_min_run"], p["wall_angle_tol_deg"])
+
+    openings = []
+    gaps = wall_gaps(walls, p["opening_min_gap_pt"], p["opening_max_gap_pt"], p["wall_line_tol_pt"],
+                     p["wall_angle_tol_deg"])
+    for ends in merge_gaps(gaps, p["opening_merge_pt"], p["wall_angle_tol_deg"]):
+        (x0, y0), (x1, y1) = ends.min(axis=0), ends.max(axis=0)
+        # a gap found on one face only is a line: give it the wall pen's thickness
+        grow_x, grow_y = max(0.0, pen_width - (x1 - x0)) / 2, max(0.0, pen_width - (y1 - y0)) / 2
+        x0, y0, x1, y1 = x0 - grow_x, y0 - grow_y, x1 + grow_x, y1 + grow_y
+        openings.append((x0, y0, x1, y1, (x1 - x0) * (y1 - y0)))
+
+    arcs = []
+    for run in curves:
+        arc = _arc_from_run(run, p)
+        # a door swing is about as wide as a wall gap and hinges on a wall (fixtures don't)
+        if arc is None or not p["opening_min_gap_pt"] <= arc[2] <= p["opening_max_gap_pt"] or not len(walls):
+            continue
+        if _point_segment_dist(np.array([arc[:2]]), walls)[0] <= p["arc_hinge_tol_pt"]:
+            arcs.append(arc)
+
+    def px(v, origin=0.0):
+        return round((float(v) - origin) * zoom, 2)
+
+    return {
+        "crop_box": tuple(int(v) for v in box),
+        "outline": [[px(x, ox), px(y, oy)] for x, y in outline],
+        "walls": [[px(sx0, ox), px(sy0, oy), px(sx1, ox), px(sy1, oy)] for sx0, sy0, sx1, sy1 in walls],
+        "openings": [{"bbox": [px(x0, ox), px(y0, oy), px(x1 - x0), px(y1 - y0)],
+                      "area": round(float(area) * zoom * zoom, 1),
+                      "center": [px((x0 + x1) / 2, ox), px((y0 + y1) / 2, oy)]}
+                     for x0, y0, x1, y1, area in openings],
+        "door_arcs": [{"center_px": [round((float(cx) - ox) * zoom, 1), round((float(cy) - oy) * zoom, 1)],
+                       "radius_px": round(r * zoom, 1), "coverage_deg": round(cov, 1)}
+                      for cx, cy, r, cov in arcs],
+    }
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+wall_graph.py
+
+Interior + exterior wall graph for parse_floorplan.py.
+
+Straight line segments are taken from the binary plan mask (probabilistic Hough; masks larger
+than hough_max_side are max-pooled down first), then:
+  1. merged: segments that are parallel, within a wall thickness of each other and overlapping
+     (or nearly touching) along their direction become one wall. Its centreline is the mean
+     offset of the members, so both faces of a double-line wall and the strokes of a thick
+     solid wall collapse to one edge. Groups without real thickness (single thin lines:
+     dimension lines, hatching, furniture) are dropped.
+  2. snapped: wall end points closer than snap_px become one node, and an end point near the
+     interior of another wall becomes a T-junction node splitting that wall.
+
+Neighbour searches go through a uniform-grid spatial hash (direction bins hashed apart when
+merging, each bin also searched against the next one): every segment is keyed by the cells it passes, the keys are sorted once and the
+candidates of a segment are the ones in its own and the 8 adjacent cells (searchsorted), so
+the work is a sort plus linear passes (~n log n) instead of comparing all pairs; grouping
+uses union-find.
+
+Result (JSON-ready):
+    {"nodes": [[x, y], ...],
+     "edges": [{"nodes": [i, j], "length_px": ..., "thickness_px": ...}, ...]}
+"""
+import math
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+WALL_GRAPH_DEFAULTS = {
+    "min_len": 20,          # px, shortest Hough segment / merged wall kept
+    "hough_threshold": 15,
+    "max_gap": 4,           # px, HoughLinesP gap bridged inside one segment
+    "angle_tol_deg": 3.0,   # parallel if directions differ by less
+    "wall_px": 12,          # px, widest wall: faces this far apart are merged
+    "min_thickness_px": 3,  # px, merged groups thinner than this are single lines, not walls
+    "snap_px": 8,           # px, end point / T-junction snapping distance
+    "hough_max_side": 2000,  # px, larger masks are downscaled to this for the Hough transform
+}
+
+
+class _UnionFind:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i, j):
+        ri, rj = self.find(i), self.find(j)
+        if ri != rj:
+            self.parent[max(ri, rj)] = min(ri, rj)
+
+
+# cell key = (group * _SPAN + cx) * _SPAN + cy, with cx / cy shifted by _OFFSET to stay positive
+_SPAN = 1 << 21
+_OFFSET = 1 << 20
+
+
+def grid_cells(segs, cell, group=None):
+    """Spatial hash of segments (n, 4): (item, key) arrays, one row per distinct cell a segment passes.
+
+    Segments are sampled every cell / 2 along their length; points are zero-length segments.
+    group (n,) ints keeps items of different groups in separate cells.
+    """
+    segs = np.asarray(segs, np.float64).reshape(-1, 4)
+    n = len(segs)
+    if n == 0:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64)
+    steps = np.maximum(1, np.ceil(np.hypot(segs[:, 2] - segs[:, 0], segs[:, 3] - segs[:, 1]) / (cell / 2.0))).astype(np.int64)
+    item = np.repeat(np.arange(n), steps + 1)
+    # k / steps for k = 0..steps of every segment
+    start = np.cumsum(steps + 1) - (steps + 1)
+    t = (np.arange(len(item)) - start[item]) / steps[item]
+    x = segs[item, 0] + (segs[item, 2] - segs[item, 0]) * t
+    y = segs[item, 1] + (segs[item, 3] - segs[item, 1]) * t
+    g = np.zeros(n, np.int64) if group is None else np.asarray(group, np.int64)
+    key = ((g[item] * _SPAN + np.floor(x / cell).astype(np.int64) + _OFFSET) * _SPAN
+           + np.floor(y / cell).astype(np.int64) + _OFFSET)
+    # a straight segment visits each cell in one run of samples: dropping repeats keeps one row per cell
+    keep = np.ones(len(item), bool)
+    keep[1:] = (item[1:] != item[:-1]) | (key[1:] != key[:-1])
+    return item[keep], key[keep]
+
+
+def grid_pairs(a_cells, b_cells):
+    """Candidate pairs (i, j) (unique, sorted) of items sharing a grid cell or neighbouring cells.
+
+    a_cells / b_cells: grid_cells results built with the same cell size.
+    """
+    ia, ka = a_cells
+    ib, kb = b_cells
+    nb = int(ib.max()) + 1 if len(ib) else 1
+    order = np.argsort(kb, kind="stable")
+    kb, ib = kb[order], ib[order]
+    found = []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            q = ka + dx * _SPAN + dy
+            lo = np.searchsorted(kb, q, "left")
+            cnt = np.searchsorted(kb, q, "right") - lo
+            if not cnt.any():
+                continue
+            i = np.repeat(ia, cnt)
+            # expand the [lo, lo + cnt) ranges of matching b rows
+            first = np.cumsum(cnt) - cnt
+            j = ib[np.repeat(lo - first, cnt) + np.arange(int(cnt.sum()))]
+            found.append(i * nb + j)
+    if not found:
+        return np.zeros((0, 2), np.int64)
+    code = np.unique(np.concatenate(found))
+    return np.stack([code // nb, code % nb], axis=1)
+
+
+def detect_segments(bin_img, min_len=20, hough_threshold=15, max_gap=4, scale=1.0):
+    """Straight segments (n, 4) float64 x0, y0, x1, y1 of a binary (255 = ink) mask.
+
+    scale < 1 runs the Hough transform on a max-pooled downscaled mask (any ink in a block keeps
+    the block, so thin lines survive) and maps the segments back: its cost grows with the number
+    of ink pixels, and walls are thick enough for the coarser grid.
+    """
+    if scale < 1:
+        small = cv2.resize(bin_img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        mask = np.where(small > 0, 255, 0).astype(np.uint8)
+    else:
+        mask, scale = bin_img, 1.0
+    lines = cv2.HoughLinesP(mask, 1, np.pi / 180, max(1, int(round(hough_threshold * scale))),
+                            minLineLength=min_len * scale, maxLineGap=max(1.0, max_gap * scale))
+    if lines is None:
+        return np.zeros((0, 4), np.float64)
+    # block centres in full-resolution pixels
+    return (lines.reshape(-1, 4).astype(np.float64) + 0.5) / scale - 0.5
+
+
+def _directions(segs):
+    d = segs[:, 2:] - segs[:, :2]
+    length = np.hypot(d[:, 0], d[:, 1])
+    d = d / np.maximum(length, 1e-9)[:, None]
+    # one orientation per undirected line: angle in [0, pi)
+    flip = (d[:, 1] < 0) | ((d[:, 1] == 0) & (d[:, 0] < 0))
+    d[flip] *= -1
+    return d, length
+
+
+def merge_segments(segs, angle_tol_deg=3.0, wall_px=12, snap_px=8, min_thickness_px=3, min_len=20, pixel_px=1.0):
+    """Group parallel, close, overlapping segments; returns [(x0, y0, x1, y1, thickness)] centrelines.
+
+    pixel_px: size of one mask pixel of the segments in output pixels (1 / detect_segments scale).
+    """
+    n = len(segs)
+    if n == 0:
+        return []
+    d, length = _directions(segs)
+    cos_tol = math.cos(math.radians(angle_tol_deg))
+    # one hash group per direction bin (centred on 0 deg, so axis-aligned walls sit mid-bin), and
+    # every bin is searched against the next one as well: collinear pieces either side of a bin
+    # edge (1.4 and 1.6 deg) still pair up. Across a bin edge the directions must agree to half
+    # the tolerance, which keeps stray segments of the next bin from tilting a wall. Cells a few
+    # search radii wide: long walls touch fewer cells, the extra candidates are rejected by the
+    # tests below.
+    nbins = max(1, int(round(180.0 / angle_tol_deg)))
+    angle_bin = np.rint(np.degrees(np.arctan2(d[:, 1], d[:, 0])) / (180.0 / nbins)).astype(np.int64) % nbins
+    cell = 4 * max(wall_px, snap_px)
+    cells = grid_cells(segs, cell, angle_bin)
+    pairs = np.concatenate([grid_pairs(cells, cells), grid_pairs(grid_cells(segs, cell, (angle_bin + 1) % nbins), cells)])
+    pairs = np.unique(np.sort(pairs, axis=1), axis=0)
+    i, j = pairs[pairs[:, 0] < pairs[:, 1]].T
+    cos_pair = np.where(angle_bin[i] == angle_bin[j], cos_tol, math.cos(math.radians(angle_tol_deg / 2.0)))
+
+    p0 = segs[i, :2]
+    normal = np.stack([-d[i, 1], d[i, 0]], axis=1)
+    q = segs[j].reshape(-1, 2, 2) - p0[:, None, :]
+    ok = (np.abs((d[i] * d[j]).sum(axis=1)) >= cos_pair) & (np.abs((q * normal[:, None, :]).sum(axis=2)).max(axis=1) <= wall_px)
+    # overlap (or a gap under snap_px) along segment i's direction
+    tq = (q * d[i][:, None, :]).sum(axis=2)
+    ti = ((segs[i, 2:] - p0) * d[i]).sum(axis=1)
+    ok &= (tq.max(axis=1) >= np.minimum(0.0, ti) - snap_px) & (tq.min(axis=1) <= np.maximum(0.0, ti) + snap_px)
+    uf = _UnionFind(n)
+    for a, b in zip(i[ok].tolist(), j[ok].tolist()):
+        uf.union(a, b)
+
+    # group statistics; roots are the smallest member, so groups keep first-appearance order
+    _, root, label = np.unique([uf.find(k) for k in range(n)], return_index=True, return_inverse=True)
+    ng = int(label.max()) + 1
+    # length-weighted mean direction; near 0 / 180 deg members point opposite ways, so align them with the root first
+    d = d * np.where((d * d[root[label]]).sum(axis=1) < 0, -1.0, 1.0)[:, None]
+    u = np.stack([np.bincount(label, d[:, 0] * length, ng), np.bincount(label, d[:, 1] * length, ng)], axis=1)
+    u /= np.linalg.norm(u, axis=1)[:, None]
+    normal = np.stack([-u[:, 1], u[:, 0]], axis=1)
+    pts = segs.reshape(-1, 2)
+    pt_label = np.repeat(label, 2)
+    offs = (pts * normal[pt_label]).sum(axis=1)
+    t = (pts * u[pt_label]).sum(axis=1)
+    order = np.argsort(pt_label, kind="stable")
+    first = np.searchsorted(pt_label[order], np.arange(ng))
+    # pixel extent across the group: a single 1-2 px line stays below min_thickness_px
+    thickness = np.maximum.reduceat(offs[order], first) - np.minimum.reduceat(offs[order], first) + pixel_px
+    t0, t1 = np.minimum.reduceat(t[order], first), np.maximum.reduceat(t[order], first)
+    off = np.bincount(pt_label, np.repeat(length, 2) * offs, ng) / (2 * np.bincount(label, length, ng))
+    a = u * t0[:, None] + normal * off[:, None]
+    b = u * t1[:, None] + normal * off[:, None]
+    keep = (thickness >= min_thickness_px) & (t1 - t0 >= min_len)
+    return [(x0, y0, x1, y1, th) for x0, y0, x1, y1, th in
+            np.column_stack([a, b, thickness])[keep].tolist()]
+
+
+def snap_graph(walls, snap_px=8):
+    """Nodes/edges from wall centrelines: close end points merge, end points on a wall split it."""
+    if not walls:
+        return [], []
+    w4 = np.array([w[:4] for w in walls], np.float64)
+    ends = np.concatenate([w4[:, :2], w4[:, 2:]])
+    m = len(walls)
+
+    # 1. end point clusters
+    end_cells = grid_cells(np.concatenate([ends, ends], axis=1), snap_px)
+    pairs = grid_pairs(end_cells, end_cells)
+    pairs = pairs[pairs[:, 0] < pairs[:, 1]]
+    close = np.hypot(*(ends[pairs[:, 0]] - ends[pairs[:, 1]]).T) <= snap_px
+    uf = _UnionFind(len(ends))
+    for a, b in pairs[close].tolist():
+        uf.union(a, b)
+    roots = sorted({uf.find(k) for k in range(len(ends))})
+    node_of_root = {r: i for i, r in enumerate(roots)}
+    end_node = np.array([node_of_root[uf.find(k)] for k in range(len(ends))])
+    nodes = np.zeros((len(roots), 2))
+    counts = np.zeros(len(roots))
+    np.add.at(nodes, end_node, ends)
+    np.add.at(counts, end_node, 1)
+    nodes /= counts[:, None]
+
+    # 2. T-junctions: a node within snap_px of another wall's interior moves onto the closest such
+    # wall and splits it. All walls are tested against the unmoved nodes first, so the result
+    # doesn't depend on the order of the walls.
+    node_cells = grid_cells(np.concatenate([nodes, nodes], axis=1), snap_px)
+    snapped = {}
+    for v, i in grid_pairs(node_cells, grid_cells(w4, snap_px)).tolist():
+        a, b = nodes[end_node[i]], nodes[end_node[i + m]]
+        if v in (end_node[i], end_node[i + m]):
+            continue
+        ab = b - a
+        L2 = float(ab @ ab)
+        if L2 == 0:
+            continue
+        x, y = nodes[v]
+        t = float((np.array([x, y]) - a) @ ab) / L2
+        if not 0 < t < 1:
+            continue
+        proj = a + t * ab
+        dist = math.hypot(x - proj[0], y - proj[1])
+        if dist <= snap_px and (dist, i) < snapped.get(v, (math.inf,))[:2]:
+            snapped[v] = (dist, i, t, proj)
+    splits = defaultdict(list)
+    for v, (_, i, t, proj) in snapped.items():
+        splits[i].append((t, v))
+        nodes[v] = proj
+
+    edges = []
+    seen = set()
+    for i, w in enumerate(walls):
+        chain = [end_node[i]] + [v for _, v in sorted(splits.get(i, []))] + [end_node[i + m]]
+        for a, b in zip(chain, chain[1:]):
+            key = (min(a, b), max(a, b))
+            if a == b or key in seen:
+                continue
+            seen.add(key)
+            edges.append({"nodes": [int(a), int(b)], "thickness_px": round(w[4], 1)})
+    for e in edges:
+        a, b = nodes[e["nodes"][0]], nodes[e["nodes"][1]]
+        e["length_px"] = round(float(math.hypot(*(b - a))), 1)
+
+    # drop nodes no edge uses (ends of zero-length chains) and renumber
+    used = sorted({v for e in edges for v in e["nodes"]})
+    renum = {v: i for i, v in enumerate(used)}
+    for e in edges:
+        e["nodes"] = [renum[v] for v in e["nodes"]]
+    return [[round(float(nodes[v, 0]), 1), round(float(nodes[v, 1]), 1)] for v in used], edges
+
+
+def build_wall_graph(bin_img, min_len=20, hough_threshold=15, max_gap=4, angle_tol_deg=3.0, wall_px=12,
+                     min_thickness_px=3, snap_px=8, hough_max_side=2000):
+    """Wall graph {"nodes", "edges"} of a binary plan mask (see module docstring)."""
+    scale = min(1.0, hough_max_side / max(bin_img.shape[:2]))
+    segs = detect_segments(bin_img, min_len=min_len, hough_threshold=hough_threshold, max_gap=max_gap, scale=scale)
+    walls = merge_segments(segs, angle_tol_deg=angle_tol_deg, wall_px=wall_px, snap_px=snap_px,
+                           min_thickness_px=min_thickness_px, min_len=min_len, pixel_px=1.0 / scale)
+    nodes, edges = snap_graph(walls, snap_px=snap_px)
+    return {"nodes": nodes, "edges": edges}
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+watch_inputs.py
+
+Watch mode for parse_floorplan.py --watch and extract_upper_scheme.py --watch: keep an output
+folder in sync with an input folder that people keep dropping files into, processing only what
+is new or changed.
+
+    WatchManifest       <out>/watch_manifest.json: per input (path relative to the input folder)
+                        its mtime, size, SHA-256, the hash of the parameters it was processed
+                        with, the outcome and the output files it produced
+    sync_once           one incremental pass: scan, hash only the inputs whose mtime / size
+                        moved, process new / changed ones in a process pool, delete the outputs
+                        of inputs that are gone (and outputs a reprocessed input no longer makes)
+    watch               sync_once every `interval` seconds until interrupted (or once)
+
+An input is (re)processed when it is not in the manifest, when its content hash changed (an
+mtime / size change with the same content only updates the manifest) or when it was processed
+with other parameters. Failed inputs are recorded too and retried only once they change.
+When a worker process dies (killed, out of memory) every job still in the pool is lost with it;
+those inputs are not recorded and the next pass retries them on a new pool, each of them alone.
+An input whose worker dies while it runs alone is the one that kills it and is recorded as
+failed (the suspects are kept in memory: a restart gives them one more shared try).
+Files modified less than `settle` seconds ago may still be being copied and wait for the next
+pass. The manifest is written atomically after each pass and at most every save_every seconds
+while one runs, so a restart resumes where the previous run stopped: only inputs that finished
+after its last save are processed again.
+
+Polling (os.scandir through Path.glob) needs no extra dependency and also works on network
+shares, where inotify-style notifications are unreliable.
+
+Worker protocol: worker(input_path, item_out_dir) runs in a pool process, never raises and
+returns a record with "status" ("ok" / "error") and "outputs" (paths of the files written);
+item_out_dir mirrors the input's place in the input tree (<out>/<relative path without suffix>).
+Workers get the default SIGTERM action back, so a service manager's SIGTERM stops them too.
+
+Usage:
+    watch("drop/", "**/*.png", "plan_out/", functools.partial(worker, **opts), params, workers=4)
+
+    python watch_inputs.py plan_out/watch_manifest.json     # summary of a manifest
+"""
+import argparse
+import hashlib
+import json
+import os
+import signal
+import tempfile
+import threading
+import time
+from concurrent.futures import CancelledError, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from stage_cache import file_digest
+
+MANIFEST_NAME = "watch_manifest.json"
+MANIFEST_VERSION = 1
+WATCH_DEFAULTS = {
+    "interval": 5.0,    # s between passes
+    "settle": 2.0,      # s, inputs modified more recently may still be being copied
+    "save_every": 1.0,  # s, manifest writes during a pass (resume granularity)
+}
+
+
+def params_hash(params):
+    """Short stable hash of the parameters that change the outputs."""
+    blob = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:16]
+
+
+def scan_inputs(input_dir, pattern):
+    """{path relative to input_dir (posix): (mtime_ns, size)} of the files matching pattern."""
+    input_dir = Path(input_dir)
+    found = {}
+    for path in input_dir.glob(pattern):
+        try:
+            st = path.stat()
+        except OSError:  # deleted between listing and stat
+            continue
+        if path.is_file():
+            found[path.relative_to(input_dir).as_posix()] = (st.st_mtime_ns, st.st_size)
+    return found
+
+
+def item_dir(out_dir, rel):
+    """Output folder of one input: the input tree mirrored, so equal stems in different folders don't collide."""
+    return Path(out_dir) / Path(rel).with_suffix("")
+
+
+def remove_outputs(out_dir, outputs):
+    """Delete output files (relative to out_dir) and the folders they leave empty; returns how many were deleted."""
+    out_dir = Path(out_dir).resolve()
+    removed = 0
+    for rel in outputs:
+        path = out_dir / rel
+        try:
+            path.unlink()
+            removed += 1
+        except FileNotFoundError:
+            pass
+        parent = path.parent.resolve()
+        while parent != out_dir and out_dir in parent.parents:
+            try:
+                parent.rmdir()
+            except OSError:  # not empty
+                break
+            parent = parent.parent
+    return removed
+
+
+class WatchManifest:
+    """State of a watched input folder; see the module docstring."""
+
+    def __init__(self, path, input_dir, items=None):
+        self.path = Path(path)
+        self.input_dir = Path(input_dir)
+        self.items = items or {}
+        self.dirty = False
+        self._saved = time.monotonic()
+        self.suspects = set()  # inputs lost with a dead worker process, retried alone
+
+    @classmethod
+    def open(cls, path, input_dir):
+        """Load path (empty if it doesn't exist yet); raises ValueError if unreadable or kept for another input folder."""
+        path = Path(path)
+        if not path.exists():
+            return cls(path, input_dir)
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            raise ValueError(f"Cannot read watch manifest {path}: {e}")
+        if data.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"Watch manifest {path} has version {data.get('version')}; expected {MANIFEST_VERSION} "
+                             "(delete it to reprocess everything)")
+        if Path(data["input_dir"]).resolve() != Path(input_dir).resolve():
+            raise ValueError(f"Watch manifest {path} belongs to {data['input_dir']}; use another output folder")
+        return cls(path, input_dir, data["items"])
+
+    def changes(self, found, phash, settle=0.0, now=None):
+        """(todo [(rel, mtime_ns, size, sha256)], removed [rel], waiting [rel]) for a scan_inputs() result."""
+        now = time.time() if now is None else now
+        todo, waiting = [], []
+        for rel, (mtime_ns, size) in sorted(found.items()):
+            item = self.items.get(rel)
+            if item and item["params"] == phash and (item["mtime_ns"], item["size"]) == (mtime_ns, size):
+                continue
+            if now - mtime_ns / 1e9 < settle:
+                waiting.append(rel)
+                continue
+            try:
+                digest = file_digest(self.input_dir / rel)
+            except OSError:  # deleted since the scan: the next pass removes it
+                continue
+            if item and item["params"] == phash and item["sha256"] == digest:
+                # touched or copied over with the same content
+                item.update(mtime_ns=mtime_ns, size=size)
+                self.dirty = True
+                continue
+            todo.append((rel, mtime_ns, size, digest))
+        removed = sorted(rel for rel in self.items if rel not in found)
+        return todo, removed, waiting
+
+    def _relative(self, out_dir, path):
+        path = Path(path)
+        try:
+            return path.resolve().relative_to(Path(out_dir).resolve()).as_posix()
+        except ValueError:
+            return str(path)
+
+    def record(self, rel, mtime_ns, size, digest, phash, rec, out_dir):
+        """Store a worker record; returns the outputs of the previous run that this one didn't write again."""
+        outputs = [self._relative(out_dir, p) for p in rec.get("outputs") or []]
+        old = self.items.get(rel)
+        item = {"mtime_ns": mtime_ns, "size": size, "sha256": digest, "params": phash,
+                "status": rec["status"], "seconds": rec.get("seconds"), "outputs": outputs}
+        if "error" in rec:
+            item["error"] = rec["error"]
+        self.items[rel] = item
+        self.dirty = True
+        return [p for p in (old or {}).get("outputs", []) if p not in set(outputs)]
+
+    def forget(self, rel):
+        self.dirty = True
+        return self.items.pop(rel)
+
+    def save(self, every=0.0):
+        """Write the manifest atomically if it changed (and the last write is at least `every` seconds old)."""
+        if not self.dirty or every and time.monotonic() - self._saved < every:
+            return self.path
+        data = {"version": MANIFEST_VERSION, "input_dir": str(self.input_dir), "items": self.items}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix=".watch_manifest.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        self.dirty = False
+        self._saved = time.monotonic()
+        return self.path
+
+    def summary(self):
+        return {"inputs": len(self.items), "ok": sum(1 for i in self.items.values() if i["status"] == "ok"),
+                "failed": sum(1 for i in self.items.values() if i["status"] != "ok")}
+
+
+def sync_once(manifest, pattern, out_dir, worker, phash, pool, settle=0.0, save_every=1.0,
+              on_record=None, on_remove=None, log=print):
+    """One incremental pass over manifest.input_dir; returns {"processed", "failed", "removed", "waiting", "broken"}.
+
+    on_record(rec) runs in this process before a record is stored (it may still edit rec);
+    on_remove(item) gets the manifest item of every deleted input before its outputs go, and the
+    previous item of every changed input before it is processed again. "broken": the pool lost a
+    worker process and needs replacing.
+    """
+    found = scan_inputs(manifest.input_dir, pattern)
+    todo, removed, waiting = manifest.changes(found, phash, settle)
+    for rel in removed:
+        item = manifest.forget(rel)
+        if on_remove is not None:
+            on_remove(item)
+        n = remove_outputs(out_dir, item["outputs"])
+        log(f"removed {rel} ({n} outputs)")
+    stats = {"processed": 0, "failed": 0, "removed": len(removed), "waiting": len(waiting), "broken": False}
+    if on_remove is not None:
+        for rel, *_ in todo:
+            if rel in manifest.items:
+                on_remove(manifest.items[rel])
+    # everything else shares the pool; suspects then run one at a time, so a dead worker names its input
+    rounds = [[t for t in todo if t[0] not in manifest.suspects]]
+    rounds += [[t] for t in todo if t[0] in manifest.suspects]
+    futs = {}
+    try:
+        for jobs in rounds:
+            if stats["broken"]:
+                break
+            futs = {}
+            for t in jobs:
+                try:
+                    futs[pool.submit(worker, str(manifest.input_dir / t[0]), str(item_dir(out_dir, t[0])))] = t
+                except BrokenProcessPool:
+                    # the rest are not recorded and come back in the next pass, on a new pool
+                    stats["broken"] = True
+                    break
+            for fut in as_completed(futs):
+                rel, mtime_ns, size, digest = futs[fut]
+                try:
+                    rec = fut.result()
+                except (BrokenProcessPool, CancelledError) as e:
+                    stats["broken"] = True
+                    if rel not in manifest.suspects:
+                        manifest.suspects.add(rel)
+                        log(f"lost  {rel} with a dead worker process; retried alone in the next pass")
+                        continue
+                    rec = {"status": "error", "outputs": [],
+                           "error": f"worker process died on this input ({type(e).__name__})"}
+                manifest.suspects.discard(rel)
+                if on_record is not None:
+                    on_record(rec)
+                stale = manifest.record(rel, mtime_ns, size, digest, phash, rec, out_dir)
+                remove_outputs(out_dir, stale)
+                stats["processed"] += 1
+                stats["failed"] += rec["status"] != "ok"
+                took = f"{rec['seconds']}s" if rec.get("seconds") is not None else rec.get("error")
+                log(f"[{stats['processed']}/{len(todo)}] {rec['status']:5s} {rel} ({took})")
+                manifest.save(every=save_every)
+    finally:
+        # also on Ctrl-C: everything finished so far is kept for the restart
+        for fut in futs:
+            fut.cancel()
+        manifest.save()
+    return stats
+
+
+def watch(input_dir, pattern, out_dir, worker, params, workers=1, initializer=None, initargs=(),
+          interval=WATCH_DEFAULTS["interval"], settle=WATCH_DEFAULTS["settle"], save_every=WATCH_DEFAULTS["save_every"],
+          once=False, manifest_path=None, on_record=None, on_remove=None, on_pass=None, log=print):
+    """Keep out_dir in sync with input_dir (see the module docstring) until interrupted, or for one pass.
+
+    params: everything that changes the outputs (inputs processed under other params are redone).
+    on_pass(stats) runs after every pass that changed something. Returns the manifest; raises
+    ValueError if the manifest can't be used. SIGTERM (service managers) stops it like Ctrl-C,
+    with KeyboardInterrupt after the manifest is saved.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest = WatchManifest.open(manifest_path or out_dir / MANIFEST_NAME, input_dir)
+    phash = params_hash(params)
+    previous = None
+    if threading.current_thread() is threading.main_thread():
+        previous = signal.signal(signal.SIGTERM, _interrupt)
+    try:
+        return _watch_loop(manifest, pattern, out_dir, worker, phash, workers, initializer, initargs, interval,
+                           settle, save_every, once, on_record, on_remove, on_pass, log)
+    finally:
+        if previous is not None:
+            signal.signal(signal.SIGTERM, previous)
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def _worker_init(initializer, initargs):
+    # forked workers inherit _interrupt: a SIGTERM would only raise inside the running job
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def _watch_loop(manifest, pattern, out_dir, worker, phash, workers, initializer, initargs, interval, settle,
+                save_every, once, on_record, on_remove, on_pass, log):
+    def new_pool():
+        return ProcessPoolExecutor(max_workers=workers, initializer=_worker_init, initargs=(initializer, initargs))
+
+    pool = new_pool()
+    try:
+        while True:
+            t0 = time.perf_counter()
+            stats = sync_once(manifest, pattern, out_dir, worker, phash, pool, settle, save_every,
+                              on_record, on_remove, log)
+            if stats["processed"] or stats["removed"]:
+                if on_pass is not None:
+                    on_pass(stats)
+                s = manifest.summary()
+                log(f"pass: {stats['processed']} processed ({stats['failed']} failed), {stats['removed']} removed "
+                    f"in {time.perf_counter() - t0:.2f}s; {s['inputs']} inputs tracked, {s['failed']} failed")
+            if once:
+                if stats["waiting"]:
+                    log(f"{stats['waiting']} inputs modified in the last {settle}s were left for the next pass")
+                return manifest
+            if stats["broken"]:
+                log("a worker process died; restarting the pool")
+                pool.shutdown()
+                pool = new_pool()
+            time.sleep(interval)
+    finally:
+        pool.shutdown()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Summarise a watch manifest")
+    ap.add_argument("manifest", help="watch_manifest.json of a --watch output folder")
+    ap.add_argument("--failed", action="store_true", help="list the failed inputs with their errors")
+    args = ap.parse_args()
+    data = json.loads(Path(args.manifest).read_text(encoding="utf-8"))
+    manifest = WatchManifest(args.manifest, data["input_dir"], data["items"])
+    s = manifest.summary()
+    print(f"{data['input_dir']}: {s['inputs']} inputs, {s['ok']} ok, {s['failed']} failed, "
+          f"{sum(len(i['outputs']) for i in manifest.items.values())} outputs")
+    if args.failed:
+        for rel, item in sorted(manifest.items.items()):
+            if item["status"] != "ok":
+                print(f"  {rel}: {item.get('error')}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())